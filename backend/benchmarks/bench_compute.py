@@ -0,0 +1,165 @@
+"""Per-call overhead of the volatility compute path: NumPy core vs. pandas.
+
+Runs ``calculate_volatility`` on synthetic series of several lengths with
+the data source stubbed out (a second synthetic series stands in for the
+beta benchmark), next to the original DataFrame-based formulation, checks
+that both produce identical payloads, and prints the mean time per call.
+
+    cd backend && python benchmarks/bench_compute.py [--repeat 200]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import beta  # noqa: E402
+from volatility import calculate_volatility, TRADING_DAYS_PER_YEAR  # noqa: E402
+
+SIZES = [300, 1260, 2520, 10080]
+
+
+def make_prices(days: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=datetime.now(), periods=days)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    return pd.DataFrame({
+        'open': prices * (1 + rng.uniform(-0.01, 0.01, days)),
+        'high': prices * (1 + rng.uniform(0, 0.02, days)),
+        'low': prices * (1 - rng.uniform(0, 0.02, days)),
+        'close': prices,
+        'adj_close': prices,
+        'volume': rng.integers(1_000_000, 10_000_000, days),
+    }, index=dates)
+
+
+def pandas_reference(df: pd.DataFrame, ticker: str, market: pd.DataFrame) -> dict:
+    """The original DataFrame-based implementation, kept for comparison.
+
+    Betas and correlations against ``market`` use pandas' rolling cov,
+    var and corr.
+    """
+    df = df.copy()
+    df['log_return'] = np.log(df['adj_close'] / df['adj_close'].shift(1))
+    market_return = np.log(market['adj_close'] / market['adj_close'].shift(1)).reindex(df.index)
+    for window in (30, 90):
+        rolling = df['log_return'].rolling(window=window)
+        df[f'beta_{window}d'] = rolling.cov(market_return) / market_return.rolling(window=window).var()
+        df[f'correlation_{window}d'] = rolling.corr(market_return)
+    df['vol_30d'] = df['log_return'].rolling(window=30).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    df['vol_90d'] = df['log_return'].rolling(window=90).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    df = df.dropna(subset=['vol_30d', 'vol_90d'])
+
+    def bucket(value, p50, p90, p99):
+        if value < p50:
+            return "<p50"
+        elif value < p90:
+            return "p50-p90"
+        elif value < p99:
+            return "p90-p99"
+        return ">p99"
+
+    def rsi(period=14):
+        delta = df['adj_close'].diff()
+        gain = delta.where(delta > 0, 0.0)
+        loss = (-delta).where(delta < 0, 0.0)
+        avg_gain = gain.iloc[1:period + 1].mean()
+        avg_loss = loss.iloc[1:period + 1].mean()
+        for i in range(period + 1, len(delta)):
+            avg_gain = (avg_gain * (period - 1) + gain.iloc[i]) / period
+            avg_loss = (avg_loss * (period - 1) + loss.iloc[i]) / period
+        if avg_loss == 0:
+            return 100.0
+        return round(100.0 - (100.0 / (1.0 + avg_gain / avg_loss)), 2)
+
+    def returns():
+        price = df['adj_close'].iloc[-1]
+        out = {}
+        for key, offset in (('daily', 2), ('week', 6), ('month', 22)):
+            base = df['adj_close'].iloc[-offset] if len(df) >= offset else None
+            out[key] = round((price - base) / base, 6) if base is not None else None
+        ytd_df = df[df.index.year == datetime.now().year]
+        base = ytd_df['adj_close'].iloc[0] if len(ytd_df) else None
+        out['ytd'] = round((price - base) / base, 6) if base is not None else None
+        return out
+
+    beta_keys = ('beta_30d', 'beta_90d', 'correlation_30d', 'correlation_90d')
+    cur30, cur90 = df['vol_30d'].iloc[-1], df['vol_90d'].iloc[-1]
+    q30 = [df['vol_30d'].quantile(q) for q in (0.5, 0.9, 0.99)]
+    q90 = [df['vol_90d'].quantile(q) for q in (0.5, 0.9, 0.99)]
+    return {
+        "ticker": ticker.upper(),
+        "current_price": round(df['close'].iloc[-1], 2),
+        "daily_open": round(df['open'].iloc[-1], 2),
+        "daily_high": round(df['high'].iloc[-1], 2),
+        "daily_low": round(df['low'].iloc[-1], 2),
+        "monthly_high": round(df.tail(21)['high'].max(), 2),
+        "monthly_low": round(df.tail(21)['low'].min(), 2),
+        "yearly_high": round(df.tail(252)['high'].max(), 2),
+        "yearly_low": round(df.tail(252)['low'].min(), 2),
+        "vol_30d": round(cur30, 4),
+        "vol_90d": round(cur90, 4),
+        "vol_30d_percentile": round((df['vol_30d'] <= cur30).mean() * 100, 1),
+        "vol_90d_percentile": round((df['vol_90d'] <= cur90).mean() * 100, 1),
+        "vol_30d_bucket": bucket(cur30, *q30),
+        "vol_90d_bucket": bucket(cur90, *q90),
+        "percentile_thresholds": {
+            "30d": dict(zip(('p50', 'p90', 'p99'), (round(q, 4) for q in q30))),
+            "90d": dict(zip(('p50', 'p90', 'p99'), (round(q, 4) for q in q90))),
+        },
+        "returns": returns(),
+        "rsi_14d": rsi(),
+        "benchmark": beta.BENCHMARK_TICKER,
+        **{key: round(df[key].iloc[-1], 4) for key in beta_keys},
+        "history": [
+            {"date": idx.strftime('%Y-%m-%d'), "vol_30d": round(row['vol_30d'], 4),
+             "vol_90d": round(row['vol_90d'], 4),
+             # Expanding percentile rank, one full comparison per row
+             "vol_30d_percentile": round((df['vol_30d'].loc[:idx] <= row['vol_30d']).mean() * 100, 1),
+             "vol_90d_percentile": round((df['vol_90d'].loc[:idx] <= row['vol_90d']).mean() * 100, 1),
+             **{key: round(row[key], 4) for key in beta_keys}}
+            for idx, row in df.tail(252).iterrows()
+        ],
+        "stale": False,
+        "data_as_of": df.index[-1].strftime('%Y-%m-%d'),
+    }
+
+
+def time_per_call(fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'rows':>7} {'numpy core':>12} {'pandas':>12} {'speedup':>8}")
+    for days in SIZES:
+        df, market = make_prices(days), make_prices(days, seed=7)
+        # The cached benchmark is keyed by lookback, not series length
+        beta.clear_cache()
+        frames = lambda ticker, *args, **kwargs: market if ticker == beta.BENCHMARK_TICKER else df
+        with patch('volatility.fetch_and_cache', side_effect=frames):
+            core = calculate_volatility('BENCH')
+            core_s = time_per_call(lambda: calculate_volatility('BENCH'), args.repeat)
+        if core != pandas_reference(df, 'BENCH', market):
+            print(f"payload mismatch at {days} rows", file=sys.stderr)
+            return 1
+        ref_s = time_per_call(lambda: pandas_reference(df, 'BENCH', market), args.repeat)
+        print(f"{days:>7} {core_s * 1e3:>10.3f}ms {ref_s * 1e3:>10.3f}ms {ref_s / core_s:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Intraday storage: per-session array blocks vs. one row per bar.
+
+Ingests years of synthetic 1-minute bars for a few tickers into a
+throwaway database through ``intraday.ingest``, and the same bars into a
+row-per-bar table shaped like ``daily_prices``. Then times a one-year bar
+range query and a realized-variance series for each layout and prints
+the file size each one needs.
+
+    cd backend && python benchmarks/bench_intraday.py [--years 2] [--tickers 3]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import intraday  # noqa: E402
+from db import init_db  # noqa: E402
+
+
+def synthetic_minutes(years: int, seed: int):
+    rng = np.random.default_rng(seed)
+    end = date(2024, 12, 31)
+    days = [end - timedelta(days=i) for i in range(years * 365)][::-1]
+    days = [d for d in days if d.weekday() < 5]
+    opens = np.array([datetime(d.year, d.month, d.day, 14, 30, tzinfo=timezone.utc).timestamp() for d in days])
+    ts = (opens[:, None] + np.arange(390) * 60).ravel()
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0008, len(ts))))
+    return ts, close * 0.9995, close * 1.0005, close * 0.999, close, rng.integers(100, 10_000, len(ts)).astype(float)
+
+
+def timed(fn, repeat=5):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--tickers', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blocks_db = Path(tmp) / 'blocks.db'
+        rows_db = Path(tmp) / 'rows.db'
+        series = {f"T{i}": synthetic_minutes(args.years, i) for i in range(args.tickers)}
+        bars = sum(len(s[0]) for s in series.values())
+
+        with patch('db.DB_PATH', blocks_db):
+            init_db()
+            started = time.perf_counter()
+            for ticker, cols in series.items():
+                intraday.ingest(ticker, '1m', *cols, through=date(2024, 12, 31))
+            block_ingest = time.perf_counter() - started
+
+            block_bars, result = timed(lambda: intraday.get_bars('T0', '1m', '2024-01-01', '2024-12-31'))
+            year_bars = len(result['ts'])
+            block_rv, _ = timed(lambda: intraday.get_realized_variance('T0', '1m', '2024-01-01', '2024-12-31'))
+
+        conn = sqlite3.connect(rows_db)
+        conn.execute("""
+            CREATE TABLE intraday_rows (
+                ticker TEXT NOT NULL, interval TEXT NOT NULL, ts INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume INTEGER,
+                PRIMARY KEY (ticker, interval, ts)
+            )
+        """)
+        started = time.perf_counter()
+        for ticker, (ts, o, h, low, c, v) in series.items():
+            conn.executemany(
+                "INSERT INTO intraday_rows VALUES (?, '1m', ?, ?, ?, ?, ?, ?)",
+                zip([ticker] * len(ts), ts.astype(np.int64).tolist(), o.tolist(), h.tolist(),
+                    low.tolist(), c.tolist(), v.astype(np.int64).tolist()),
+            )
+        conn.commit()
+        row_ingest = time.perf_counter() - started
+
+        lo = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+        hi = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+
+        def row_bars():
+            rows = conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM intraday_rows "
+                "WHERE ticker = 'T0' AND interval = '1m' AND ts >= ? AND ts < ? ORDER BY ts", (lo, hi),
+            ).fetchall()
+            return np.array(rows, dtype=np.float64)
+
+        def row_rv():
+            data = row_bars()
+            days = intraday.session_days(data[:, 0])
+            _, starts = np.unique(days, return_index=True)
+            return [intraday.realized_variance(c) for c in np.split(data[:, 4], starts[1:])]
+
+        row_bars_s, _ = timed(row_bars)
+        row_rv_s, _ = timed(row_rv)
+        conn.close()
+
+        print(f"{bars:,} one-minute bars across {args.tickers} tickers; queries cover {year_bars:,} bars")
+        print(f"{'layout':<8} {'ingest bars/s':>14} {'1y bars':>10} {'1y RV':>10} {'size MB':>9}")
+        for name, ingest_s, bars_s, rv_s, path in (
+            ('blocks', block_ingest, block_bars, block_rv, blocks_db),
+            ('rows', row_ingest, row_bars_s, row_rv_s, rows_db),
+        ):
+            size = os.path.getsize(path) + (os.path.getsize(f"{path}-wal") if os.path.exists(f"{path}-wal") else 0)
+            print(f"{name:<8} {bars / ingest_s:>14,.0f} {bars_s * 1e3:>8.1f}ms {rv_s * 1e3:>8.2f}ms {size / 1e6:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Per-fetch latency with and without keep-alive session pooling.
+
+Fetches a few years of daily bars from a local stub of the chart API,
+once through a fresh connection per request (``requests.get``) and once
+through the shared pooled session, sequentially and from several threads.
+The stub adds no TLS, so real-world savings against Yahoo are larger.
+
+    cd backend && python benchmarks/bench_pooling.py [--fetches 200] [--threads 8]
+"""
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import upstream  # noqa: E402
+from stub_yahoo import StubYahoo  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fetches', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help="Stub server delay per request (s)")
+    args = parser.parse_args()
+
+    stub = StubYahoo(latency=args.latency).start()
+    end = datetime.now()
+    params = {
+        'period1': int((end - timedelta(days=3 * 365)).timestamp()),
+        'period2': int(end.timestamp()),
+        'interval': '1d',
+    }
+    url = f"{stub.chart_url}/BENCH"
+
+    def unpooled():
+        requests.get(url, params=params, timeout=10).json()
+
+    def pooled():
+        upstream.get_session().get(url, params=params, timeout=10).json()
+
+    def measure(fetch, threads):
+        stub.connections = 0
+        latencies = []
+
+        def timed(_):
+            started = time.perf_counter()
+            fetch()
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(timed, range(args.fetches)))
+        wall = time.perf_counter() - started
+        return statistics.median(latencies), wall, stub.connections
+
+    print(f"{'mode':<10} {'threads':>7} {'p50/fetch':>10} {'fetches/s':>10} {'connections':>12}")
+    try:
+        for threads in (1, args.threads):
+            for name, fetch in (('unpooled', unpooled), ('pooled', pooled)):
+                p50, wall, connections = measure(fetch, threads)
+                print(f"{name:<10} {threads:>7} {p50 * 1e3:>8.2f}ms {args.fetches / wall:>10.0f} {connections:>12}")
+    finally:
+        upstream.close_session()
+        stub.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
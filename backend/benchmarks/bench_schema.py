@@ -0,0 +1,120 @@
+"""Daily bar storage: compact ``prices`` layout vs. the legacy ``daily_prices`` table.
+
+Fills a legacy-layout database with synthetic daily bars, then copies it
+and moves the copy to the compact layout with ``price_store.migrate_batch``,
+as a running app would. Prints each file's size after ``VACUUM``, how long
+the migration took, and the time to read one ticker's one-year window and
+full history into a DataFrame: the legacy read is the old
+``read_sql_query`` + ``to_datetime`` path, the compact one goes through
+``cache`` with day numbers.
+
+    cd backend && python benchmarks/bench_schema.py [--tickers 500] [--years 20]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cache  # noqa: E402
+import price_store  # noqa: E402
+from db import MIGRATIONS, init_db  # noqa: E402
+
+
+def timed(fn, repeat=20):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def fill_legacy(path: Path, tickers: int, years: int) -> int:
+    days = pd.bdate_range(end='2024-12-31', periods=years * 252).strftime('%Y-%m-%d').tolist()
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(path)
+    conn.execute(MIGRATIONS[0][0])
+    for i in range(tickers):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        volume = rng.integers(10_000, 10_000_000, len(days))
+        conn.executemany(
+            "INSERT INTO daily_prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            zip([f"T{i:04d}"] * len(days), days, (close * 0.999).tolist(), (close * 1.01).tolist(),
+                (close * 0.99).tolist(), close.tolist(), close.tolist(), volume.tolist()),
+        )
+    conn.commit()
+    conn.close()
+    return tickers * len(days)
+
+
+def vacuumed_size(path: Path) -> int:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--years', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = Path(tmp) / 'legacy.db'
+        compact_db = Path(tmp) / 'compact.db'
+        rows = fill_legacy(legacy_db, args.tickers, args.years)
+        shutil.copy(legacy_db, compact_db)
+
+        with patch('db.DB_PATH', compact_db):
+            init_db()
+            started = time.perf_counter()
+            while price_store.migrate_batch():
+                pass
+            migration = time.perf_counter() - started
+
+        conn = sqlite3.connect(legacy_db)
+
+        def legacy_read(start, end):
+            df = pd.read_sql_query("""
+                SELECT date, open, high, low, close, adj_close, volume FROM daily_prices
+                WHERE ticker = ? AND date >= ? AND date <= ? ORDER BY date
+            """, conn, params=('T0123', start, end))
+            df['date'] = pd.to_datetime(df['date'])
+            return df.set_index('date')
+
+        def compact_read(start, end):
+            rows = cache._read_rows('T0123', price_store.day_number(start), price_store.day_number(end))
+            return cache._frame_from_series(cache._series_from_rows(rows), start, end)
+
+        results = {}
+        for name, read, db_path in (('legacy', legacy_read, legacy_db), ('compact', compact_read, compact_db)):
+            with patch('db.DB_PATH', db_path):
+                year, df = timed(lambda: read('2024-01-01', '2024-12-31'))
+                full, _ = timed(lambda: read('1900-01-01', '2100-01-01'))
+            results[name] = (year, full, len(df))
+        conn.close()
+
+        sizes = {'legacy': vacuumed_size(legacy_db), 'compact': vacuumed_size(compact_db)}
+        print(f"{rows:,} daily bars across {args.tickers} tickers; migrated in {migration:.2f}s "
+              f"({rows / migration:,.0f} rows/s)")
+        print(f"{'layout':<8} {'size MB':>9} {'bytes/bar':>10} {'1y read':>10} {'full read':>10}")
+        for name in ('legacy', 'compact'):
+            year, full, _ = results[name]
+            print(f"{name:<8} {sizes[name] / 1e6:>9.1f} {sizes[name] / rows:>10.1f} "
+                  f"{year * 1e3:>8.2f}ms {full * 1e3:>8.2f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
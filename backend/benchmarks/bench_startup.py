@@ -0,0 +1,97 @@
+"""Startup-time benchmark: import, lifespan and first-request latency.
+
+Each run starts a fresh interpreter against a throwaway database seeded
+with the ticker and the beta benchmark, and measures, in order:
+``import main``, the lifespan startup (schema migration), the first
+``/api/health`` request, the first ``/api/volatility`` request (which pays
+the lazy pandas/numpy import) and a second, warm one. Medians over the
+runs are printed.
+
+    cd backend && python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+TICKER = 'BENCH'
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+import httpx
+
+async def run():
+    timings = {'import_main': imported - started}
+    t = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        timings['lifespan_startup'] = time.perf_counter() - t
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for name, url in (('first_health', '/api/health'),
+                              ('first_volatility', '/api/volatility/%s'),
+                              ('warm_volatility', '/api/volatility/%s')):
+                t = time.perf_counter()
+                response = await client.get(url)
+                timings[name] = time.perf_counter() - t
+                assert response.status_code == 200, response.text
+    return timings
+
+print(json.dumps(asyncio.run(run())))
+""" % (TICKER, TICKER)
+
+
+def seed(db_path: Path):
+    import numpy as np
+    import pandas as pd
+
+    with patch('db.DB_PATH', db_path):
+        from cache import init_db, save_to_cache
+        from beta import BENCHMARK_TICKER
+        init_db()
+        dates = pd.bdate_range(end=pd.Timestamp.now(), periods=1260)
+        # Seed the beta benchmark too, so no request goes upstream
+        for rng_seed, ticker in enumerate((TICKER, BENCHMARK_TICKER), start=1):
+            prices = 100 * np.exp(np.cumsum(np.random.default_rng(rng_seed).normal(0, 0.02, len(dates))))
+            save_to_cache(ticker, pd.DataFrame({
+                'open': prices, 'high': prices * 1.01, 'low': prices * 0.99,
+                'close': prices, 'adj_close': prices, 'volume': 1_000_000,
+            }, index=dates))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'price_cache.db'
+        seed(db_path)
+        env = dict(os.environ, PRICE_CACHE_DB=str(db_path), PYTHONWARNINGS='ignore')
+
+        runs = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND, env=env,
+                                 capture_output=True, text=True, check=True)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'phase':<18} {'median':>10} {'min':>10}")
+    for phase in runs[0]:
+        values = [run[phase] * 1e3 for run in runs]
+        print(f"{phase:<18} {statistics.median(values):>8.1f}ms {min(values):>8.1f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Load test for the volatility API against a local stub data source.
+
+Starts the app under uvicorn (in-process, on a throwaway database) with
+``stub_yahoo`` standing in for Yahoo, then drives it from closed-loop
+client threads for a fixed duration. The traffic mix is configurable:
+
+* ticker popularity follows a Zipf distribution over ``--tickers``
+  symbols (``--skew 0`` is uniform), optionally with a share of unknown
+  symbols (``--missing-fraction``),
+* ``lookback_years`` is drawn from ``--lookbacks`` (``years:weight,...``),
+* a ``--batch-fraction`` of requests hit the multi-ticker endpoint with
+  ``--batch-size`` tickers each,
+* ``--cache cold`` starts empty; ``warm`` pre-fetches every ticker first.
+
+Request streams are seeded, so runs with the same arguments issue the same
+requests. Throughput, p50/p90/p99 latency, error rates and the server's
+``/api/metrics`` counters are printed and, with ``--output``, written as a
+JSON report for comparing runs.
+
+    cd backend && python benchmarks/loadtest.py --duration 20 --concurrency 16 \\
+        --tickers 500 --skew 1.1 --batch-fraction 0.1 --output report.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import requests
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_yahoo import StubYahoo  # noqa: E402
+
+
+def parse_mix(spec: str) -> tuple:
+    """Parse ``"1:0.2,5:0.6"`` into (values, probabilities)."""
+    values, weights = [], []
+    for part in spec.split(','):
+        value, _, weight = part.partition(':')
+        values.append(int(value))
+        weights.append(float(weight or 1))
+    weights = np.array(weights)
+    return values, weights / weights.sum()
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples: list, wall: float) -> dict:
+    if not samples:
+        return {'requests': 0}
+    latencies = np.array([s[2] for s in samples]) * 1e3
+    statuses = Counter(s[1] for s in samples)
+    errors = sum(n for status, n in statuses.items() if status != 200)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / wall, 2),
+        'latency_ms': {
+            'mean': round(float(latencies.mean()), 3),
+            'p50': round(float(p50), 3),
+            'p90': round(float(p90), 3),
+            'p99': round(float(p99), 3),
+            'max': round(float(latencies.max()), 3),
+        },
+        'error_rate': round(errors / len(samples), 6),
+        'status_counts': {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20.0, help="Measured seconds")
+    parser.add_argument('--concurrency', type=int, default=16, help="Client threads")
+    parser.add_argument('--tickers', type=int, default=200, help="Ticker universe size")
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for popularity (0 = uniform)")
+    parser.add_argument('--missing-fraction', type=float, default=0.0, help="Share of unknown tickers")
+    parser.add_argument('--lookbacks', default='1:0.2,5:0.6,10:0.2', help="lookback_years mix, years:weight")
+    parser.add_argument('--batch-fraction', type=float, default=0.0, help="Share of batch requests")
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--cache', choices=('cold', 'warm'), default='warm')
+    parser.add_argument('--stub-latency', type=float, default=0.05, help="Stub upstream delay per request (s)")
+    parser.add_argument('--upstream-rate', type=float, default=0.0, help="UPSTREAM_RATE_PER_SEC for the app")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    stub = StubYahoo(latency=args.stub_latency).start()
+    workdir = tempfile.TemporaryDirectory()
+    # The app reads its settings at import time
+    os.environ.update({
+        'PRICE_CACHE_DB': str(Path(workdir.name) / 'loadtest.db'),
+        'YAHOO_CHART_URL': stub.chart_url,
+        'UPSTREAM_RATE_PER_SEC': str(args.upstream_rate),
+        'UPSTREAM_MAX_CONCURRENCY': str(max(args.concurrency, 4)),
+        'UPSTREAM_POOL_SIZE': str(max(args.concurrency, 10)),
+        'CACHE_MAINTENANCE_INTERVAL': '0',
+    })
+    import uvicorn
+    import main as app_module
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host='127.0.0.1', port=port, log_level='warning'))
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port}"
+
+    tickers = [f"LT{i:04d}" for i in range(args.tickers)]
+    popularity = zipf_weights(args.tickers, args.skew)
+    lookbacks, lookback_p = parse_mix(args.lookbacks)
+
+    try:
+        if args.cache == 'warm':
+            session = requests.Session()
+            for i in range(0, len(tickers), app_module.MAX_BATCH_TICKERS):
+                chunk = tickers[i:i + app_module.MAX_BATCH_TICKERS]
+                session.get(f"{base_url}/api/volatility",
+                            params={'tickers': ','.join(chunk), 'lookback_years': max(lookbacks)},
+                            timeout=600).raise_for_status()
+            session.close()
+        stub_requests_before = stub.requests
+
+        samples = []
+        samples_lock = threading.Lock()
+        deadline = time.perf_counter() + args.duration
+        streams = np.random.SeedSequence(args.seed).spawn(args.concurrency)
+
+        def pick_ticker(rng):
+            if args.missing_fraction and rng.random() < args.missing_fraction:
+                return f"MISSING{rng.integers(args.tickers):04d}"
+            return tickers[rng.choice(args.tickers, p=popularity)]
+
+        def worker(seed_seq):
+            rng = np.random.default_rng(seed_seq)
+            session = requests.Session()
+            local = []
+            while time.perf_counter() < deadline:
+                lookback = lookbacks[rng.choice(len(lookbacks), p=lookback_p)]
+                if args.batch_fraction and rng.random() < args.batch_fraction:
+                    kind = 'batch'
+                    batch = {pick_ticker(rng) for _ in range(args.batch_size)}
+                    url = f"{base_url}/api/volatility"
+                    params = {'tickers': ','.join(sorted(batch)), 'lookback_years': lookback}
+                else:
+                    kind = 'single'
+                    url = f"{base_url}/api/volatility/{pick_ticker(rng)}"
+                    params = {'lookback_years': lookback}
+                started = time.perf_counter()
+                try:
+                    response = session.get(url, params=params, timeout=60)
+                    status = response.status_code
+                    if kind == 'batch' and status == 200 and response.json()['errors']:
+                        status = 'partial'
+                except requests.RequestException:
+                    status = 'connection_error'
+                local.append((kind, status, time.perf_counter() - started))
+            session.close()
+            with samples_lock:
+                samples.extend(local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(s,)) for s in streams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        server_metrics = requests.get(f"{base_url}/api/metrics", timeout=10).json()
+        report = {
+            'config': {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'commit': git_commit(),
+            },
+            'wall_seconds': round(wall, 3),
+            'overall': summarize(samples, wall),
+            'by_kind': {
+                kind: summarize([s for s in samples if s[0] == kind], wall)
+                for kind in ('single', 'batch') if any(s[0] == kind for s in samples)
+            },
+            'upstream_requests': stub.requests - stub_requests_before,
+            'server_counters': server_metrics.get('counters', {}),
+        }
+    finally:
+        server.should_exit = True
+        server_thread.join(timeout=10)
+        stub.stop()
+        workdir.cleanup()
+
+    print(f"{'kind':<8} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for kind, summary in [('overall', report['overall'])] + list(report['by_kind'].items()):
+        if not summary['requests']:
+            continue
+        latency = summary['latency_ms']
+        print(f"{kind:<8} {summary['requests']:>9} {summary['throughput_rps']:>9.1f} "
+              f"{latency['p50']:>9.2f} {latency['p90']:>9.2f} {latency['p99']:>9.2f} "
+              f"{summary['error_rate']:>8.2%}")
+    print(f"upstream requests during run: {report['upstream_requests']}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Local stand-in for the Yahoo chart API, for benchmarks and load tests.
+
+Serves ``/v8/finance/chart/{ticker}`` with a deterministic synthetic daily
+series per ticker over HTTP/1.1 keep-alive, optionally gzip-encoded, and
+counts the TCP connections it accepts. Tickers starting with ``MISSING``
+return Yahoo's empty-result payload.
+
+    server = StubYahoo(latency=0.002).start()
+    os.environ['YAHOO_CHART_URL'] = server.chart_url
+"""
+import gzip
+import json
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60}
+DAILY_ORIGIN = '2000-01-03'
+
+
+def chart_payload(ticker: str, period1: int, period2: int, interval: str = '1d') -> dict:
+    if ticker.startswith('MISSING'):
+        return {'chart': {'result': None, 'error': {'code': 'Not Found'}}}
+
+    start = datetime.fromtimestamp(period1, tz=timezone.utc).date()
+    end = datetime.fromtimestamp(period2, tz=timezone.utc).date()
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    days = [d for d in days if d.weekday() < 5]
+    opens = [int(datetime(d.year, d.month, d.day, 14, 30, tzinfo=timezone.utc).timestamp()) for d in days]
+    if interval in INTRADAY_MINUTES:
+        # A 6.5 hour session of bars per weekday, within the requested period
+        step = INTRADAY_MINUTES[interval] * 60
+        timestamps = [t + i for t in opens for i in range(0, 390 * 60, step)]
+        timestamps = [t for t in timestamps if period1 <= t < period2]
+        scale = 0.015 / np.sqrt(390 // INTRADAY_MINUTES[interval])
+    else:
+        timestamps = opens
+        scale = 0.015
+    n = len(timestamps)
+
+    if interval in INTRADAY_MINUTES:
+        rng = np.random.default_rng(zlib.crc32(f"{ticker}:{interval}:{period1}".encode()))
+        close = (100 * np.exp(np.cumsum(rng.normal(0, scale, n)))).round(4)
+    else:
+        # One walk per ticker from a fixed origin, so overlapping fetches agree
+        rng = np.random.default_rng(zlib.crc32(f"{ticker}:{interval}".encode()))
+        offset = int(np.busday_count(DAILY_ORIGIN, start)) if days else 0
+        walk = np.cumsum(rng.normal(0, scale, offset + n))[offset:]
+        close = (100 * np.exp(walk)).round(4)
+    quote = {
+        'open': (close * (1 + rng.uniform(-0.005, 0.005, n))).round(4).tolist(),
+        'high': (close * 1.01).round(4).tolist(),
+        'low': (close * 0.99).round(4).tolist(),
+        'close': close.tolist(),
+        'volume': rng.integers(1_000_000, 5_000_000, n).tolist(),
+    }
+    return {'chart': {'result': [{
+        'meta': {'symbol': ticker, 'exchangeTimezoneName': 'America/New_York'},
+        'timestamp': timestamps,
+        'indicators': {'quote': [quote], 'adjclose': [{'adjclose': close.tolist()}]},
+    }], 'error': None}}
+
+
+class StubYahoo:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        stub = self
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; without this,
+                # Nagle plus delayed ACK stalls every keep-alive response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                url = urlparse(self.path)
+                if not url.path.startswith('/v8/finance/chart/'):
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                ticker = url.path.rsplit('/', 1)[-1].upper()
+                body = json.dumps(chart_payload(
+                    ticker, int(query['period1'][0]), int(query['period2'][0]),
+                    query.get('interval', ['1d'])[0],
+                )).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def chart_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v8/finance/chart"
+
+    def start(self) -> 'StubYahoo':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
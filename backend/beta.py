@@ -0,0 +1,165 @@
+"""Rolling beta and correlation against a benchmark index.
+
+For each 30d and 90d window,
+
+    beta        = cov(r, r_m) / var(r_m)
+    correlation = cov(r, r_m) / (std(r) * std(r_m))
+
+where r_m are the benchmark's daily log returns. Everything that depends
+only on the benchmark is built once per session and shared by every
+ticker: its returns, the rolling variances and each window's returns
+minus their mean. Because those deviations sum to zero, the covariance
+with a ticker is a single product-sum per window (``compute.rolling_covariance``),
+and the ticker's own rolling std is already known from its vol series.
+
+Tickers are lined up on the benchmark's dates. A ticker return only
+counts when it spans the same two sessions as the benchmark's, so a
+missing bar on either side blanks the windows that contain it rather
+than comparing returns over different periods.
+
+Benchmarks are kept in a small in-process LRU keyed by the benchmark
+ticker, the lookback and the last completed session, like portfolio
+universes. Ones built from stale bars aren't kept. A miss is built by
+one thread per key; concurrent requests for the same key (say, every
+ticker of a batch after the session rolls over) wait for it and share
+the result.
+
+Settings come from the environment:
+
+    BENCHMARK_TICKER  index that betas are measured against
+"""
+import os
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import compute
+import metrics
+import trading_calendar
+
+BENCHMARK_TICKER = os.environ.get("BENCHMARK_TICKER", "SPY").upper()
+WINDOWS = (30, 90)
+CACHE_SIZE = 8
+
+
+class Benchmark(NamedTuple):
+    ticker: str
+    dates: np.ndarray                   # datetime64[D], one per bar
+    returns: np.ndarray                 # daily log returns, NaN for the first bar
+    deviations: Dict[int, np.ndarray]   # window -> compute.window_deviations of returns
+    variances: Dict[int, np.ndarray]    # window -> rolling sample variance per bar
+
+
+_lock = threading.Lock()
+_benchmarks: Dict[tuple, Benchmark] = {}
+# key -> lock held while that key's benchmark is being built
+_building: Dict[tuple, threading.Lock] = {}
+
+
+def clear_cache() -> None:
+    with _lock:
+        _benchmarks.clear()
+
+
+def invalidate(ticker: str) -> None:
+    """Drop cached benchmarks built from ``ticker``."""
+    with _lock:
+        for key in [key for key in _benchmarks if key[0] == ticker]:
+            del _benchmarks[key]
+
+
+def build(ticker: str, dates: np.ndarray, adj_close: np.ndarray) -> Benchmark:
+    returns = compute.log_returns(adj_close)
+    deviations = {window: compute.window_deviations(returns, window) for window in WINDOWS}
+    variances = {window: compute.rolling_covariance(returns, deviations[window], window) for window in WINDOWS}
+    return Benchmark(ticker, dates.astype('datetime64[D]'), returns, deviations, variances)
+
+
+def _cached(key: tuple) -> Optional[Benchmark]:
+    with _lock:
+        benchmark = _benchmarks.pop(key, None)
+        if benchmark is not None:
+            _benchmarks[key] = benchmark
+    return benchmark
+
+
+def get_benchmark(lookback_years: int, load: Callable) -> Benchmark:
+    """Cached ``build`` of the benchmark's latest ``lookback_years`` of bars.
+
+    ``load(ticker, lookback_years)`` returns the benchmark's bars as a
+    DataFrame, flagged ``attrs['stale']`` when they are out of date.
+    """
+    key = (BENCHMARK_TICKER, lookback_years, trading_calendar.last_completed_session())
+    benchmark = _cached(key)
+    if benchmark is not None:
+        metrics.increment('benchmark_cache_hits')
+        return benchmark
+
+    with _lock:
+        building = _building.setdefault(key, threading.Lock())
+    try:
+        with building:
+            # Built by another thread while this one waited
+            benchmark = _cached(key)
+            if benchmark is not None:
+                metrics.increment('benchmark_cache_hits')
+                return benchmark
+
+            metrics.increment('benchmark_cache_misses')
+            df = load(BENCHMARK_TICKER, lookback_years)
+            benchmark = build(BENCHMARK_TICKER, df.index.values, compute.as_float_array(df['adj_close']))
+            if not df.attrs.get('stale', False):
+                with _lock:
+                    _benchmarks[key] = benchmark
+                    while len(_benchmarks) > CACHE_SIZE:
+                        # Dicts keep insertion order, so the first key is least recently used
+                        del _benchmarks[next(iter(_benchmarks))]
+            return benchmark
+    finally:
+        with _lock:
+            if _building.get(key) is building and not building.locked():
+                del _building[key]
+
+
+def rolling_beta(benchmark: Benchmark, dates: np.ndarray, returns: np.ndarray,
+                 stds: Dict[int, np.ndarray]) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Rolling beta and correlation of a ticker's ``returns`` per window.
+
+    ``stds`` holds the ticker's rolling return std per window. Results are
+    aligned with ``dates`` and NaN where the windows don't line up.
+    """
+    dates = dates.astype('datetime64[D]')
+    n = len(dates)
+    empty = {window: (np.full(n, np.nan), np.full(n, np.nan)) for window in WINDOWS}
+    if not n or not len(benchmark.dates):
+        return empty
+    pos = np.minimum(np.searchsorted(benchmark.dates, dates), len(benchmark.dates) - 1)
+    matched = benchmark.dates[pos] == dates
+    if not matched.any():
+        return empty
+    # A return lines up when both bars are consecutive benchmark sessions
+    aligned = matched.copy()
+    aligned[0] = False
+    aligned[1:] &= matched[:-1] & (np.diff(pos) == 1)
+
+    lo, hi = pos[matched][0], pos[matched][-1] + 1
+    grid = np.full(hi - lo, np.nan)
+    grid[pos[aligned] - lo] = returns[aligned]
+
+    result = {}
+    for window in WINDOWS:
+        beta, correlation = empty[window]
+        if hi - lo >= window:
+            # Rows of deviations are offset by window - 1 from bar positions
+            covariance = compute.rolling_covariance(grid, benchmark.deviations[window][lo:hi - window + 1], window)
+            at = pos[matched]
+            cov = covariance[at - lo]
+            variance = benchmark.variances[window][at]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                beta[matched] = cov / variance
+                correlation[matched] = cov / (stds[window][matched] * np.sqrt(variance))
+            beta[~np.isfinite(beta)] = np.nan
+            correlation[~np.isfinite(correlation)] = np.nan
+        result[window] = (beta, correlation)
+    return result
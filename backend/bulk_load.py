@@ -0,0 +1,364 @@
+"""Bulk import/export of OHLCV data for the SQLite price cache.
+
+Seeds the ``prices`` table from local CSV/Parquet dumps without going through
+Yahoo, and dumps the cache back out in the same long format.
+
+    python bulk_load.py import dumps/*.csv --mark-fresh
+    python bulk_load.py import prices.parquet --chunk-size 500000
+    python bulk_load.py export cache.csv --tickers SPY,AAPL
+
+Input files are either one file per ticker (the ticker is taken from
+``--ticker`` or the file name) or one long file with a ``ticker`` column.
+Rows are streamed in chunks into an unindexed staging table, one
+transaction per chunk. Each ticker's staged bars then go through
+``quality.clean`` like fetched ones, and the clean bars are merged into
+``prices`` in primary-key order at the end, so the B-tree is only built
+once. Flags are recorded in ``price_flags`` as on the fetch path.
+"""
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import price_store
+import quality
+import shared_arrays
+from db import get_connection, init_db
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'adj_close', 'volume']
+EXPORT_COLUMNS = ['ticker', 'date'] + PRICE_COLUMNS
+
+COLUMN_ALIASES = {
+    'symbol': 'ticker',
+    'adjclose': 'adj_close',
+    'adj_close_price': 'adj_close',
+    'timestamp': 'date',
+    'datetime': 'date',
+}
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    columns = {}
+    for col in df.columns:
+        name = str(col).strip().lower().replace(' ', '_')
+        columns[col] = COLUMN_ALIASES.get(name, name)
+    return df.rename(columns=columns)
+
+
+def _read_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    suffix = path.suffix.lower()
+    if suffix in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet input requires pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _prepare_rows(df: pd.DataFrame, default_ticker: Optional[str]) -> List[tuple]:
+    """Turn a raw input chunk into tuples in ``EXPORT_COLUMNS`` order."""
+    df = _normalize_columns(df)
+    if 'date' not in df.columns:
+        df = df.reset_index()
+        df = _normalize_columns(df)
+        if 'date' not in df.columns:
+            raise ValueError("Input has no 'date' column")
+    if 'close' not in df.columns:
+        raise ValueError("Input has no 'close' column")
+
+    if 'ticker' in df.columns:
+        tickers = df['ticker'].astype(str).str.upper().to_numpy()
+    elif default_ticker:
+        tickers = np.full(len(df), default_ticker.upper(), dtype=object)
+    else:
+        raise ValueError("Input has no 'ticker' column and no ticker was given")
+    # Symbols name shared array files, so they must pass the API's check too
+    invalid = sorted(t for t in set(tickers.tolist()) if not price_store.valid_ticker(t))
+    if invalid:
+        raise ValueError(f"Invalid ticker symbols: {', '.join(map(repr, invalid[:5]))}")
+
+    dates = pd.to_datetime(df['date'], errors='coerce', utc=True).dt.tz_localize(None)
+    valid = dates.notna().to_numpy()
+    date_strs = dates.to_numpy()[valid].astype('datetime64[D]').astype(str)
+
+    def column(name: str, fallback: Optional[str] = None) -> list:
+        if name in df.columns:
+            values = pd.to_numeric(df[name], errors='coerce')
+        elif fallback is not None:
+            values = pd.to_numeric(df[fallback], errors='coerce')
+        else:
+            values = pd.Series(np.nan, index=df.index)
+        return values.to_numpy(dtype=float)[valid]
+
+    volume = column('volume')
+    volume = np.where(np.isnan(volume), 0, volume).astype(np.int64)
+
+    def as_list(values: np.ndarray) -> list:
+        # NaN -> NULL, matching what save_to_cache stores for missing prices
+        return [None if v != v else v for v in values.tolist()]
+
+    return list(zip(
+        tickers[valid].tolist(),
+        date_strs.tolist(),
+        as_list(column('open')),
+        as_list(column('high')),
+        as_list(column('low')),
+        as_list(column('close')),
+        as_list(column('adj_close', fallback='close')),
+        volume.tolist(),
+    ))
+
+
+def _staged_frames(conn, chunk_size: int) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Each staged ticker's bars as a date-indexed frame, in staging order."""
+    cursor = conn.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM staging_prices ORDER BY ticker, rowid")
+    rows = iter(lambda: cursor.fetchmany(chunk_size), [])
+    for symbol, group in groupby((row for chunk in rows for row in chunk), key=lambda row: row[0]):
+        df = pd.DataFrame.from_records(list(group), columns=EXPORT_COLUMNS)
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('date')), name='date')
+        yield symbol, df.drop(columns='ticker')
+
+
+def import_files(
+    paths: Iterable[Path],
+    ticker: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    mark_fresh: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, float]:
+    """Stream price files into the cache and return throughput stats.
+
+    Bars are cleaned per ticker with ``quality.clean`` first, and
+    existing rows for the same (ticker, date) are replaced. With
+    ``mark_fresh`` the imported tickers are recorded as updated today so
+    ``fetch_and_cache`` serves them without refetching.
+    """
+    paths = [Path(p) for p in paths]
+    conn = get_connection()
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("DROP TABLE IF EXISTS temp.staging_prices")
+    conn.execute("""
+        CREATE TEMP TABLE staging_prices (
+            ticker TEXT,
+            date TEXT,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            adj_close REAL,
+            volume INTEGER
+        )
+    """)
+    conn.execute("DROP TABLE IF EXISTS temp.clean_prices")
+    conn.execute("CREATE TEMP TABLE clean_prices AS SELECT * FROM staging_prices WHERE 0")
+
+    started = time.perf_counter()
+    staged = 0
+    try:
+        for path in paths:
+            default_ticker = ticker or path.stem
+            for chunk in _read_chunks(path, chunk_size):
+                try:
+                    rows = _prepare_rows(chunk, default_ticker)
+                except ValueError as e:
+                    raise ValueError(f"{path.name}: {e}") from e
+                conn.executemany(
+                    "INSERT INTO staging_prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                conn.commit()
+                staged += len(rows)
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress(f"{path.name}: staged {staged:,} rows ({staged / max(elapsed, 1e-9):,.0f} rows/s)")
+
+        staged_at = time.perf_counter()
+        tickers, reports = [], {}
+        for symbol, df in _staged_frames(conn, chunk_size):
+            df, report = quality.clean(df)
+            conn.executemany(
+                "INSERT INTO clean_prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([symbol] * len(df), df.index.strftime('%Y-%m-%d'),
+                    *(df[name].tolist() for name in PRICE_COLUMNS)),
+            )
+            tickers.append(symbol)
+            reports[symbol] = (report, df.index)
+        for symbol in tickers:
+            # Legacy bars must move first or they would shadow the import later
+            price_store.ensure_migrated(conn, symbol)
+        conn.executemany("INSERT OR IGNORE INTO tickers (symbol) VALUES (?)", [(t,) for t in tickers])
+        conn.execute("""
+            INSERT OR REPLACE INTO prices
+            (ticker_id, day, open, high, low, close, adj_close, volume)
+            SELECT t.id, CAST(julianday(s.date) - 2440587.5 AS INTEGER) AS day,
+                   s.open, s.high, s.low, s.close, s.adj_close, s.volume
+            FROM clean_prices s JOIN tickers t ON t.symbol = s.ticker
+            ORDER BY t.id, day
+        """)
+        if mark_fresh:
+            today = datetime.now().strftime('%Y-%m-%d')
+            fetched_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+            conn.executemany(
+                "INSERT INTO cache_metadata (ticker, last_updated, fetched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET "
+                "last_updated = excluded.last_updated, fetched_at = excluded.fetched_at",
+                [(t, today, fetched_at) for t in tickers],
+            )
+        conn.commit()
+        merge_seconds = time.perf_counter() - staged_at
+        shared_arrays.invalidate(*tickers)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.staging_prices")
+        conn.execute("DROP TABLE IF EXISTS temp.clean_prices")
+        conn.close()
+    for symbol, (report, kept) in reports.items():
+        quality.record(symbol, report, kept)
+    flagged = sum(len(report) for report, _ in reports.values())
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'rows': staged,
+        'tickers': len(tickers),
+        'seconds': round(seconds, 3),
+        'merge_seconds': round(merge_seconds, 3),
+        'flagged': flagged,
+        'rows_per_sec': round(staged / seconds, 1) if seconds > 0 else float(staged),
+    }
+    if progress:
+        progress(
+            f"imported {staged:,} rows for {len(tickers)} tickers in {seconds:.2f}s "
+            f"({stats['rows_per_sec']:,.0f} rows/s, merge {merge_seconds:.2f}s, {flagged:,} bars flagged)"
+        )
+    return stats
+
+
+def _export_rows(tickers: Optional[List[str]], chunk_size: int) -> Iterator[List[tuple]]:
+    # Finish moving legacy bars so the export sees all of them
+    while price_store.migrate_batch():
+        pass
+    conn = get_connection()
+    try:
+        query = """
+            SELECT t.symbol AS ticker, date(p.day * 86400, 'unixepoch') AS date,
+                   p.open, p.high, p.low, p.close, p.adj_close, p.volume
+            FROM tickers t JOIN prices p ON p.ticker_id = t.id
+        """
+        params: tuple = ()
+        if tickers:
+            query += f" WHERE t.symbol IN ({', '.join('?' * len(tickers))})"
+            params = tuple(t.upper() for t in tickers)
+        cursor = conn.execute(query + " ORDER BY t.symbol, p.day", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def export_cache(
+    path: str,
+    tickers: Optional[List[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, float]:
+    """Write cached prices to CSV (or Parquet by extension), streaming by chunk.
+
+    ``path`` may be ``-`` to write CSV to stdout.
+    """
+    started = time.perf_counter()
+    exported = 0
+
+    if path != '-' and Path(path).suffix.lower() in ('.parquet', '.pq'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+        writer = None
+        try:
+            for rows in _export_rows(tickers, chunk_size):
+                table = pa.Table.from_pandas(
+                    pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS), preserve_index=False
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                exported += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        handle = sys.stdout if path == '-' else open(path, 'w', newline='')
+        try:
+            out = csv.writer(handle)
+            out.writerow(EXPORT_COLUMNS)
+            for rows in _export_rows(tickers, chunk_size):
+                out.writerows(rows)
+                exported += len(rows)
+                if progress:
+                    progress(f"exported {exported:,} rows")
+        finally:
+            if handle is not sys.stdout:
+                handle.close()
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'rows': exported,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(exported / seconds, 1) if seconds > 0 else float(exported),
+    }
+    if progress:
+        progress(f"exported {exported:,} rows in {seconds:.2f}s ({stats['rows_per_sec']:,.0f} rows/s)")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import/export for the price cache")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    imp = sub.add_parser('import', help="Load CSV/Parquet files into the cache")
+    imp.add_argument('paths', nargs='+', type=Path)
+    imp.add_argument('--ticker', help="Ticker for single-ticker files without a ticker column")
+    imp.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    imp.add_argument('--mark-fresh', action='store_true',
+                     help="Record imported tickers as updated today")
+
+    exp = sub.add_parser('export', help="Dump cached prices to CSV/Parquet")
+    exp.add_argument('path', help="Output file (.csv or .parquet), or - for stdout")
+    exp.add_argument('--tickers', help="Comma-separated tickers (default: all)")
+    exp.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    for command in (imp, exp):
+        command.add_argument('--quiet', action='store_true', help="Suppress progress output")
+    args = parser.parse_args(argv)
+
+    def report(message: str):
+        print(message, file=sys.stderr)
+
+    progress = None if args.quiet else report
+    init_db()
+
+    if args.command == 'import':
+        import_files(args.paths, ticker=args.ticker, chunk_size=args.chunk_size,
+                     mark_fresh=args.mark_fresh, progress=progress)
+    else:
+        tickers = [t.strip() for t in args.tickers.split(',')] if args.tickers else None
+        export_cache(args.path, tickers=tickers, chunk_size=args.chunk_size, progress=progress)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,92 +1,246 @@
-import sqlite3
-from datetime import datetime, timedelta
-from pathlib import Path
+import itertools
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
-import requests
 
-DB_PATH = Path(__file__).parent / "price_cache.db"
+import corporate_actions
+import metrics
+import negative_cache
+import price_store
+import quality
+import retention
+import shared_arrays
+import trading_calendar
+import upstream
+from db import get_connection, init_db  # noqa: F401  (re-exported)
+from price_store import PRICE_COLUMNS, TICKER_ID
 
+YAHOO_CHART_URL = os.environ.get("YAHOO_CHART_URL", "https://query1.finance.yahoo.com/v8/finance/chart")
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Stale-while-revalidate: serve out-of-date cached bars immediately and
+# refresh them in the background, unless they are older than the limit.
+CACHE_STALE_WHILE_REVALIDATE = os.environ.get("CACHE_STALE_WHILE_REVALIDATE", "0") == "1"
+CACHE_MAX_STALENESS_DAYS = int(os.environ.get("CACHE_MAX_STALENESS_DAYS", "3"))
+CACHE_REFRESH_WORKERS = 2
 
+# Updates refetch only bars after the cache, starting this many days before
+# its last bar so revised history can be detected (0: refetch everything).
+CACHE_OVERLAP_DAYS = int(os.environ.get("CACHE_OVERLAP_DAYS", "10"))
 
-def init_db():
-    conn = get_connection()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS daily_prices (
-            ticker TEXT NOT NULL,
-            date TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            adj_close REAL,
-            volume INTEGER,
-            PRIMARY KEY (ticker, date)
-        )
-    """)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cache_metadata (
-            ticker TEXT PRIMARY KEY,
-            last_updated TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
 
+class NoDataError(ValueError):
+    """The upstream provider has no price data for a ticker."""
 
-def get_cached_data(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+
+def _series_from_rows(rows: list) -> np.ndarray:
+    # NULL prices become NaN
+    return np.array(rows, dtype=np.float64).reshape(-1, 1 + len(PRICE_COLUMNS)).T
+
+
+def _read_rows(ticker: str, first_day: int, last_day: int) -> list:
+    """``(day, *PRICE_COLUMNS)`` tuples for ``ticker`` between two day numbers."""
     conn = get_connection()
-    query = """
-        SELECT date, open, high, low, close, adj_close, volume
-        FROM daily_prices
-        WHERE ticker = ? AND date >= ? AND date <= ?
-        ORDER BY date
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        # Plain tuples are cheaper to build and convert than sqlite3.Row
+        conn.row_factory = None
+        return conn.execute(f"""
+            SELECT day, open, high, low, close, adj_close, volume
+            FROM prices
+            WHERE ticker_id = {TICKER_ID} AND day BETWEEN ? AND ?
+            ORDER BY day
+        """, (ticker, first_day, last_day)).fetchall()
+    finally:
+        conn.close()
+
+
+def _read_series(ticker: str) -> Optional[np.ndarray]:
+    """A ticker's full cached history as float64 rows: day number, then PRICE_COLUMNS."""
+    rows = _read_rows(ticker, np.iinfo(np.int32).min, np.iinfo(np.int32).max)
+    if not rows:
+        return None
+    return _series_from_rows(rows)
+
+
+def _scan_series(conn, tickers: List[str]) -> Iterator[Tuple[str, np.ndarray]]:
+    """Each of ``tickers``' series, from one scan holding one ticker's rows at a time."""
+    cursor = conn.execute(f"""
+        SELECT t.symbol, p.day, p.open, p.high, p.low, p.close, p.adj_close, p.volume
+        FROM tickers t JOIN prices p ON p.ticker_id = t.id
+        WHERE t.symbol IN ({', '.join('?' * len(tickers))})
+        ORDER BY t.symbol, p.day
+    """, tickers)
+    for ticker, rows in itertools.groupby(cursor, key=operator.itemgetter(0)):
+        yield ticker, _series_from_rows([row[1:] for row in rows])
+
+
+def warm_arrays(limit: int) -> Dict[str, float]:
+    """Map the ``limit`` most-accessed tickers' shared arrays in this worker.
+
+    Tickers without a published array are read from ``prices`` in a
+    single ordered scan. Returns the tickers mapped, how many were
+    published, the bytes they span and the seconds taken.
     """
-    df = pd.read_sql_query(query, conn, params=(ticker.upper(), start_date, end_date))
-    conn.close()
+    started = time.perf_counter()
+    conn = get_connection()
+    try:
+        if price_store.legacy_pending(conn):
+            # Move the hottest tickers now rather than waiting for the background migration
+            hottest = conn.execute("""
+                SELECT ticker FROM cache_metadata WHERE access_count > 0
+                ORDER BY access_count DESC, ticker LIMIT ?
+            """, (limit,)).fetchall()
+            for row in hottest:
+                price_store.ensure_migrated(conn, row['ticker'])
+        tickers = [row['ticker'] for row in conn.execute("""
+            SELECT m.ticker FROM cache_metadata m JOIN tickers t ON t.symbol = m.ticker
+            WHERE m.access_count > 0 AND EXISTS (SELECT 1 FROM prices p WHERE p.ticker_id = t.id)
+            ORDER BY m.access_count DESC, m.ticker
+            LIMIT ?
+        """, (limit,))]
+        # Plain tuples are cheaper to slice than sqlite3.Row
+        conn.row_factory = None
+        published = shared_arrays.publish_many(tickers, lambda missing: _scan_series(conn, missing))
+    finally:
+        conn.close()
+    arrays = [array for array in map(shared_arrays.load, tickers) if array is not None]
+    return {
+        "tickers": len(arrays),
+        "published": published,
+        "bytes": sum(array.nbytes for array in arrays),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _frame_from_series(series: np.ndarray, start_date: str, end_date: str) -> pd.DataFrame:
+    lo = np.searchsorted(series[0], np.datetime64(start_date, 'D').astype(np.int64), side='left')
+    hi = np.searchsorted(series[0], np.datetime64(end_date, 'D').astype(np.int64), side='right')
+    block = series[:, lo:hi]
+    index = pd.DatetimeIndex(block[0].astype(np.int64).astype('datetime64[D]').astype('datetime64[ns]'),
+                             name='date')
+    df = pd.DataFrame({name: np.array(block[i + 1]) for i, name in enumerate(PRICE_COLUMNS)}, index=index)
+    if not np.isnan(block[-1]).any():
+        # SQLite hands back volume as integers
+        df['volume'] = df['volume'].astype(np.int64)
+    return df
+
+
+def get_cached_data(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+    ticker = ticker.upper()
+    series = shared_arrays.load(ticker)
+    if series is None and shared_arrays.note_read(ticker):
+        series = shared_arrays.publish(ticker, lambda: _read_series(ticker))
+    if series is not None:
+        df = _frame_from_series(series, start_date, end_date)
+        if not df.empty:
+            retention.record_access(ticker)
+            return df
+
+    rows = _read_rows(ticker, price_store.day_number(start_date), price_store.day_number(end_date))
+    df = _frame_from_series(_series_from_rows(rows), start_date, end_date)
     if not df.empty:
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
+        retention.record_access(ticker)
     return df
 
 
+def has_cached_data(ticker: str) -> bool:
+    ticker = ticker.upper()
+    conn = get_connection()
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        row = conn.execute(
+            f"SELECT 1 FROM prices WHERE ticker_id = {TICKER_ID} LIMIT 1", (ticker,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def iter_cached_rows(
+    ticker: str,
+    end_date: Optional[str] = None,
+    chunk_size: int = 5000,
+) -> Iterator[Tuple[List[str], Dict[str, np.ndarray]]]:
+    """Stream a ticker's cached bars in date order, ``chunk_size`` rows at a time.
+
+    Yields ``(dates, columns)`` where ``columns`` maps each price column to a
+    float64 array. Only one chunk is held in memory at a time; the
+    connection stays open until the generator is exhausted or closed.
+    """
+    ticker = ticker.upper()
+    conn = get_connection()
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        conn.row_factory = None
+        query = f"""
+            SELECT day, open, high, low, close, adj_close, volume
+            FROM prices
+            WHERE ticker_id = {TICKER_ID} AND day <= ?
+            ORDER BY day
+        """
+        last_day = price_store.day_number(end_date) if end_date else np.iinfo(np.int32).max
+        cursor = conn.execute(query, (ticker, last_day))
+        first = True
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if first:
+                retention.record_access(ticker)
+                first = False
+            days, *values = zip(*rows)
+            dates = np.datetime_as_string(np.array(days, dtype='datetime64[D]')).tolist()
+            columns = {
+                name: np.array(column, dtype=np.float64)
+                for name, column in zip(PRICE_COLUMNS, values)
+            }
+            yield dates, columns
+    finally:
+        conn.close()
+
+
 def save_to_cache(ticker: str, df: pd.DataFrame):
     if df.empty:
         return
     conn = get_connection()
     ticker = ticker.upper()
-
-    for idx, row in df.iterrows():
-        date_str = idx.strftime('%Y-%m-%d') if hasattr(idx, 'strftime') else str(idx)[:10]
-        conn.execute("""
-            INSERT OR REPLACE INTO daily_prices
-            (ticker, date, open, high, low, close, adj_close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            ticker,
-            date_str,
-            row['open'],
-            row['high'],
-            row['low'],
-            row['close'],
-            row['adj_close'],
-            int(row['volume']) if pd.notna(row['volume']) else 0
-        ))
-
+    price_store.ensure_migrated(conn, ticker)
+    price_store.add_ticker(conn, ticker)
+    ticker_id = conn.execute("SELECT id FROM tickers WHERE symbol = ?", (ticker,)).fetchone()[0]
+
+    days = pd.DatetimeIndex(df.index).values.astype('datetime64[D]').astype(np.int64)
+    values = df[list(PRICE_COLUMNS[:-1])].to_numpy(dtype=np.float64)
+    volume = np.nan_to_num(df['volume'].to_numpy(dtype=np.float64)).astype(np.int64)
+    conn.executemany("""
+        INSERT OR REPLACE INTO prices
+        (ticker_id, day, open, high, low, close, adj_close, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(ticker_id, day, *prices, vol)
+          for day, prices, vol in zip(days.tolist(), values.tolist(), volume.tolist())])
+
+    # Upsert rather than replace so access stats used for eviction survive
     conn.execute("""
-        INSERT OR REPLACE INTO cache_metadata (ticker, last_updated)
-        VALUES (?, ?)
-    """, (ticker, datetime.now().strftime('%Y-%m-%d')))
+        INSERT INTO cache_metadata (ticker, last_updated, fetched_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(ticker) DO UPDATE SET
+            last_updated = excluded.last_updated,
+            fetched_at = excluded.fetched_at
+    """, (ticker, datetime.now().strftime('%Y-%m-%d'),
+          datetime.now(timezone.utc).isoformat(timespec='seconds')))
 
     conn.commit()
     conn.close()
+    shared_arrays.invalidate(ticker)
 
 
-def needs_update(ticker: str) -> bool:
+def last_updated(ticker: str) -> Optional[date]:
+    """Day the ticker was last fetched from upstream, if ever."""
     conn = get_connection()
     cursor = conn.execute(
         "SELECT last_updated FROM cache_metadata WHERE ticker = ?",
@@ -95,13 +249,45 @@ def needs_update(ticker: str) -> bool:
     row = cursor.fetchone()
     conn.close()
 
-    if row is None:
+    # Rows created by access tracking alone have never been fetched
+    if row is None or row['last_updated'] is None:
+        return None
+
+    return datetime.strptime(row['last_updated'], '%Y-%m-%d').date()
+
+
+def needs_update(ticker: str, now: Optional[datetime] = None) -> bool:
+    """True when a trading session may have completed since the last fetch.
+
+    Weekends, exchange holidays and the hours before the close never
+    trigger a refetch; a fetch made before the close goes stale once the
+    session's bar is final.
+    """
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT last_updated, fetched_at FROM cache_metadata WHERE ticker = ?",
+        (ticker.upper(),)
+    ).fetchone()
+    conn.close()
+
+    # Rows created by access tracking alone have never been fetched
+    if row is None or row['last_updated'] is None:
         return True
 
-    last_updated = datetime.strptime(row['last_updated'], '%Y-%m-%d').date()
-    today = datetime.now().date()
+    now = now or datetime.now(timezone.utc)
+    session = trading_calendar.last_completed_session(now)
+    updated = datetime.strptime(row['last_updated'], '%Y-%m-%d').date()
+    if row['fetched_at']:
+        stale = datetime.fromisoformat(row['fetched_at']) < trading_calendar.session_close(session)
+    else:
+        # Rows from before fetched_at was recorded: only a fetch on a later
+        # day is known to have happened after the session closed
+        stale = updated <= session
 
-    return last_updated < today
+    if not stale and updated < now.astimezone().date():
+        # The old calendar-date rule would have gone upstream here
+        metrics.increment('cache_fetches_avoided')
+    return stale
 
 
 def fetch_from_yahoo(ticker: str, start_date: datetime, end_date: datetime) -> pd.DataFrame:
@@ -111,29 +297,31 @@ def fetch_from_yahoo(ticker: str, start_date: datetime, end_date: datetime) -> p
     period1 = int(start_date.timestamp())
     period2 = int(end_date.timestamp())
 
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
+    url = f"{YAHOO_CHART_URL}/{ticker}"
     params = {
         "period1": period1,
         "period2": period2,
         "interval": "1d",
-        "events": "history",
+        "events": "div,splits",
     }
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
     }
 
-    response = requests.get(url, params=params, headers=headers)
+    response = upstream.get(url, params=params, headers=headers)
+    if response.status_code == 404:
+        raise NoDataError(f"No data found for ticker: {ticker}")
     response.raise_for_status()
 
     data = response.json()
 
     if "chart" not in data or "result" not in data["chart"] or not data["chart"]["result"]:
-        raise ValueError(f"No data found for ticker: {ticker}")
+        raise NoDataError(f"No data found for ticker: {ticker}")
 
     result = data["chart"]["result"][0]
 
     if "timestamp" not in result or not result["timestamp"]:
-        raise ValueError(f"No price data found for ticker: {ticker}")
+        raise NoDataError(f"No price data found for ticker: {ticker}")
 
     timestamps = result["timestamp"]
     quotes = result["indicators"]["quote"][0]
@@ -151,11 +339,144 @@ def fetch_from_yahoo(ticker: str, start_date: datetime, end_date: datetime) -> p
 
     df.set_index("date", inplace=True)
     df.index = df.index.tz_localize(None)
+    df.attrs['events'] = corporate_actions.parse_events(result)
+
+    return df
+
+
+def _fetch_and_store(ticker: str, start_date: datetime, end_date: datetime,
+                     reference: Optional[np.ndarray] = None) -> pd.DataFrame:
+    # Known-bad tickers are answered without an upstream round trip
+    reason = negative_cache.lookup(ticker)
+    if reason is not None:
+        raise NoDataError(reason)
+
+    try:
+        df = fetch_from_yahoo(ticker, start_date, end_date)
+        if df.empty:
+            raise NoDataError(f"No data found for ticker: {ticker}")
+    except NoDataError as e:
+        negative_cache.remember(ticker, str(e))
+        raise
+
+    events = df.attrs.pop('events', [])
+    df, report = quality.clean(df, reference)
+    if df.empty:
+        raise NoDataError(f"No valid price data for ticker: {ticker}")
+    revised = corporate_actions.reconcile(ticker, df, events)
+    save_to_cache(ticker, df)
+    quality.record(ticker, report, df.index)
+    if revised:
+        corporate_actions.invalidate_derived(ticker)
+    retention.record_access(ticker)
 
     return df
 
 
+def _incremental_start(ticker: str, start_date: datetime) -> Optional[datetime]:
+    """Where an update fetch can start, or None when the whole window is needed."""
+    if not CACHE_OVERLAP_DAYS:
+        return None
+    ticker = ticker.upper()
+    conn = get_connection()
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        row = conn.execute(
+            f"SELECT MIN(day) AS first, MAX(day) AS last FROM prices WHERE ticker_id = {TICKER_ID}",
+            (ticker,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row['last'] is None:
+        return None
+    first = datetime.fromisoformat(price_store.day_string(row['first']))
+    last = datetime.fromisoformat(price_store.day_string(row['last']))
+    # Allow for the window starting on a weekend or holiday
+    if first - start_date > timedelta(days=CACHE_OVERLAP_DAYS) or last < start_date:
+        return None
+    return max(start_date, last - timedelta(days=CACHE_OVERLAP_DAYS))
+
+
+def _stored_tail(ticker: str, before: datetime) -> np.ndarray:
+    """Adjusted closes of the last few stored bars before ``before``, oldest first."""
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT adj_close FROM prices WHERE ticker_id = {TICKER_ID} AND day < ? "
+            "ORDER BY day DESC LIMIT ?",
+            (ticker.upper(), price_store.day_number(before.strftime('%Y-%m-%d')), quality.QUALITY_REFERENCE_BARS)
+        ).fetchall()
+    finally:
+        conn.close()
+    return np.array([row[0] for row in reversed(rows)], dtype=np.float64)
+
+
+def _update(ticker: str, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """Bring the cache up to date and return its bars from ``start_date``.
+
+    When the cache already covers the window, only recent bars are
+    fetched; older bars are rescaled in place if splits or dividends
+    revised them (see corporate_actions.py).
+    """
+    since = _incremental_start(ticker, start_date)
+    if since is not None:
+        # The overlap alone is too short for a robust spike scale
+        _fetch_and_store(ticker, since, end_date, _stored_tail(ticker, since))
+        # None again if history that couldn't be rescaled was dropped
+        if _incremental_start(ticker, start_date) is not None:
+            metrics.increment('cache_incremental_fetches')
+            return get_cached_data(ticker, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    return _fetch_and_store(ticker, start_date, end_date)
+
+
+_refresh_lock = threading.Lock()
+_refreshing: set = set()
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _refresh(ticker: str, years: int) -> None:
+    try:
+        end_date = datetime.now()
+        _update(ticker, end_date - timedelta(days=years * 365), end_date)
+        metrics.increment('cache_refreshes')
+    except Exception:
+        metrics.increment('cache_refresh_errors')
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(ticker)
+
+
+def schedule_refresh(ticker: str, years: int = 5) -> bool:
+    """Refresh ``ticker`` in the background; False if one is already running."""
+    global _refresh_executor
+    ticker = ticker.upper()
+    with _refresh_lock:
+        if ticker in _refreshing:
+            metrics.increment('cache_refreshes_deduplicated')
+            return False
+        _refreshing.add(ticker)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix='cache-refresh'
+            )
+        _refresh_executor.submit(_refresh, ticker, years)
+    return True
+
+
+def shutdown_refresh(wait: bool = False) -> None:
+    global _refresh_executor
+    with _refresh_lock:
+        executor, _refresh_executor = _refresh_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
 def fetch_and_cache(ticker: str, years: int = 5) -> pd.DataFrame:
+    """Return ``years`` of daily bars, fetching from upstream when out of date.
+
+    ``df.attrs['stale']`` is True when out-of-date bars were served under
+    stale-while-revalidate while a background refresh runs.
+    """
     ticker = ticker.upper()
     end_date = datetime.now()
     start_date = end_date - timedelta(days=years * 365)
@@ -166,16 +487,18 @@ def fetch_and_cache(ticker: str, years: int = 5) -> pd.DataFrame:
     if not needs_update(ticker):
         cached = get_cached_data(ticker, start_str, end_str)
         if not cached.empty:
+            cached.attrs['stale'] = False
             return cached
-
-    df = fetch_from_yahoo(ticker, start_date, end_date)
-
-    if df.empty:
-        raise ValueError(f"No data found for ticker: {ticker}")
-
-    save_to_cache(ticker, df)
-
+    elif CACHE_STALE_WHILE_REVALIDATE:
+        updated = last_updated(ticker)
+        if updated is not None and (end_date.date() - updated).days <= CACHE_MAX_STALENESS_DAYS:
+            cached = get_cached_data(ticker, start_str, end_str)
+            if not cached.empty:
+                schedule_refresh(ticker, years)
+                metrics.increment('cache_stale_served')
+                cached.attrs['stale'] = True
+                return cached
+
+    df = _update(ticker, start_date, end_date)
+    df.attrs['stale'] = False
     return df
-
-
-init_db()
@@ -0,0 +1,383 @@
+"""Array-based compute core for the volatility pipeline.
+
+Everything here works on contiguous float64 NumPy arrays (prices in,
+metrics out) and never builds intermediate DataFrames. The semantics match
+the pandas formulation the API was originally written with: rolling
+windows need a full window of non-NaN values, quantiles use linear
+interpolation, and RSI uses Wilder smoothing seeded with a simple mean.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+TRADING_DAYS_PER_YEAR = 252
+ANNUALIZATION = np.sqrt(TRADING_DAYS_PER_YEAR)
+
+
+def as_float_array(values) -> np.ndarray:
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def log_returns(prices: np.ndarray) -> np.ndarray:
+    """ln(p_t / p_t-1), NaN for the first observation."""
+    out = np.empty(len(prices), dtype=np.float64)
+    if len(prices):
+        out[0] = np.nan
+        np.log(prices[1:] / prices[:-1], out=out[1:])
+    return out
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Sample standard deviation over a trailing window (ddof=1).
+
+    Positions without a full window, or whose window contains a NaN, are NaN.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).std(axis=1, ddof=1)
+    return out
+
+
+def annualized_vol(returns: np.ndarray, window: int) -> np.ndarray:
+    return rolling_std(returns, window) * ANNUALIZATION
+
+
+def window_deviations(values: np.ndarray, window: int) -> np.ndarray:
+    """Each trailing window of ``values`` minus its mean, one row per full window.
+
+    Row ``i`` belongs to position ``i + window - 1``. Windows containing a
+    NaN are all NaN.
+    """
+    if len(values) < window:
+        return np.empty((0, window))
+    windows = sliding_window_view(values, window)
+    return windows - windows.mean(axis=1, keepdims=True)
+
+
+def rolling_covariance(values: np.ndarray, deviations: np.ndarray, window: int) -> np.ndarray:
+    """Sample covariance (ddof=1) of ``values`` with the series ``deviations`` came from.
+
+    ``deviations`` is ``window_deviations`` of another series of the same
+    length. Since those deviations sum to zero over each window, one
+    product-sum per window gives the covariance without demeaning
+    ``values``. Positions without a full window, or whose window holds a
+    NaN in either series, are NaN.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = np.einsum('ij,ij->i', sliding_window_view(values, window), deviations) / (window - 1)
+    return out
+
+
+def thresholds(values: np.ndarray) -> np.ndarray:
+    """p50, p90 and p99 of ``values`` (linear interpolation)."""
+    return np.percentile(values, [50.0, 90.0, 99.0])
+
+
+def percentile_of(values: np.ndarray, value: float) -> float:
+    """Percentage of ``values`` at or below ``value``."""
+    return (values <= value).mean() * 100
+
+
+def rolling_percentile_rank(values: np.ndarray, window: Optional[int] = None,
+                            start: int = 0) -> np.ndarray:
+    """``percentile_of`` for every position against its trailing window.
+
+    Each value is ranked against the ``window`` observations ending at it
+    (all prior observations when ``window`` is None), including itself.
+    NaNs rank as NaN and are left out of the windows. Positions before
+    ``start`` are not ranked (NaN) but still fill the windows.
+
+    Counts are kept in a Fenwick tree over the sorted distinct values, so a
+    series of n values costs O(n log n) rather than the O(n^2) of calling
+    ``percentile_of`` per position. The tree for the window ending just
+    before ``start`` is built in one vectorized pass.
+    """
+    values = as_float_array(values)
+    n = len(values)
+    out = np.full(n, np.nan)
+    valid = ~np.isnan(values)
+    start = max(start, 0)
+    if start >= n or not valid.any():
+        return out
+
+    levels = np.unique(values[valid])
+    size = len(levels)
+    # 1-based tree slot of each value's level; slots of NaNs are never used
+    slots = np.searchsorted(levels, values) + 1
+
+    lo = 0 if window is None else max(start - window, 0)
+    initial = slots[lo:start][valid[lo:start]]
+    prefix = np.cumsum(np.bincount(initial, minlength=size + 1))
+    k = np.arange(size + 1)
+    # tree[k] holds the count of slots in (k - lowbit(k), k]
+    tree = (prefix - prefix[k - (k & -k)]).tolist()
+    count = len(initial)
+
+    slots = slots.tolist()
+    valid = valid.tolist()
+    ranks = out.tolist()
+    for i in range(start, n):
+        if window is not None and i >= window and valid[i - window]:
+            k = slots[i - window]
+            while k <= size:
+                tree[k] -= 1
+                k += k & -k
+            count -= 1
+        if not valid[i]:
+            continue
+        k = slots[i]
+        while k <= size:
+            tree[k] += 1
+            k += k & -k
+        count += 1
+        at_or_below = 0
+        k = slots[i]
+        while k:
+            at_or_below += tree[k]
+            k &= k - 1
+        ranks[i] = at_or_below / count * 100
+
+    return np.array(ranks, dtype=np.float64)
+
+
+# Cells per sorted block in ``range_percentiles``, bounding its memory
+RANGE_BLOCK_CELLS = 1 << 22
+
+
+def range_reduce(ufunc: np.ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """``ufunc.reduce(values[start:end])`` for each non-empty range, in one call."""
+    # reduceat reduces between consecutive indices; the trailing NaN lets an
+    # end equal len(values), and the odd (end, next start) rows are dropped
+    padded = np.append(values, np.nan)
+    return ufunc.reduceat(padded, np.column_stack([starts, ends]).ravel())[::2]
+
+
+def range_percentiles(values: np.ndarray, starts: np.ndarray,
+                      ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """``thresholds`` of each non-empty ``values[start:end]`` and ``percentile_of`` its last value.
+
+    The ranges are sorted as NaN-padded rows in blocks of at most
+    ``RANGE_BLOCK_CELLS``, and the quantiles interpolated the way
+    ``np.percentile`` does, so results are identical to calling
+    ``thresholds`` and ``percentile_of`` per range. ``values`` must not
+    hold NaN.
+    """
+    counts = ends - starts
+    cutoffs = np.empty((len(starts), 3))
+    ranks = np.empty(len(starts))
+    if not len(starts):
+        return cutoffs, ranks
+    q = np.array([50.0, 90.0, 99.0]) / 100
+    width = int(counts.max())
+    step = max(RANGE_BLOCK_CELLS // width, 1)
+    for i in range(0, len(starts), step):
+        block = slice(i, i + step)
+        at = starts[block, None] + np.arange(width)
+        rows = np.where(at < ends[block, None], values[np.minimum(at, len(values) - 1)], np.nan)
+        rows.sort(axis=1)  # NaN padding sorts last
+        last = values[ends[block] - 1]
+        ranks[block] = (rows <= last[:, None]).sum(axis=1) / counts[block] * 100
+
+        top = counts[block, None] - 1
+        virtual = top * q
+        lower = np.where(virtual >= top, top, np.floor(virtual).astype(np.intp))
+        upper = np.where(virtual >= top, top, lower + 1)
+        gamma = virtual - lower
+        a = np.take_along_axis(rows, lower, axis=1)
+        b = np.take_along_axis(rows, upper, axis=1)
+        diff = b - a
+        cutoffs[block] = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+    return cutoffs, ranks
+
+
+def bucket(value: float, p50: float, p90: float, p99: float) -> str:
+    if value < p50:
+        return "<p50"
+    elif value < p90:
+        return "p50-p90"
+    elif value < p99:
+        return "p90-p99"
+    else:
+        return ">p99"
+
+
+def range_high(values: np.ndarray, days: int) -> float:
+    """Max of the last ``days`` values, ignoring NaN."""
+    return np.fmax.reduce(values[-days:])
+
+
+def range_low(values: np.ndarray, days: int) -> float:
+    """Min of the last ``days`` values, ignoring NaN."""
+    return np.fmin.reduce(values[-days:])
+
+
+def wilder_rsi(prices: np.ndarray, period: int = 14) -> Optional[float]:
+    """Unrounded RSI of the full series, or None if it is too short."""
+    if len(prices) < period + 1:
+        return None
+
+    delta = np.diff(prices)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+
+    # Python floats keep the recursion off NumPy scalar arithmetic
+    avg_gain = float(gain[:period].mean())
+    avg_loss = float(loss[:period].mean())
+
+    for g, l in zip(gain[period:].tolist(), loss[period:].tolist()):
+        avg_gain = (avg_gain * (period - 1) + g) / period
+        avg_loss = (avg_loss * (period - 1) + l) / period
+
+    if avg_loss == 0:
+        return 100.0
+
+    rs = avg_gain / avg_loss
+    return 100.0 - (100.0 / (1.0 + rs))
+
+
+def wilder_rsi_ranges(prices: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                      period: int = 14) -> np.ndarray:
+    """``wilder_rsi(prices[start:end])`` for each range, NaN where it would be None.
+
+    Each range's smoothed averages are its seed decayed to the end plus one
+    shared exponential filter over all moves, differenced between the seed
+    and the end, so the whole batch costs a single pass over ``prices``.
+    Results agree with ``wilder_rsi`` to within float rounding.
+    """
+    out = np.full(len(starts), np.nan)
+    ok = ends - starts >= period + 1
+    if not ok.any():
+        return out
+    starts, ends = starts[ok], ends[ok]
+
+    delta = np.diff(prices)
+    moves = {"gain": np.where(delta > 0, delta, 0.0), "loss": np.where(delta < 0, -delta, 0.0)}
+    decay = (period - 1) / period
+    # Range [s, e) smooths moves s..e-2, seeded from the first `period`
+    seeded, last = starts + period - 1, ends - 2
+    steps = last - seeded
+
+    averages = {}
+    for name, move in moves.items():
+        filtered = np.empty(len(move))
+        level = 0.0
+        for i, m in enumerate((move / period).tolist()):
+            level = level * decay + m
+            filtered[i] = level
+        seed = move[starts[:, None] + np.arange(period)].mean(axis=1)
+        average = decay ** steps * (seed - filtered[seeded]) + filtered[last]
+        # Exactly zero when the range has no such move, as in wilder_rsi
+        seen = np.concatenate(([0], np.cumsum(move > 0)))
+        average[seen[last + 1] == seen[starts]] = 0.0
+        averages[name] = average
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = averages["gain"] / averages["loss"]
+    out[ok] = np.where(averages["loss"] == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+    return out
+
+
+def period_returns(prices: np.ndarray, years: np.ndarray, current_year: int) -> Dict[str, Optional[float]]:
+    """Unrounded daily/week/month/YTD simple returns ending at the last price.
+
+    ``years`` holds the calendar year of each observation and selects the
+    first price of ``current_year`` as the YTD base.
+    """
+    n = len(prices)
+    if n < 2:
+        return {"daily": None, "week": None, "month": None, "ytd": None}
+
+    current_price = prices[-1]
+
+    def back(offset: int) -> Optional[float]:
+        if n < offset + 1:
+            return None
+        base = prices[-(offset + 1)]
+        return (current_price - base) / base
+
+    ytd = None
+    in_year = np.flatnonzero(years == current_year)
+    if len(in_year):
+        base = prices[in_year[0]]
+        ytd = (current_price - base) / base
+
+    return {
+        "daily": back(1),
+        "week": back(5),
+        "month": back(21),
+        "ytd": ytd,
+    }
+
+
+class RollingSeries:
+    """Incremental log-return, rolling-vol and RSI series over price chunks.
+
+    Feeding a series chunk by chunk through ``update`` gives the same values
+    as computing over the whole array at once, while only carrying the last
+    price, the trailing ``max(windows) - 1`` returns and the RSI averages
+    between chunks, so memory stays constant regardless of history length.
+    The RSI series is the value ``wilder_rsi`` would return for the prefix
+    ending at each row (NaN until ``rsi_period + 1`` prices were seen).
+    """
+
+    def __init__(self, windows=(30, 90), rsi_period: int = 14):
+        self.windows = tuple(windows)
+        self.rsi_period = rsi_period
+        self._last_price = np.nan
+        self._seen = 0
+        self._tail = np.empty(0)
+        self._seed_gain: list = []
+        self._seed_loss: list = []
+        self._avg_gain: Optional[float] = None
+        self._avg_loss: Optional[float] = None
+
+    def update(self, prices: np.ndarray) -> Dict[str, np.ndarray]:
+        prices = as_float_array(prices)
+        n = len(prices)
+        previous = np.concatenate(([self._last_price], prices[:-1]))
+
+        returns = np.log(prices / previous)
+        if self._seen == 0 and n:
+            returns[0] = np.nan
+
+        out = {'log_return': returns}
+        extended = np.concatenate((self._tail, returns))
+        for window in self.windows:
+            out[f'vol_{window}d'] = annualized_vol(extended, window)[-n:] if n else np.empty(0)
+        keep = max(self.windows) - 1
+        self._tail = extended[-keep:] if keep else np.empty(0)
+
+        out['rsi'] = self._rsi(prices - previous)
+        if n:
+            self._last_price = prices[-1]
+        self._seen += n
+        return out
+
+    def _rsi(self, deltas: np.ndarray) -> np.ndarray:
+        period = self.rsi_period
+        out = np.full(len(deltas), np.nan)
+        gains = np.where(deltas > 0, deltas, 0.0).tolist()
+        losses = np.where(deltas < 0, -deltas, 0.0).tolist()
+
+        for i, (g, l) in enumerate(zip(gains, losses)):
+            if self._seen + i == 0:
+                continue  # the first price has no delta
+            if self._avg_gain is None:
+                self._seed_gain.append(g)
+                self._seed_loss.append(l)
+                if len(self._seed_gain) < period:
+                    continue
+                self._avg_gain = float(np.array(self._seed_gain).mean())
+                self._avg_loss = float(np.array(self._seed_loss).mean())
+                self._seed_gain, self._seed_loss = [], []
+            else:
+                self._avg_gain = (self._avg_gain * (period - 1) + g) / period
+                self._avg_loss = (self._avg_loss * (period - 1) + l) / period
+
+            if self._avg_loss == 0:
+                out[i] = 100.0
+            else:
+                out[i] = 100.0 - (100.0 / (1.0 + self._avg_gain / self._avg_loss))
+        return out
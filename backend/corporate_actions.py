@@ -0,0 +1,153 @@
+"""Splits, dividends and the history revisions they cause.
+
+Yahoo back-adjusts its daily series. When a dividend goes ex, every
+earlier ``adj_close`` is scaled down; when a split goes ex, earlier open,
+high, low, close and ``adj_close`` are divided by the ratio and volume is
+multiplied by it. Either way, every bar before the event moves by the
+same factor.
+
+Cache updates therefore only fetch bars after the cache plus a short
+overlap (see ``cache.fetch_and_cache``). ``reconcile`` compares the
+earliest overlapping bar with the stored one; when they differ, the two
+factors between them are applied to every older stored bar with a single
+UPDATE instead of refetching the whole history. Split and dividend
+events from the chart API are kept in ``corporate_actions`` so revisions
+can be told apart from unexplained upstream corrections, which are
+counted separately.
+
+Derived data built from the old prices is dropped afterwards: the shared
+array, the in-memory forecast state, cached portfolio universes that
+include the ticker and the cached benchmark if it is the ticker. The
+stored forecast state's last price is moved to the revised basis too
+(taken from the fetch when its bar is in the overlap, else rescaled
+with the history), so forecasts keep rolling forward without a refit.
+
+If no overlapping bar survives but a new event was reported, the older
+stored bars are deleted so the next fetch replaces them.
+"""
+from datetime import datetime
+from typing import List, Tuple
+
+import pandas as pd
+
+import beta
+import metrics
+import price_store
+import shared_arrays
+from db import get_connection
+from price_store import TICKER_ID
+from quality import session_dates
+
+# Relative change in a stored price treated as a revision
+FACTOR_TOLERANCE = 1e-6
+
+Event = Tuple[str, str, float]  # (date, 'dividend' or 'split', cash amount or split ratio)
+
+
+def parse_events(result: dict) -> List[Event]:
+    """Dividends and splits in a chart API result, by New York ex-date."""
+    events = result.get('events') or {}
+    raw = [(item['date'], 'dividend', item['amount'])
+           for item in (events.get('dividends') or {}).values()]
+    raw += [(item['date'], 'split', item['numerator'] / item['denominator'])
+            for item in (events.get('splits') or {}).values()]
+    if not raw:
+        return []
+    dates = session_dates(pd.to_datetime([stamp for stamp, _, _ in raw], unit='s')).strftime('%Y-%m-%d')
+    return sorted((day, kind, float(value)) for day, (_, kind, value) in zip(dates, raw))
+
+
+def record_events(conn, ticker: str, events: List[Event]) -> List[Event]:
+    """Store ``events`` and return the ones not seen before."""
+    known = {tuple(row) for row in conn.execute(
+        "SELECT date, kind FROM corporate_actions WHERE ticker = ?", (ticker,)
+    )}
+    new = [event for event in events if event[:2] not in known]
+    recorded_at = datetime.now().isoformat(timespec='seconds')
+    conn.executemany(
+        "INSERT INTO corporate_actions (ticker, date, kind, value, recorded_at) VALUES (?, ?, ?, ?, ?)",
+        [(ticker, *event, recorded_at) for event in new],
+    )
+    return new
+
+
+def reconcile(ticker: str, df: pd.DataFrame, events: List[Event]) -> bool:
+    """Record ``events`` and bring stored bars older than ``df`` in line with it.
+
+    ``df`` is a cleaned fetch that is about to be saved. Returns True when
+    stored history was rewritten or dropped.
+    """
+    ticker = ticker.upper()
+    days = df.index.values.astype('datetime64[D]').astype(int).tolist()
+    conn = get_connection()
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        new = record_events(conn, ticker, events)
+        stored = conn.execute(f"""
+            SELECT day, close, adj_close FROM prices
+            WHERE ticker_id = {TICKER_ID} AND day BETWEEN ? AND ? AND close > 0 AND adj_close > 0
+            ORDER BY day
+        """, (ticker, days[0], days[-1])).fetchall()
+        fetched = dict(zip(days, zip(df['close'].to_numpy(), df['adj_close'].to_numpy())))
+        match = next((row for row in stored if row['day'] in fetched), None)
+
+        if match is None:
+            older = conn.execute(
+                f"SELECT 1 FROM prices WHERE ticker_id = {TICKER_ID} AND day < ? LIMIT 1", (ticker, days[0])
+            ).fetchone()
+            if older is None or not new:
+                conn.commit()
+                return False
+            # Nothing to measure the adjustment against
+            conn.execute(f"DELETE FROM prices WHERE ticker_id = {TICKER_ID} AND day < ?", (ticker, days[0]))
+            conn.commit()
+            metrics.increment('price_history_dropped')
+            return True
+
+        close, adj_close = fetched[match['day']]
+        match_date = price_store.day_string(match['day'])
+        price = float(close) / match['close']
+        adjust = float(adj_close) / match['adj_close']
+        if abs(price - 1) <= FACTOR_TOLERANCE and abs(adjust - 1) <= FACTOR_TOLERANCE:
+            conn.commit()
+            return False
+
+        conn.execute(f"""
+            UPDATE prices
+            SET open = open * ?, high = high * ?, low = low * ?, close = close * ?,
+                adj_close = adj_close * ?, volume = CAST(ROUND(volume / ?) AS INTEGER)
+            WHERE ticker_id = {TICKER_ID} AND day < ?
+        """, (price, price, price, price, adjust, price, ticker, match['day']))
+        state = conn.execute("SELECT last_date FROM forecast_state WHERE ticker = ?", (ticker,)).fetchone()
+        if state is not None:
+            last_day = price_store.day_number(state['last_date'])
+            if last_day in fetched:
+                # The state usually ends inside the overlap, whose revised bars are in the fetch
+                conn.execute("UPDATE forecast_state SET last_price = ? WHERE ticker = ?",
+                             (float(fetched[last_day][1]), ticker))
+            elif last_day < match['day']:
+                conn.execute("UPDATE forecast_state SET last_price = last_price * ? WHERE ticker = ?",
+                             (adjust, ticker))
+        explained = conn.execute(
+            "SELECT 1 FROM corporate_actions WHERE ticker = ? AND date > ? LIMIT 1", (ticker, match_date)
+        ).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+
+    metrics.increment('price_revisions')
+    if explained is None:
+        metrics.increment('price_revisions_unexplained')
+    return True
+
+
+def invalidate_derived(ticker: str) -> None:
+    """Drop data derived from ``ticker``'s stored prices."""
+    # Imported here because both modules import cache, which imports this one
+    import forecast
+    import portfolio
+    ticker = ticker.upper()
+    shared_arrays.invalidate(ticker)
+    forecast.invalidate(ticker)
+    portfolio.invalidate(ticker)
+    beta.invalidate(ticker)
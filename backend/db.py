@@ -0,0 +1,231 @@
+"""SQLite connection and schema migrations for the price cache.
+
+Kept free of heavy imports so the app can migrate the schema at startup
+without loading pandas or the HTTP stack. Migrations are applied in order
+and tracked with ``PRAGMA user_version``; ``init_db`` is idempotent and is
+run once from the app's lifespan hook (and by CLI tools before use).
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+DB_PATH = Path(os.environ.get("PRICE_CACHE_DB", Path(__file__).parent / "price_cache.db"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Each entry is one schema version; append new migrations, never edit old ones.
+MIGRATIONS = [
+    [
+        """
+        CREATE TABLE IF NOT EXISTS daily_prices (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            adj_close REAL,
+            volume INTEGER,
+            PRIMARY KEY (ticker, date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS cache_metadata (
+            ticker TEXT PRIMARY KEY,
+            last_updated TEXT
+        )
+        """,
+    ],
+    [
+        # Access tracking for LRU eviction (see retention.py)
+        "ALTER TABLE cache_metadata ADD COLUMN last_accessed TEXT",
+        "ALTER TABLE cache_metadata ADD COLUMN access_count INTEGER NOT NULL DEFAULT 0",
+    ],
+    [
+        # Tickers the upstream has no data for (see negative_cache.py)
+        """
+        CREATE TABLE IF NOT EXISTS negative_cache (
+            ticker TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+    ],
+    [
+        # UTC time of the last upstream fetch, for calendar-aware freshness
+        "ALTER TABLE cache_metadata ADD COLUMN fetched_at TEXT",
+    ],
+    [
+        # One packed array block of intraday bars per session (see intraday.py).
+        # Scalar columns come first so reading them never touches the BLOB.
+        """
+        CREATE TABLE IF NOT EXISTS intraday_blocks (
+            ticker TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            day TEXT NOT NULL,
+            bars INTEGER NOT NULL,
+            realized_variance REAL NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (ticker, interval, day)
+        )
+        """,
+    ],
+    [
+        # Fitted EWMA/GARCH parameters and filter state (see forecast.py)
+        """
+        CREATE TABLE IF NOT EXISTS forecast_state (
+            ticker TEXT PRIMARY KEY,
+            last_date TEXT NOT NULL,
+            last_price REAL NOT NULL,
+            observations INTEGER NOT NULL,
+            ewma_variance REAL NOT NULL,
+            omega REAL NOT NULL,
+            alpha REAL NOT NULL,
+            beta REAL NOT NULL,
+            garch_variance REAL NOT NULL,
+            fitted_observations INTEGER NOT NULL,
+            fitted_at TEXT NOT NULL
+        )
+        """,
+    ],
+    [
+        # Bars dropped or repaired at ingest (see quality.py)
+        """
+        CREATE TABLE IF NOT EXISTS price_flags (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            flag TEXT NOT NULL,
+            value REAL,
+            flagged_at TEXT NOT NULL,
+            PRIMARY KEY (ticker, date, flag)
+        )
+        """,
+    ],
+    [
+        # Splits and dividends reported by the chart API (see corporate_actions.py)
+        """
+        CREATE TABLE IF NOT EXISTS corporate_actions (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value REAL NOT NULL,
+            recorded_at TEXT NOT NULL,
+            PRIMARY KEY (ticker, date, kind)
+        )
+        """,
+    ],
+    [
+        # Compact daily bars keyed by integer ids and day numbers (see
+        # price_store.py); rows move over from daily_prices while serving.
+        """
+        CREATE TABLE IF NOT EXISTS tickers (
+            id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS prices (
+            ticker_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            adj_close REAL,
+            volume INTEGER,
+            PRIMARY KEY (ticker_id, day)
+        ) WITHOUT ROWID
+        """,
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+# Swapped for a query-timing wrapper only while a request is being
+# profiled (see profiling.py), so other requests connect directly.
+connect = sqlite3.connect
+
+
+def get_connection():
+    conn = connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def _startup_lock():
+    """Run ``init_db`` in one process at a time."""
+    with open(f"{DB_PATH}.init.lock", "a+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Switch an existing database to incremental auto-vacuum.
+
+    Needs one full ``VACUUM``, which rewrites the file under an exclusive
+    lock, so it only runs from ``init_db`` before the app serves requests.
+    Returns True if a conversion was done.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def init_db() -> int:
+    """Apply pending migrations and return the resulting schema version.
+
+    Concurrently starting workers take turns, so a database from before
+    incremental auto-vacuum is converted once while the others wait.
+    """
+    with _startup_lock():
+        return _init_db()
+
+
+def _init_db() -> int:
+    conn = get_connection()
+    try:
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            # auto_vacuum can only be switched on before the first table is
+            # created; older files are converted below.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL lets readers carry on while maintenance and writes commit.
+        conn.execute("PRAGMA journal_mode = WAL")
+        # IMMEDIATE takes the write lock up front so concurrently starting
+        # workers apply each migration exactly once.
+        conn.execute("BEGIN IMMEDIATE")
+        version = schema_version(conn)
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+            version += 1
+            conn.execute(f"PRAGMA user_version = {version}")
+        legacy = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_prices'"
+        ).fetchone()
+        if legacy and conn.execute("SELECT 1 FROM daily_prices LIMIT 1").fetchone() is None:
+            # Nothing left to move to the compact layout
+            conn.execute("DROP TABLE daily_prices")
+        conn.commit()
+        enable_incremental_vacuum(conn)
+        return version
+    finally:
+        conn.close()
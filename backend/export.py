@@ -0,0 +1,88 @@
+"""Streaming export of full per-ticker daily series as NDJSON or CSV.
+
+Rows come straight off the cache cursor in chunks and through
+``compute.RollingSeries``, so each request holds one chunk plus a small
+amount of rolling state per ticker in memory, however long the history
+or however many tickers are requested.
+"""
+import csv
+import io
+import json
+import math
+from typing import Iterator, List, Optional
+
+import compute
+from cache import iter_cached_rows
+
+EXPORT_FIELDS = ['ticker', 'date', 'close', 'adj_close', 'log_return', 'vol_30d', 'vol_90d', 'rsi_14d']
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 5000
+
+
+def _nullable(values) -> list:
+    # NaN/inf aren't valid JSON; export them as null / empty CSV cells
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+def iter_ticker_rows(
+    ticker: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[List[tuple]]:
+    """Yield lists of export rows (in ``EXPORT_FIELDS`` order) for one ticker.
+
+    Rolling metrics are warmed up on history before ``start`` so the first
+    exported rows match a full-history computation.
+    """
+    ticker = ticker.upper()
+    series = compute.RollingSeries()
+    for dates, columns in iter_cached_rows(ticker, end, chunk_size):
+        metrics = series.update(columns['adj_close'])
+        rows = list(zip(
+            [ticker] * len(dates),
+            dates,
+            _nullable(columns['close']),
+            _nullable(columns['adj_close']),
+            _nullable(metrics['log_return']),
+            _nullable(metrics['vol_30d']),
+            _nullable(metrics['vol_90d']),
+            _nullable(metrics['rsi']),
+        ))
+        if start and dates[-1] < start:
+            continue
+        if start and dates[0] < start:
+            rows = [row for row in rows if row[1] >= start]
+        yield rows
+
+
+def stream_ndjson(tickers: List[str], start: Optional[str] = None, end: Optional[str] = None,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    for ticker in tickers:
+        for rows in iter_ticker_rows(ticker, start, end, chunk_size):
+            yield ''.join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n' for row in rows)
+
+
+def stream_csv(tickers: List[str], start: Optional[str] = None, end: Optional[str] = None,
+               chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for ticker in tickers:
+        for rows in iter_ticker_rows(ticker, start, end, chunk_size):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_export(fmt: str, tickers: List[str], start: Optional[str] = None,
+                  end: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    if fmt == 'csv':
+        return stream_csv(tickers, start, end, chunk_size)
+    return stream_ndjson(tickers, start, end, chunk_size)
@@ -0,0 +1,319 @@
+"""EWMA and GARCH(1,1) volatility forecasts from persisted filter state.
+
+Both models are variance filters over daily log returns:
+
+    EWMA (RiskMetrics)  s2[t+1] = lam * s2[t] + (1 - lam) * r[t]^2
+    GARCH(1,1)          s2[t+1] = omega + alpha * r[t]^2 + beta * s2[t]
+
+GARCH parameters are fitted by Gaussian maximum likelihood with variance
+targeting (omega = mean(r^2) * (1 - alpha - beta)), leaving a
+two-parameter Nelder-Mead search. Fitting is the only costly step, so
+each ticker's parameters and next-day variances are stored in
+``forecast_state``. New bars just roll both filters forward by one
+multiply-add per bar, and GARCH is refitted, warm-started from the
+previous parameters, once ``FORECAST_REFIT_DAYS`` new returns have
+accumulated. A small per-process LRU keyed on the last completed session
+lets repeat requests build forecasts straight from the state.
+
+Settings come from the environment:
+
+    FORECAST_FIT_YEARS   years of returns GARCH is fitted over
+    FORECAST_REFIT_DAYS  new returns before GARCH is refitted
+    FORECAST_CACHE_SIZE  ticker states kept per process
+"""
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import compute
+import trading_calendar
+from cache import fetch_and_cache
+from compute import TRADING_DAYS_PER_YEAR
+from db import get_connection
+
+FORECAST_FIT_YEARS = int(os.environ.get("FORECAST_FIT_YEARS", "5"))
+FORECAST_REFIT_DAYS = int(os.environ.get("FORECAST_REFIT_DAYS", "21"))
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", "32"))
+EWMA_LAMBDA = 0.94
+DEFAULT_HORIZONS = (1, 5, 10, 21, 63)
+MAX_PERSISTENCE = 0.999
+MIN_OBSERVATIONS = 100
+
+# Cold fits start from typical daily equity parameters
+INITIAL_ALPHA, INITIAL_BETA = 0.08, 0.90
+
+
+class ForecastState(NamedTuple):
+    last_date: str
+    last_price: float
+    observations: int
+    ewma_variance: float    # next-day variance
+    omega: float
+    alpha: float
+    beta: float
+    garch_variance: float   # next-day variance
+    fitted_observations: int
+    fitted_at: str
+
+
+_lock = threading.Lock()
+# ticker -> (session, state, realized vols)
+_states: Dict[str, Tuple[object, ForecastState, Dict[str, Optional[float]]]] = {}
+
+
+def clear_cache() -> None:
+    with _lock:
+        _states.clear()
+
+
+def invalidate(ticker: str) -> None:
+    with _lock:
+        _states.pop(ticker, None)
+
+
+def _nelder_mead(fn: Callable[[np.ndarray], float], x0: np.ndarray, step: float,
+                 max_iter: int, tol: float = 1e-9) -> np.ndarray:
+    """Minimize ``fn`` from ``x0`` with the standard Nelder-Mead simplex.
+
+    Stops once the simplex values agree to ``tol`` relative to the best.
+    """
+    simplex = np.vstack([x0, x0 + np.eye(len(x0)) * step])
+    values = np.array([fn(x) for x in simplex])
+    for _ in range(max_iter):
+        order = np.argsort(values)
+        simplex, values = simplex[order], values[order]
+        if values[-1] - values[0] <= tol * abs(values[0]):
+            break
+        centroid = simplex[:-1].mean(axis=0)
+        reflected = centroid + (centroid - simplex[-1])
+        f_reflected = fn(reflected)
+        if f_reflected < values[0]:
+            expanded = centroid + 2 * (centroid - simplex[-1])
+            f_expanded = fn(expanded)
+            if f_expanded < f_reflected:
+                simplex[-1], values[-1] = expanded, f_expanded
+            else:
+                simplex[-1], values[-1] = reflected, f_reflected
+        elif f_reflected < values[-2]:
+            simplex[-1], values[-1] = reflected, f_reflected
+        else:
+            contracted = centroid + 0.5 * (simplex[-1] - centroid)
+            f_contracted = fn(contracted)
+            if f_contracted < values[-1]:
+                simplex[-1], values[-1] = contracted, f_contracted
+            else:
+                simplex[1:] = simplex[0] + 0.5 * (simplex[1:] - simplex[0])
+                values[1:] = [fn(x) for x in simplex[1:]]
+    return simplex[np.argmin(values)]
+
+
+def _to_params(x: np.ndarray) -> Tuple[float, float]:
+    # alpha, beta > 0 and alpha + beta < MAX_PERSISTENCE for any real x
+    persistence = MAX_PERSISTENCE / (1 + np.exp(-x[0]))
+    alpha = persistence / (1 + np.exp(-x[1]))
+    return float(alpha), float(persistence - alpha)
+
+
+def _from_params(alpha: float, beta: float) -> np.ndarray:
+    persistence = alpha + beta
+    return np.array([np.log(persistence / (MAX_PERSISTENCE - persistence)), np.log(alpha / beta)])
+
+
+def garch_filter(squared: Sequence[float], omega: float, alpha: float, beta: float,
+                 variance: float) -> Tuple[float, float]:
+    """Run the GARCH recursion from ``variance``; return (next variance, NLL)."""
+    nll = 0.0
+    log = math.log
+    for r2 in squared:
+        nll += log(variance) + r2 / variance
+        variance = omega + alpha * r2 + beta * variance
+    return variance, 0.5 * nll
+
+
+def ewma_filter(squared: Sequence[float], variance: float, lam: float = EWMA_LAMBDA) -> float:
+    for r2 in squared:
+        variance = lam * variance + (1 - lam) * r2
+    return variance
+
+
+def fit_garch(returns: np.ndarray, start: Optional[Tuple[float, float]] = None) -> Tuple[float, float, float]:
+    """Fit (omega, alpha, beta) by maximum likelihood with variance targeting.
+
+    ``start`` warm-starts the search from earlier parameters with a
+    smaller simplex and iteration budget.
+    """
+    squared = (returns * returns).tolist()
+    target = float(np.mean(squared))
+
+    def nll(x: np.ndarray) -> float:
+        alpha, beta = _to_params(x)
+        return garch_filter(squared, target * (1 - alpha - beta), alpha, beta, target)[1]
+
+    if start is None:
+        x = _nelder_mead(nll, _from_params(INITIAL_ALPHA, INITIAL_BETA), step=0.5, max_iter=200)
+    else:
+        x = _nelder_mead(nll, _from_params(*start), step=0.05, max_iter=60)
+    alpha, beta = _to_params(x)
+    return target * (1 - alpha - beta), alpha, beta
+
+
+def _fit(dates: np.ndarray, prices: np.ndarray, returns: np.ndarray,
+         start: Optional[Tuple[float, float]] = None) -> ForecastState:
+    window = returns[-FORECAST_FIT_YEARS * TRADING_DAYS_PER_YEAR:]
+    omega, alpha, beta = fit_garch(window, start)
+    squared = (window * window).tolist()
+    target = float(np.mean(squared))
+    garch_variance, _ = garch_filter(squared, omega, alpha, beta, target)
+    # RiskMetrics seeds with the variance of the first month
+    ewma_variance = ewma_filter(squared, float(np.mean(squared[:21])))
+    return ForecastState(
+        last_date=np.datetime_as_string(dates[-1], unit='D'),
+        last_price=float(prices[-1]),
+        observations=len(returns),
+        ewma_variance=ewma_variance,
+        omega=omega, alpha=alpha, beta=beta,
+        garch_variance=garch_variance,
+        fitted_observations=len(returns),
+        fitted_at=datetime.now().isoformat(timespec='seconds'),
+    )
+
+
+def update_state(dates: np.ndarray, prices: np.ndarray,
+                 state: Optional[ForecastState] = None) -> ForecastState:
+    """Bring ``state`` up to the last price, fitting only when needed.
+
+    The state is rebuilt from scratch if its last bar is no longer in the
+    series or its price changed (e.g. revised adjusted closes).
+    """
+    returns = compute.log_returns(prices)[1:]
+    if len(returns) < MIN_OBSERVATIONS:
+        raise ValueError(f"Not enough data to forecast volatility ({len(returns)} returns)")
+
+    day_strs = np.datetime_as_string(dates, unit='D')
+    if state is not None:
+        at = int(np.searchsorted(day_strs, state.last_date))
+        if at >= len(day_strs) or day_strs[at] != state.last_date \
+                or not np.isclose(prices[at], state.last_price, rtol=1e-9):
+            state = None
+    if state is None:
+        return _fit(dates, prices, returns)
+
+    new = returns[at:]
+    if not len(new):
+        return state
+    observations = state.observations + len(new)
+    if observations - state.fitted_observations >= FORECAST_REFIT_DAYS:
+        return _fit(dates, prices, returns, start=(state.alpha, state.beta))
+
+    squared = (new * new).tolist()
+    garch_variance, _ = garch_filter(squared, state.omega, state.alpha, state.beta, state.garch_variance)
+    return state._replace(
+        last_date=day_strs[-1],
+        last_price=float(prices[-1]),
+        observations=observations,
+        ewma_variance=ewma_filter(squared, state.ewma_variance),
+        garch_variance=garch_variance,
+    )
+
+
+def load_state(ticker: str) -> Optional[ForecastState]:
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(ForecastState._fields)} FROM forecast_state WHERE ticker = ?",
+            (ticker,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return ForecastState(*row) if row else None
+
+
+def save_state(ticker: str, state: ForecastState) -> None:
+    conn = get_connection()
+    try:
+        conn.execute(
+            f"INSERT OR REPLACE INTO forecast_state (ticker, {', '.join(ForecastState._fields)}) "
+            f"VALUES (?{', ?' * len(ForecastState._fields)})",
+            (ticker, *state),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def term_structure(state: ForecastState, horizons: Sequence[int]) -> Dict[str, List[dict]]:
+    """Annualized average vol over each horizon for both models.
+
+    GARCH variance mean-reverts geometrically to omega / (1 - alpha - beta);
+    EWMA has no mean reversion, so its term structure is flat.
+    """
+    persistence = state.alpha + state.beta
+    long_run = state.omega / (1 - persistence)
+    gap = state.garch_variance - long_run
+    garch, ewma = [], []
+    for h in horizons:
+        # sum over k = 1..h of persistence^(k-1)
+        decay = h if persistence == 1 else (1 - persistence ** h) / (1 - persistence)
+        mean_variance = long_run + gap * decay / h
+        garch.append({"horizon": h, "vol": round(float(np.sqrt(mean_variance * TRADING_DAYS_PER_YEAR)), 4)})
+        ewma.append({"horizon": h, "vol": round(float(np.sqrt(state.ewma_variance * TRADING_DAYS_PER_YEAR)), 4)})
+    return {"garch": garch, "ewma": ewma}
+
+
+def get_state(ticker: str) -> Tuple[ForecastState, Dict[str, Optional[float]]]:
+    """Current state and realized vols, updated from the price cache when needed."""
+    ticker = ticker.upper()
+    session = trading_calendar.last_completed_session()
+    with _lock:
+        held = _states.pop(ticker, None)
+        if held is not None:
+            _states[ticker] = held
+    if held is not None and held[0] == session:
+        return held[1], held[2]
+
+    df = fetch_and_cache(ticker, years=FORECAST_FIT_YEARS)
+    dates = df.index.values
+    prices = compute.as_float_array(df['adj_close'])
+    previous = held[1] if held is not None else load_state(ticker)
+    state = update_state(dates, prices, previous)
+    if state != previous:
+        save_state(ticker, state)
+
+    log_return = compute.log_returns(prices)
+    realized = {}
+    for window in (30, 90):
+        vol = compute.annualized_vol(log_return, window)[-1]
+        realized[f"vol_{window}d"] = None if np.isnan(vol) else round(float(vol), 4)
+    if not df.attrs.get('stale', False) and FORECAST_CACHE_SIZE > 0:
+        with _lock:
+            _states.pop(ticker, None)
+            _states[ticker] = (session, state, realized)
+            while len(_states) > FORECAST_CACHE_SIZE:
+                # Dicts keep insertion order, so the first key is least recently used
+                del _states[next(iter(_states))]
+    return state, realized
+
+
+def calculate_forecast(ticker: str, horizons: Sequence[int] = DEFAULT_HORIZONS) -> dict:
+    """EWMA and GARCH(1,1) vol forecasts next to the realized 30d/90d vol."""
+    state, realized = get_state(ticker)
+    persistence = state.alpha + state.beta
+    return {
+        "ticker": ticker.upper(),
+        "data_as_of": state.last_date,
+        **realized,
+        "ewma": {"lambda": EWMA_LAMBDA},
+        "garch": {
+            "omega": state.omega,
+            "alpha": round(state.alpha, 4),
+            "beta": round(state.beta, 4),
+            "persistence": round(persistence, 4),
+            "long_run_vol": round(float(np.sqrt(state.omega / (1 - persistence) * TRADING_DAYS_PER_YEAR)), 4),
+            "fitted_at": state.fitted_at,
+        },
+        "forecasts": term_structure(state, horizons),
+    }
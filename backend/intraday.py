@@ -0,0 +1,243 @@
+"""Intraday bars stored as one array block per ticker, interval and session.
+
+Minute data is ~390 rows per ticker per day, too many to store a row
+per bar as the daily ``prices`` table does. Each session's bars are
+instead packed into a single BLOB (a float64 array of timestamp, open,
+high, low, close and volume columns), keyed by ``(ticker, interval,
+day)``. The day's realized variance (sum of squared intraday log returns of the close) and
+bar count are computed at ingest and kept in ordinary columns ahead of the
+BLOB, so realized-vol range queries read a few hundred index-ordered
+scalars per year and never touch the bar data.
+
+Only completed sessions are stored, so a stored day never changes after
+the close except by an explicit re-ingest.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import cache
+import trading_calendar
+import upstream
+from compute import TRADING_DAYS_PER_YEAR
+from db import get_connection
+
+# interval -> (max days per request, max days back Yahoo serves)
+INTERVAL_LIMITS = {
+    '1m': (7, 30),
+    '2m': (60, 60),
+    '5m': (60, 60),
+    '15m': (60, 60),
+    '30m': (60, 60),
+    '60m': (730, 730),
+}
+FIELDS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+
+
+def _pack(block: np.ndarray) -> bytes:
+    return np.ascontiguousarray(block, dtype=np.float64).tobytes()
+
+
+def _unpack(blob: bytes, bars: int) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float64).reshape(len(FIELDS), bars)
+
+
+def realized_variance(close: np.ndarray) -> float:
+    """Sum of squared log returns between consecutive bars of one session."""
+    if len(close) < 2:
+        return 0.0
+    returns = np.diff(np.log(close))
+    return float(np.dot(returns, returns))
+
+
+def session_days(ts: np.ndarray) -> np.ndarray:
+    """Exchange-local session date (datetime64[D]) of each epoch timestamp."""
+    local = pd.to_datetime(ts, unit='s', utc=True).tz_convert(trading_calendar.EXCHANGE_TZ)
+    return local.tz_localize(None).values.astype('datetime64[D]')
+
+
+def ingest(ticker: str, interval: str, ts, open_, high, low, close, volume,
+           through: Optional[date] = None) -> int:
+    """Store bars, merging with blocks already held for the same sessions.
+
+    Bars without a positive close are dropped, as are sessions after ``through``
+    (default: the last completed session). Returns the sessions written.
+    """
+    ticker = ticker.upper()
+    through = through or trading_calendar.last_completed_session()
+    data = np.vstack([np.asarray(col, dtype=np.float64) for col in (ts, open_, high, low, close, volume)])
+    # log of a zero or negative close would make the realized variance NaN
+    data = data[:, ~np.isnan(data[4]) & (data[4] > 0)]
+    if not data.shape[1]:
+        return 0
+
+    days = session_days(data[0])
+    keep = days <= np.datetime64(through, 'D')
+    data, days = data[:, keep], days[keep]
+    if not data.shape[1]:
+        return 0
+
+    order = np.lexsort((data[0], days))
+    data, days = data[:, order], days[order]
+    unique_days, starts = np.unique(days, return_index=True)
+    day_strs = np.datetime_as_string(unique_days, unit='D').tolist()
+
+    conn = get_connection()
+    try:
+        existing = {
+            row['day']: _unpack(row['data'], row['bars'])
+            for row in conn.execute("""
+                SELECT day, bars, data FROM intraday_blocks
+                WHERE ticker = ? AND interval = ? AND day >= ? AND day <= ?
+            """, (ticker, interval, day_strs[0], day_strs[-1]))
+        }
+        rows = []
+        for day, block in zip(day_strs, np.split(data, starts[1:], axis=1)):
+            if day in existing:
+                # New bars win over stored ones with the same timestamp
+                merged = np.hstack([existing[day], block])
+                _, last = np.unique(merged[0][::-1], return_index=True)
+                block = merged[:, merged.shape[1] - 1 - last]
+            rows.append((ticker, interval, day, block.shape[1],
+                         realized_variance(block[4]), _pack(block)))
+        conn.executemany("""
+            INSERT OR REPLACE INTO intraday_blocks
+            (ticker, interval, day, bars, realized_variance, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def get_bars(ticker: str, interval: str, start: str, end: str) -> Dict[str, np.ndarray]:
+    """Bars for sessions ``start``..``end`` (inclusive) as float64 arrays."""
+    conn = get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT bars, data FROM intraday_blocks
+            WHERE ticker = ? AND interval = ? AND day >= ? AND day <= ?
+            ORDER BY day
+        """, (ticker.upper(), interval, start, end)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return {name: np.empty(0) for name in FIELDS}
+    data = np.hstack([_unpack(row['data'], row['bars']) for row in rows])
+    return dict(zip(FIELDS, data))
+
+
+def get_realized_variance(ticker: str, interval: str, start: str, end: str) -> List[dict]:
+    """Per-session realized variance, without reading any bar data."""
+    conn = get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT day, bars, realized_variance FROM intraday_blocks
+            WHERE ticker = ? AND interval = ? AND day >= ? AND day <= ?
+            ORDER BY day
+        """, (ticker.upper(), interval, start, end)).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def latest_day(ticker: str, interval: str) -> Optional[date]:
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT MAX(day) FROM intraday_blocks WHERE ticker = ? AND interval = ?",
+            (ticker.upper(), interval),
+        ).fetchone()
+    finally:
+        conn.close()
+    return date.fromisoformat(row[0]) if row[0] else None
+
+
+def fetch_intraday(ticker: str, interval: str, start: datetime, end: datetime) -> Dict[str, np.ndarray]:
+    """Fetch bars from Yahoo in request-sized windows."""
+    ticker = ticker.upper()
+    span, _ = INTERVAL_LIMITS[interval]
+    url = f"{cache.YAHOO_CHART_URL}/{ticker}"
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
+    }
+    parts = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + timedelta(days=span), end)
+        params = {
+            "period1": int(window_start.timestamp()),
+            "period2": int(window_end.timestamp()),
+            "interval": interval,
+        }
+        response = upstream.get(url, params=params, headers=headers)
+        if response.status_code == 404:
+            raise cache.NoDataError(f"No data found for ticker: {ticker}")
+        response.raise_for_status()
+        result = (response.json().get("chart") or {}).get("result")
+        if result and result[0].get("timestamp"):
+            quote = result[0]["indicators"]["quote"][0]
+            parts.append(np.vstack([
+                np.asarray(result[0]["timestamp"], dtype=np.float64),
+                *(np.array(quote[name], dtype=np.float64) for name in FIELDS[1:]),
+            ]))
+        window_start = window_end
+
+    if not parts:
+        raise cache.NoDataError(f"No {interval} data found for ticker: {ticker}")
+    return dict(zip(FIELDS, np.hstack(parts)))
+
+
+def update(ticker: str, interval: str) -> int:
+    """Fetch sessions completed since the last stored one; return sessions written."""
+    session = trading_calendar.last_completed_session()
+    latest = latest_day(ticker, interval)
+    if latest is not None and latest >= session:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    _, max_back = INTERVAL_LIMITS[interval]
+    start = now - timedelta(days=max_back - 1)
+    if latest is not None:
+        start = max(start, datetime.combine(latest + timedelta(days=1), datetime.min.time(), timezone.utc))
+    try:
+        bars = fetch_intraday(ticker, interval, start, now)
+    except cache.NoDataError:
+        if latest is None:
+            raise
+        # Nothing newer upstream yet; the stored sessions still stand
+        return 0
+    return ingest(ticker, interval, *(bars[name] for name in FIELDS), through=session)
+
+
+def calculate_realized_volatility(ticker: str, interval: str = '5m',
+                                  start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """Daily realized variance and annualized realized vol per session."""
+    if interval not in INTERVAL_LIMITS:
+        raise ValueError(f"Unsupported interval: {interval}")
+    update(ticker, interval)
+    end = end or date.today()
+    start = start or end - timedelta(days=INTERVAL_LIMITS[interval][1])
+    days = get_realized_variance(ticker, interval, start.isoformat(), end.isoformat())
+    if not days:
+        raise ValueError(f"No {interval} data for {ticker.upper()} between {start} and {end}")
+
+    rv = np.array([d['realized_variance'] for d in days])
+    return {
+        "ticker": ticker.upper(),
+        "interval": interval,
+        # Mean daily variance over the window, annualized
+        "realized_vol": round(float(np.sqrt(rv.mean() * TRADING_DAYS_PER_YEAR)), 4),
+        "days": [
+            {
+                "date": d['day'],
+                "bars": d['bars'],
+                "realized_variance": round(d['realized_variance'], 8),
+                "realized_vol": round(float(np.sqrt(d['realized_variance'] * TRADING_DAYS_PER_YEAR)), 4),
+            }
+            for d in days
+        ],
+    }
@@ -1,8 +1,143 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import os
+import secrets
+import sys
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Dict, List, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from volatility import calculate_volatility
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+import metrics
+import price_store
+import retention
+from db import init_db
+
+# Admin endpoints are disabled unless a token is configured.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MAX_BATCH_TICKERS = 50
+MAX_RISK_PATHS = 5_000_000
+# Most-accessed tickers mapped into memory before the worker reports ready
+CACHE_WARMUP_TICKERS = int(os.environ.get("CACHE_WARMUP_TICKERS", "0"))
+
+
+async def cache_maintenance_loop(interval: float):
+    """Periodically apply cache retention limits off the event loop.
+
+    Only the worker holding the maintenance lock applies them; the others
+    just persist their own access stamps.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if retention.claim_maintenance():
+                await asyncio.to_thread(retention.run_maintenance)
+            else:
+                await asyncio.to_thread(retention.flush_access_log)
+        except Exception:
+            metrics.increment('cache_maintenance_errors')
+
+
+async def migrate_prices():
+    """Move legacy daily bars to the compact layout a batch at a time."""
+    try:
+        while await asyncio.to_thread(price_store.migrate_batch):
+            # Let request writes in between batches
+            await asyncio.sleep(price_store.PRICES_MIGRATION_PAUSE)
+    except Exception:
+        # Tickers still move on first touch; the next start resumes the rest
+        metrics.increment('prices_migration_errors')
+
+
+async def warm_cache(app: FastAPI, limit: int):
+    """Map the hottest tickers' price arrays, then mark the worker ready."""
+    from cache import warm_arrays
+    try:
+        stats = await asyncio.to_thread(warm_arrays, limit)
+        for name, value in stats.items():
+            metrics.set_gauge(f'warmup_{name}', value)
+    except Exception:
+        # A cold cache is slower, not broken
+        metrics.increment('warmup_errors')
+    app.state.ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema migrations run once per worker at startup rather than as a
+    # side effect of importing the cache module.
+    init_db()
+    migration = None
+    if price_store.migration_pending():
+        migration = asyncio.create_task(migrate_prices())
+    app.state.ready = False
+    warmup = None
+    if CACHE_WARMUP_TICKERS > 0:
+        warmup = asyncio.create_task(warm_cache(app, CACHE_WARMUP_TICKERS))
+    else:
+        app.state.ready = True
+    maintenance = None
+    if retention.CACHE_MAINTENANCE_INTERVAL > 0:
+        maintenance = asyncio.create_task(cache_maintenance_loop(retention.CACHE_MAINTENANCE_INTERVAL))
+    yield
+    if migration is not None:
+        migration.cancel()
+    if warmup is not None:
+        warmup.cancel()
+    if maintenance is not None:
+        maintenance.cancel()
+    retention.release_maintenance()
+    retention.flush_access_log()
+    if 'cache' in sys.modules:
+        sys.modules['cache'].shutdown_refresh()
+    if 'upstream' in sys.modules:
+        sys.modules['upstream'].close_session()
 
-app = FastAPI(title="Volatility Analysis API")
+
+class ProfileMiddleware:
+    """Profile a request sent with ``X-Profile: 1`` and the admin token (see profiling.py).
+
+    The profile id comes back in the ``X-Profile-Id`` response header.
+    Without a configured token this passes every request straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ADMIN_TOKEN or scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        if headers.get(b'x-profile', b'').lower() not in (b'1', b'true'):
+            return await self.app(scope, receive, send)
+        token = headers.get(b'x-admin-token', b'').decode('latin-1')
+        if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+            response = JSONResponse({"detail": "Invalid admin token"}, status_code=403)
+            return await response(scope, receive, send)
+
+        import profiling
+        query = scope.get('query_string', b'').decode('latin-1')
+        profile = profiling.begin(f"{scope['method']} {scope['path']}" + (f"?{query}" if query else ""))
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message = {**message, 'headers': [*message.get('headers', []),
+                                                  (b'x-profile-id', profile.id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiling.end(profile, status)
+
+
+app = FastAPI(title="Volatility Analysis API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,19 +146,322 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfileMiddleware)
+
+
+def _ticker(ticker: str) -> str:
+    """``ticker`` as given, or a 422 if it isn't a valid symbol."""
+    if not price_store.valid_ticker(ticker):
+        raise HTTPException(status_code=422, detail=f"Invalid ticker: {ticker!r}")
+    return ticker
+
+
+def _volatility_fields(fields: Optional[str]) -> dict:
+    """Keyword arguments limiting the payload to comma-separated ``fields``."""
+    if fields is None:
+        return {}
+    from volatility import resolve_fields
+    try:
+        return {"fields": resolve_fields(fields.split(','))}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/api/volatility")
+def get_volatility_batch(tickers: str, lookback_years: int = 5,
+                         rank_window_years: Optional[int] = Query(None, ge=1),
+                         fields: Optional[str] = None):
+    """Volatility for many comma-separated tickers; failures are reported per ticker."""
+    from volatility import calculate_volatility
+    from upstream import UpstreamUnavailable
+
+    selected = _volatility_fields(fields)
+
+    symbols = list(dict.fromkeys(_ticker(t.strip().upper()) for t in tickers.split(',') if t.strip()))
+    if not symbols:
+        raise HTTPException(status_code=422, detail="At least one ticker is required")
+    if len(symbols) > MAX_BATCH_TICKERS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_TICKERS} tickers per request")
+
+    results, errors = {}, {}
+    for symbol in symbols:
+        try:
+            results[symbol] = calculate_volatility(symbol, lookback_years, rank_window_years, **selected)
+        except ValueError as e:
+            errors[symbol] = {"status": 404, "detail": str(e)}
+        except UpstreamUnavailable as e:
+            errors[symbol] = {"status": 503, "detail": str(e)}
+        except Exception as e:
+            errors[symbol] = {"status": 500, "detail": f"Error calculating volatility: {str(e)}"}
+    return {"results": results, "errors": errors}
 
 
 @app.get("/api/volatility/{ticker}")
-async def get_volatility(ticker: str, lookback_years: int = 5):
+def get_volatility(ticker: str, lookback_years: int = 5, as_of: Optional[date] = None,
+                   rank_window_years: Optional[int] = Query(None, ge=1),
+                   fields: Optional[str] = None):
+    # Imported on first use so worker boot and /api/health don't pay for
+    # pandas, numpy and requests.
+    from volatility import calculate_volatility, calculate_volatility_as_of
+    from upstream import UpstreamUnavailable
+
+    ticker = _ticker(ticker)
+    selected = _volatility_fields(fields)
+
+    # A plain def runs in the threadpool, so upstream backoff and rate
+    # limiting never block the event loop.
     try:
-        result = calculate_volatility(ticker, lookback_years)
-        return result
+        if as_of is not None:
+            return calculate_volatility_as_of(ticker, as_of, lookback_years, rank_window_years, **selected)
+        return calculate_volatility(ticker, lookback_years, rank_window_years, **selected)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating volatility: {str(e)}")
 
 
+@app.get("/api/volatility/{ticker}/forecast")
+def get_volatility_forecast(ticker: str, horizons: Optional[str] = None):
+    """EWMA and GARCH(1,1) vol forecasts for comma-separated horizons in trading days."""
+    from forecast import DEFAULT_HORIZONS, calculate_forecast
+    from upstream import UpstreamUnavailable
+
+    ticker = _ticker(ticker)
+    if horizons is None:
+        days = list(DEFAULT_HORIZONS)
+    else:
+        try:
+            days = [int(h) for h in horizons.split(',') if h.strip()]
+        except ValueError:
+            raise HTTPException(status_code=422, detail="horizons must be comma-separated integers")
+        if not days or not all(1 <= h <= 252 for h in days):
+            raise HTTPException(status_code=422, detail="horizons must be between 1 and 252 trading days")
+
+    try:
+        return calculate_forecast(ticker, days)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating forecast: {str(e)}")
+
+
+@app.get("/api/volatility/{ticker}/as-of")
+def get_volatility_as_of_many(ticker: str, dates: str, lookback_years: int = 5,
+                              include_history: bool = False, fields: Optional[str] = None):
+    """Evaluate many comma-separated as-of dates for one ticker from cache."""
+    from volatility import calculate_volatility_as_of_many
+
+    ticker = _ticker(ticker)
+    selected = _volatility_fields(fields)
+
+    try:
+        as_of_dates = [date.fromisoformat(d.strip()) for d in dates.split(',') if d.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="dates must be comma-separated YYYY-MM-DD values")
+    if not as_of_dates:
+        raise HTTPException(status_code=422, detail="At least one date is required")
+
+    try:
+        return {
+            "ticker": ticker.upper(),
+            "results": calculate_volatility_as_of_many(
+                ticker, as_of_dates, lookback_years, include_history=include_history, **selected
+            ),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating volatility: {str(e)}")
+
+
+class PortfolioRequest(BaseModel):
+    weights: Dict[str, float]
+    lookback_years: int = Field(5, ge=1)
+
+
+def _portfolio_weights(raw: Dict[str, float]) -> Dict[str, float]:
+    weights = {}
+    for ticker, weight in raw.items():
+        symbol = ticker.strip().upper()
+        if not price_store.valid_ticker(symbol) or symbol in weights:
+            raise HTTPException(status_code=422, detail=f"Invalid or duplicate ticker: {ticker!r}")
+        weights[symbol] = weight
+    if not weights:
+        raise HTTPException(status_code=422, detail="At least one ticker is required")
+    if len(weights) > MAX_BATCH_TICKERS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_TICKERS} tickers per request")
+    if not any(weights.values()):
+        raise HTTPException(status_code=422, detail="At least one weight must be non-zero")
+    return weights
+
+
+@app.post("/api/portfolio/volatility")
+def get_portfolio_volatility(request: PortfolioRequest):
+    """Portfolio vol and per-name risk contributions for ticker weights."""
+    from portfolio import calculate_portfolio_volatility
+    from upstream import UpstreamUnavailable
+
+    weights = _portfolio_weights(request.weights)
+    try:
+        return calculate_portfolio_volatility(weights, request.lookback_years)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating portfolio volatility: {str(e)}")
+
+
+class RiskRequest(PortfolioRequest):
+    method: str = "historical"
+    confidences: List[float] = [0.95, 0.99]
+    horizons: List[int] = [1, 10]
+    paths: int = Field(100_000, ge=1000, le=MAX_RISK_PATHS)
+    seed: int = Field(0, ge=0)
+
+
+@app.post("/api/risk/var")
+def get_value_at_risk(request: RiskRequest):
+    """Historical or Monte Carlo VaR and ES for ticker weights."""
+    from risk import RISK_METHODS, calculate_var
+    from upstream import UpstreamUnavailable
+
+    weights = _portfolio_weights(request.weights)
+    if request.method not in RISK_METHODS:
+        raise HTTPException(status_code=422, detail=f"method must be one of: {', '.join(RISK_METHODS)}")
+    if not request.confidences or not all(0.5 <= c < 1 for c in request.confidences):
+        raise HTTPException(status_code=422, detail="confidences must be in [0.5, 1)")
+    if not request.horizons or not all(1 <= h <= 252 for h in request.horizons):
+        raise HTTPException(status_code=422, detail="horizons must be between 1 and 252 trading days")
+
+    try:
+        return calculate_var(weights, request.method, request.confidences, request.horizons,
+                             request.lookback_years, request.paths, request.seed)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating VaR: {str(e)}")
+
+
+@app.get("/api/intraday/{ticker}/realized-vol")
+def get_realized_volatility(ticker: str, interval: str = "5m",
+                            start: Optional[date] = None, end: Optional[date] = None):
+    """Daily realized variance and vol from intraday bars."""
+    from intraday import INTERVAL_LIMITS, calculate_realized_volatility
+    from upstream import UpstreamUnavailable
+
+    ticker = _ticker(ticker)
+    if interval not in INTERVAL_LIMITS:
+        raise HTTPException(status_code=422, detail=f"interval must be one of: {', '.join(INTERVAL_LIMITS)}")
+    try:
+        return calculate_realized_volatility(ticker, interval, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating realized volatility: {str(e)}")
+
+
+@app.get("/api/quality/{ticker}")
+def get_quality_report(ticker: str, limit: int = Query(100, ge=1, le=10_000)):
+    """Bars dropped or repaired when ``ticker`` was ingested."""
+    from quality import get_report
+    return get_report(_ticker(ticker), limit)
+
+
+@app.get("/api/export")
+def export_series(tickers: str, format: str = "ndjson",
+                  start: Optional[date] = None, end: Optional[date] = None):
+    """Stream full cached daily series with log return, vols and RSI."""
+    from cache import has_cached_data
+    from export import EXPORT_FORMATS, stream_export
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    symbols = [_ticker(t.strip().upper()) for t in tickers.split(',') if t.strip()]
+    if not symbols:
+        raise HTTPException(status_code=422, detail="At least one ticker is required")
+    missing = [t for t in symbols if not has_cached_data(t)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"No cached data for: {', '.join(missing)}")
+
+    headers = {}
+    if format == 'csv':
+        headers['Content-Disposition'] = 'attachment; filename="export.csv"'
+    return StreamingResponse(
+        stream_export(format, symbols,
+                      start.isoformat() if start else None,
+                      end.isoformat() if end else None),
+        media_type=EXPORT_FORMATS[format],
+        headers=headers,
+    )
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/api/admin/negative-cache", dependencies=[Depends(require_admin)])
+def list_negative_cache():
+    import negative_cache
+    return {"entries": negative_cache.entries()}
+
+
+@app.delete("/api/admin/negative-cache", dependencies=[Depends(require_admin)])
+def purge_negative_cache():
+    import negative_cache
+    return {"purged": negative_cache.purge()}
+
+
+@app.delete("/api/admin/negative-cache/{ticker}", dependencies=[Depends(require_admin)])
+def purge_negative_cache_ticker(ticker: str):
+    import negative_cache
+    return {"purged": negative_cache.purge(_ticker(ticker))}
+
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles():
+    import profiling
+    return {"profiles": profiling.entries()}
+
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile(profile_id: str, format: str = "json"):
+    """A stored profile's summary and SQL timings, or its collapsed stacks."""
+    import profiling
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=422, detail="format must be one of: json, folded")
+    profile = profiling.load(profile_id, folded=format == "folded")
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+    if format == "folded":
+        return PlainTextResponse(profile)
+    return profile
+
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/api/ready")
+async def readiness_check():
+    """503 until startup warmup has finished."""
+    if not getattr(app.state, 'ready', False):
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready"}
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return metrics.snapshot()
@@ -0,0 +1,47 @@
+"""In-process counters and timings exposed at ``/api/metrics``.
+
+Deliberately tiny and stdlib-only: counters are monotonically increasing
+numbers, timings keep count/total/max, and gauges hold the latest value.
+Everything is per worker process.
+"""
+import threading
+from typing import Any, Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, Any] = {}
+
+
+def increment(name: str, amount: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        timing['count'] += 1
+        timing['total_seconds'] += seconds
+        timing['max_seconds'] = max(timing['max_seconds'], seconds)
+
+
+def set_gauge(name: str, value: Any) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timings': {name: dict(t) for name, t in _timings.items()},
+            'gauges': dict(_gauges),
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _gauges.clear()
@@ -0,0 +1,119 @@
+"""Negative-result cache for tickers the upstream provider doesn't know.
+
+Tickers that come back with no data (typos, delisted symbols) are
+remembered for ``NEGATIVE_CACHE_TTL`` seconds so repeated lookups are
+answered without an upstream round trip. Entries live in SQLite, shared
+by all workers, with a per-process copy in memory; the in-memory copy is
+re-checked against SQLite every ``LOCAL_RECHECK_SECONDS`` so an admin
+purge reaches every worker quickly.
+
+Settings come from the environment:
+
+    NEGATIVE_CACHE_TTL          seconds a miss is remembered (0 disables)
+    NEGATIVE_CACHE_MAX_ENTRIES  in-memory entries kept per process
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from db import get_connection
+
+NEGATIVE_CACHE_TTL = float(os.environ.get("NEGATIVE_CACHE_TTL", "21600"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.environ.get("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+LOCAL_RECHECK_SECONDS = 60.0
+
+_lock = threading.Lock()
+# ticker -> (reason, expires_at, checked_at)
+_entries: Dict[str, Tuple[str, float, float]] = {}
+
+
+def _remember_locally(ticker: str, reason: str, expires_at: float, now: float) -> None:
+    with _lock:
+        _entries.pop(ticker, None)
+        _entries[ticker] = (reason, expires_at, now)
+        if len(_entries) > NEGATIVE_CACHE_MAX_ENTRIES:
+            # Dicts keep insertion order, so the first key is the oldest entry
+            del _entries[next(iter(_entries))]
+
+
+def lookup(ticker: str) -> Optional[str]:
+    """Return the remembered failure reason for ``ticker``, or None."""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return None
+    ticker = ticker.upper()
+    now = time.time()
+    entry = _entries.get(ticker)
+    if entry is not None and entry[1] > now and now - entry[2] < LOCAL_RECHECK_SECONDS:
+        metrics.increment('negative_cache_hits')
+        return entry[0]
+
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT reason, expires_at FROM negative_cache WHERE ticker = ? AND expires_at > ?",
+            (ticker, now),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        with _lock:
+            _entries.pop(ticker, None)
+        return None
+    _remember_locally(ticker, row['reason'], row['expires_at'], now)
+    metrics.increment('negative_cache_hits')
+    return row['reason']
+
+
+def remember(ticker: str, reason: str, ttl: Optional[float] = None) -> None:
+    """Record that ``ticker`` has no upstream data for ``ttl`` seconds."""
+    ttl = NEGATIVE_CACHE_TTL if ttl is None else ttl
+    if ttl <= 0:
+        return
+    ticker = ticker.upper()
+    now = time.time()
+    conn = get_connection()
+    try:
+        conn.execute("DELETE FROM negative_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "INSERT OR REPLACE INTO negative_cache (ticker, reason, expires_at) VALUES (?, ?, ?)",
+            (ticker, reason, now + ttl),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _remember_locally(ticker, reason, now + ttl, now)
+    metrics.increment('negative_cache_stores')
+
+
+def entries() -> List[dict]:
+    """Unexpired entries, soonest expiry first."""
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT ticker, reason, expires_at FROM negative_cache WHERE expires_at > ? ORDER BY expires_at",
+            (time.time(),),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def purge(ticker: Optional[str] = None) -> int:
+    """Forget one ticker, or every entry; return the number removed."""
+    conn = get_connection()
+    try:
+        if ticker is None:
+            cursor = conn.execute("DELETE FROM negative_cache")
+        else:
+            cursor = conn.execute("DELETE FROM negative_cache WHERE ticker = ?", (ticker.upper(),))
+        conn.commit()
+    finally:
+        conn.close()
+    with _lock:
+        if ticker is None:
+            _entries.clear()
+        else:
+            _entries.pop(ticker.upper(), None)
+    return cursor.rowcount
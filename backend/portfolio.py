@@ -0,0 +1,199 @@
+"""Portfolio volatility and risk contributions.
+
+A portfolio's vol depends on how its names co-move, so it can't be built
+from per-ticker vols. The cached series of every name are aligned on their
+common dates once, and log returns and covariance matrices for the 30d
+and 90d windows are computed from that single return matrix. Weighting is
+then a couple of matrix-vector products:
+
+    sigma_p   = sqrt(w' S w)
+    marginal  = S w / sigma_p       (d sigma_p / d w_i)
+    component = w * marginal        (sums to sigma_p)
+
+The daily ``history`` applies the same split to rolling 30d/90d windows.
+Name i's component is w_i cov(r_i, r_p) / sigma_p, and each window's
+covariances with the portfolio return come from one product-sum against
+its demeaned windows (``compute.rolling_covariance``).
+
+The aligned universe is kept in a small in-process LRU keyed by the sorted
+tickers, the lookback and the last completed session, so re-evaluating
+different weights over the same names skips the cache reads and the
+covariance work.
+
+Settings come from the environment:
+
+    PORTFOLIO_CACHE_SIZE  universes kept per process
+"""
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import compute
+import metrics
+import trading_calendar
+from cache import fetch_and_cache
+from compute import TRADING_DAYS_PER_YEAR
+
+PORTFOLIO_CACHE_SIZE = int(os.environ.get("PORTFOLIO_CACHE_SIZE", "32"))
+WINDOWS = (30, 90)
+HISTORY_DAYS = 252
+
+
+class Universe(NamedTuple):
+    tickers: Tuple[str, ...]
+    dates: np.ndarray          # datetime64[D], one per return row
+    returns: np.ndarray        # (days, tickers) daily log returns
+    covariances: Dict[int, np.ndarray]  # window -> annualized covariance
+
+
+_lock = threading.Lock()
+_universes: Dict[tuple, Universe] = {}
+
+
+def _rounded(value: float, digits: int = 4) -> Optional[float]:
+    # NaN isn't valid JSON
+    return None if value != value else round(value, digits)
+
+
+def clear_cache() -> None:
+    with _lock:
+        _universes.clear()
+
+
+def invalidate(ticker: str) -> None:
+    """Drop cached universes that include ``ticker``."""
+    with _lock:
+        for key in [key for key in _universes if ticker in key[0]]:
+            del _universes[key]
+
+
+def build_universe(tickers: Tuple[str, ...], lookback_years: int) -> Tuple[Universe, bool]:
+    """Align cached prices on common dates; also return whether any were stale.
+
+    Dates where any name lacks a finite price are dropped, so no return
+    in the matrix is NaN.
+    """
+    frames = [fetch_and_cache(ticker, years=lookback_years) for ticker in tickers]
+    stale = any(df.attrs.get('stale', False) for df in frames)
+
+    common = frames[0].index.values
+    for df in frames[1:]:
+        common = np.intersect1d(common, df.index.values, assume_unique=True)
+
+    prices = np.column_stack([
+        compute.as_float_array(df['adj_close'].to_numpy()[np.searchsorted(df.index.values, common)])
+        for df in frames
+    ])
+    valid = np.isfinite(prices).all(axis=1)
+    common, prices = common[valid], prices[valid]
+    if len(common) <= max(WINDOWS):
+        raise ValueError(f"Not enough overlapping history for {', '.join(tickers)}")
+    returns = np.log(prices[1:] / prices[:-1])
+    covariances = {
+        window: np.cov(returns[-window:], rowvar=False, ddof=1).reshape(len(tickers), len(tickers))
+        * TRADING_DAYS_PER_YEAR
+        for window in WINDOWS
+    }
+    universe = Universe(tickers, common[1:].astype('datetime64[D]'), returns, covariances)
+    return universe, stale
+
+
+def get_universe(tickers: Tuple[str, ...], lookback_years: int) -> Universe:
+    """Cached ``build_universe`` for sorted ``tickers``.
+
+    Entries are keyed on the last completed session, so they roll over
+    when new bars can exist. Universes built from stale bars aren't kept.
+    """
+    key = (tickers, lookback_years, trading_calendar.last_completed_session())
+    with _lock:
+        universe = _universes.pop(key, None)
+        if universe is not None:
+            _universes[key] = universe
+    if universe is not None:
+        metrics.increment('portfolio_cache_hits')
+        return universe
+
+    metrics.increment('portfolio_cache_misses')
+    universe, stale = build_universe(tickers, lookback_years)
+    if not stale and PORTFOLIO_CACHE_SIZE > 0:
+        with _lock:
+            _universes[key] = universe
+            while len(_universes) > PORTFOLIO_CACHE_SIZE:
+                # Dicts keep insertion order, so the first key is least recently used
+                del _universes[next(iter(_universes))]
+    return universe
+
+
+def contributions(covariance: np.ndarray, weights: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Portfolio vol with marginal and component contributions per name."""
+    scaled = covariance @ weights
+    vol = float(np.sqrt(max(weights @ scaled, 0.0)))
+    marginal = scaled / vol if vol else np.zeros_like(weights)
+    return vol, marginal, weights * marginal
+
+
+def calculate_portfolio_volatility(weights: Dict[str, float], lookback_years: int = 5) -> dict:
+    """Annualized 30d/90d vol of a weighted basket and each name's share of it.
+
+    Portfolio returns are approximated as the weighted sum of the names'
+    log returns. Weights are used as given (they needn't sum to one).
+    """
+    positions = sorted((ticker.upper(), float(w)) for ticker, w in weights.items())
+    tickers = tuple(ticker for ticker, _ in positions)
+    w = np.array([weight for _, weight in positions])
+    universe = get_universe(tickers, lookback_years)
+
+    result = {
+        "tickers": list(tickers),
+        "weights": dict(positions),
+        "observations": len(universe.dates),
+        "data_as_of": np.datetime_as_string(universe.dates[-1], unit='D'),
+        "contributions": {},
+    }
+    for window in WINDOWS:
+        vol, marginal, component = contributions(universe.covariances[window], w)
+        result[f"vol_{window}d"] = round(vol, 4)
+        result["contributions"][f"{window}d"] = [
+            {
+                "ticker": ticker,
+                "weight": weight,
+                "marginal": round(m, 4),
+                "component": round(c, 4),
+                "percent": round(c / vol * 100, 1) if vol else None,
+            }
+            for ticker, weight, m, c in zip(tickers, w.tolist(), marginal.tolist(), component.tolist())
+        ]
+
+    portfolio_returns = universe.returns @ w
+    start = max(max(WINDOWS) - 1, len(portfolio_returns) - HISTORY_DAYS)
+    history_dates: List[str] = np.datetime_as_string(universe.dates[start:], unit='D').tolist()
+    series = {}
+    for window in WINDOWS:
+        vols = compute.annualized_vol(portfolio_returns, window)[start:]
+        deviations = compute.window_deviations(portfolio_returns, window)
+        covariances = np.column_stack([
+            compute.rolling_covariance(universe.returns[:, i], deviations, window)[start:]
+            for i in range(len(tickers))
+        ]) * TRADING_DAYS_PER_YEAR
+        with np.errstate(divide='ignore', invalid='ignore'):
+            components = w * covariances / vols[:, None]
+            percents = components / vols[:, None] * 100
+        series[window] = (vols.tolist(), components.tolist(), percents.tolist())
+
+    history = []
+    for day, d in enumerate(history_dates):
+        entry = {"date": d}
+        for window in WINDOWS:
+            entry[f"vol_{window}d"] = _rounded(series[window][0][day])
+        entry["contributions"] = {
+            f"{window}d": [
+                {"ticker": ticker, "component": _rounded(c), "percent": _rounded(pct, 1)}
+                for ticker, c, pct in zip(tickers, series[window][1][day], series[window][2][day])
+            ]
+            for window in WINDOWS
+        }
+        history.append(entry)
+    result["history"] = history
+    return result
@@ -0,0 +1,151 @@
+"""Compact storage layout for daily bars, and the online move to it.
+
+Bars live in ``prices``, keyed by ``(ticker_id, day)``: an integer id
+from the ``tickers`` lookup table and the number of days since
+1970-01-01. The table is ``WITHOUT ROWID``, so rows sit in key order in
+the primary-key B-tree itself. A ticker's range scan reads contiguous
+pages and compares integers, and no separate index repeats every row's
+ticker and date text. Day numbers are also what the shared arrays and
+``pandas`` use, so reads need no date parsing.
+
+Databases created before this layout keep their bars in the legacy
+``daily_prices`` table until they are moved, which happens while the app
+serves requests:
+
+* ``migrate_batch`` moves a few tickers per short write transaction. The
+  app's lifespan runs it in the background until the legacy table is
+  empty, then drops it.
+* ``ensure_migrated`` moves one ticker on first touch, so readers and
+  writers only ever look at the new layout.
+
+Settings come from the environment:
+
+    PRICES_MIGRATION_BATCH  legacy tickers moved per transaction
+"""
+import os
+import re
+import sqlite3
+from datetime import date
+from typing import Set
+
+import db
+import metrics
+
+PRICES_MIGRATION_BATCH = int(os.environ.get("PRICES_MIGRATION_BATCH", "20"))
+# Seconds the background migration yields the write lock between batches
+PRICES_MIGRATION_PAUSE = 0.05
+
+LEGACY_TABLE = 'daily_prices'
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Yahoo symbols, upper-cased: BRK-B, ^GSPC, EURUSD=X, RDS.A. Symbols also
+# name files (shared arrays), so nothing outside this set is accepted.
+TICKER_PATTERN = re.compile(r"\^?[A-Z0-9][A-Z0-9_.=-]{0,19}")
+
+# Value columns of ``prices`` after the key, in storage order
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'adj_close', 'volume')
+
+# Binds one symbol parameter: the scalar subquery is evaluated once per statement
+TICKER_ID = "(SELECT id FROM tickers WHERE symbol = ?)"
+
+# Databases (by path) known to have no legacy table left
+_migrated: Set[str] = set()
+
+
+def valid_ticker(ticker: str) -> bool:
+    return TICKER_PATTERN.fullmatch(ticker.upper()) is not None
+
+
+def day_number(value: str) -> int:
+    """Days since 1970-01-01 for a ``YYYY-MM-DD`` string."""
+    return date.fromisoformat(value[:10]).toordinal() - EPOCH_ORDINAL
+
+
+def day_string(day: int) -> str:
+    return date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+def add_ticker(conn: sqlite3.Connection, symbol: str) -> None:
+    conn.execute("INSERT OR IGNORE INTO tickers (symbol) VALUES (?)", (symbol,))
+
+
+def legacy_pending(conn: sqlite3.Connection) -> bool:
+    """True while the database still has a legacy ``daily_prices`` table."""
+    path = str(db.DB_PATH)
+    if path in _migrated:
+        return False
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEGACY_TABLE,)
+    ).fetchone()
+    if exists is None:
+        _migrated.add(path)
+    return exists is not None
+
+
+def _move(conn: sqlite3.Connection, symbol: str) -> None:
+    add_ticker(conn, symbol)
+    # Bars already written in the new layout are newer, so they win
+    conn.execute(f"""
+        INSERT OR IGNORE INTO prices (ticker_id, day, open, high, low, close, adj_close, volume)
+        SELECT {TICKER_ID}, CAST(julianday(date) - 2440587.5 AS INTEGER),
+               open, high, low, close, adj_close, volume
+        FROM {LEGACY_TABLE}
+        WHERE ticker = ?
+    """, (symbol, symbol))
+    conn.execute(f"DELETE FROM {LEGACY_TABLE} WHERE ticker = ?", (symbol,))
+
+
+def ensure_migrated(conn: sqlite3.Connection, symbol: str) -> None:
+    """Move ``symbol``'s legacy bars, if any, and commit.
+
+    Call on a connection with no transaction of its own in progress.
+    """
+    if not legacy_pending(conn):
+        return
+    try:
+        row = conn.execute(f"SELECT 1 FROM {LEGACY_TABLE} WHERE ticker = ? LIMIT 1", (symbol,)).fetchone()
+    except sqlite3.OperationalError:
+        # Dropped by another worker since the check
+        return
+    if row is not None:
+        _move(conn, symbol)
+        conn.commit()
+        metrics.increment('prices_migrated_tickers')
+
+
+def migrate_batch(limit: int = 0) -> int:
+    """Move up to ``limit`` legacy tickers; return how many were moved.
+
+    Drops the legacy table once it is empty, after which it returns 0.
+    """
+    conn = db.get_connection()
+    try:
+        if not legacy_pending(conn):
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            symbols = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT ticker FROM {LEGACY_TABLE} LIMIT ?", (limit or PRICES_MIGRATION_BATCH,)
+            )]
+        except sqlite3.OperationalError:
+            conn.rollback()
+            return 0
+        for symbol in symbols:
+            _move(conn, symbol)
+        if not symbols:
+            conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+        conn.commit()
+        if not symbols:
+            _migrated.add(str(db.DB_PATH))
+    finally:
+        conn.close()
+    metrics.increment('prices_migrated_tickers', len(symbols))
+    return len(symbols)
+
+
+def migration_pending() -> bool:
+    conn = db.get_connection()
+    try:
+        return legacy_pending(conn)
+    finally:
+        conn.close()
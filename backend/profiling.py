@@ -0,0 +1,294 @@
+"""Opt-in profiles of single API requests.
+
+A request sent with an ``X-Profile: 1`` header and a valid
+``X-Admin-Token`` is profiled (see ``ProfileMiddleware`` in main.py):
+
+* A sampler thread records the Python stack of every thread every
+  ``PROFILE_INTERVAL`` seconds. Only the threads that served the request
+  are kept: the event loop thread, and worker threads that opened a
+  database connection during it. Idle samples (the loop waiting on
+  sockets, pool threads waiting for work) are dropped. Stacks are stored
+  in collapsed form, one ``frame;frame;frame count`` line each, as read
+  by flamegraph.pl, speedscope and inferno.
+* Connections opened by the request time every statement and count the
+  rows fetched, totalled per distinct SQL text.
+
+Nothing is added to other requests. ``db.connect`` is replaced by a
+wrapper only while at least one profile is running, and the wrapper
+hands back plain connections to requests that are not profiled.
+
+Profiles are written to ``PROFILE_DIR`` as ``<id>.folded`` and
+``<id>.json`` so any worker can serve them. The newest ``PROFILE_KEEP``
+are kept.
+
+Settings come from the environment:
+
+    PROFILE_INTERVAL  seconds between stack samples
+    PROFILE_DIR       directory for stored profiles (default: next to the database)
+    PROFILE_KEEP      profiles kept; older ones are deleted
+"""
+import json
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import db
+import metrics
+
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+_current: ContextVar[Optional['Profile']] = ContextVar('profile', default=None)
+_lock = threading.Lock()
+_active = 0
+
+
+class QueryStats:
+    """Per-statement totals shared by a profile's connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # SQL text -> [calls, seconds, rows]
+        self.statements: Dict[str, list] = {}
+
+    def add(self, sql: str, calls: int, seconds: float, rows: int) -> None:
+        key = ' '.join(sql.split())
+        with self._lock:
+            entry = self.statements.setdefault(key, [0, 0.0, 0])
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += rows
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that charges execute and fetch time, and rows fetched, to its statement."""
+
+    stats: QueryStats
+    _sql = ''
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.stats.add(sql, 1, time.perf_counter() - started, 0)
+
+    def executemany(self, sql, parameters):
+        self._sql = sql
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.stats.add(sql, 1, time.perf_counter() - started, 0)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.stats.add(self._sql, 0, time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.stats.add(self._sql, 0, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.stats.add(self._sql, 0, time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self.stats.add(self._sql, 0, time.perf_counter() - started, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements run through ``ProfiledCursor``."""
+
+    stats: QueryStats
+
+    def cursor(self, factory=ProfiledCursor):
+        cursor = super().cursor(factory)
+        cursor.stats = self.stats
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+def _connect(database, *args, **kwargs):
+    profile = _current.get()
+    if profile is None:
+        return sqlite3.connect(database, *args, **kwargs)
+    profile.threads.add(threading.get_ident())
+    conn = sqlite3.connect(database, *args, factory=ProfiledConnection, **kwargs)
+    conn.stats = profile.queries
+    return conn
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _idle(stack: List[str]) -> bool:
+    """True for the event loop waiting on sockets or a pool thread waiting for work."""
+    leaf = stack[-1]
+    return '(selectors.py:' in leaf or any(frame.startswith('get (queue.py:') for frame in stack[-3:])
+
+
+class Profile:
+    """Stack samples and query timings for one request."""
+
+    def __init__(self, label: str):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{secrets.token_hex(4)}"
+        self.label = label
+        self.queries = QueryStats()
+        self.threads = {threading.get_ident()}
+        self.samples: Dict[int, Counter] = {}
+        self.seconds = 0.0
+        self.token = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(PROFILE_INTERVAL):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.samples.setdefault(ident, Counter())[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self.seconds = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+
+    def collapsed(self) -> Counter:
+        """Stack counts of the request's threads, rooted at a per-thread frame."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Counter = Counter()
+        for ident in self.threads:
+            thread = names.get(ident, f"thread-{ident}")
+            for stack, count in self.samples.get(ident, {}).items():
+                if not _idle(stack.split(';')):
+                    stacks[f"{thread};{stack}"] += count
+        return stacks
+
+    def summary(self, status: Optional[int] = None) -> Dict[str, object]:
+        statements = sorted(
+            ({"sql": sql, "calls": calls, "seconds": round(seconds, 6), "rows": rows}
+             for sql, (calls, seconds, rows) in self.queries.statements.items()),
+            key=lambda item: item["seconds"], reverse=True,
+        )
+        return {
+            "id": self.id,
+            "request": self.label,
+            "status": status,
+            "seconds": round(self.seconds, 6),
+            "interval": PROFILE_INTERVAL,
+            "samples": sum(self.collapsed().values()),
+            "sql": {
+                "queries": sum(item["calls"] for item in statements),
+                "seconds": round(sum(item["seconds"] for item in statements), 6),
+                "rows": sum(item["rows"] for item in statements),
+                "statements": statements,
+            },
+        }
+
+
+def begin(label: str) -> Profile:
+    """Start profiling the calling context; pair with ``end``."""
+    global _active
+    profile = Profile(label)
+    with _lock:
+        _active += 1
+        db.connect = _connect
+    profile.token = _current.set(profile)
+    profile.start()
+    return profile
+
+
+def end(profile: Profile, status: Optional[int] = None) -> Dict[str, object]:
+    """Stop ``profile``, store it and return its summary."""
+    global _active
+    profile.stop()
+    _current.reset(profile.token)
+    with _lock:
+        _active -= 1
+        if not _active:
+            db.connect = sqlite3.connect
+    summary = profile.summary(status)
+    save(profile, summary)
+    metrics.increment('profiles_recorded')
+    return summary
+
+
+def directory() -> Path:
+    return Path(PROFILE_DIR) if PROFILE_DIR else Path(f"{db.DB_PATH}.profiles")
+
+
+def save(profile: Profile, summary: Dict[str, object]) -> None:
+    path = directory()
+    path.mkdir(parents=True, exist_ok=True)
+    (path / f"{profile.id}.folded").write_text(
+        ''.join(f"{stack} {count}\n" for stack, count in sorted(profile.collapsed().items()))
+    )
+    (path / f"{profile.id}.json").write_text(json.dumps(summary))
+    # Ids start with a timestamp, so names sort oldest first
+    for stale in sorted(path.glob('*.json'))[:-max(PROFILE_KEEP, 1)]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix('.folded').unlink(missing_ok=True)
+
+
+def entries() -> List[Dict[str, object]]:
+    """Stored profile summaries, newest first, without per-statement detail."""
+    path = directory()
+    items = []
+    for file in sorted(path.glob('*.json'), reverse=True) if path.is_dir() else []:
+        try:
+            summary = json.loads(file.read_text())
+        except (OSError, ValueError):
+            continue  # deleted or still being written
+        summary["sql"] = {key: value for key, value in summary["sql"].items() if key != "statements"}
+        items.append(summary)
+    return items
+
+
+def load(profile_id: str, folded: bool = False) -> Optional[object]:
+    """A stored profile's summary, or its collapsed stacks as text."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    file = directory() / f"{profile_id}.{'folded' if folded else 'json'}"
+    try:
+        text = file.read_text()
+    except FileNotFoundError:
+        return None
+    return text if folded else json.loads(text)
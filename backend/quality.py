@@ -0,0 +1,199 @@
+"""Ingest-time cleaning of daily bars, with a persisted quality report.
+
+Yahoo's daily chart data has a few recurring defects: ``null`` OHLC
+values, the latest bar repeated with an intraday timestamp, and one-day
+bad ticks that revert the next day. ``clean`` fixes these once,
+vectorized over the whole fetch, before bars are stored:
+
+* bars without a positive close or adjusted close are dropped;
+* timestamps are mapped to their New York session date, and bars that
+  land on the same session are collapsed, keeping the latest;
+* missing or non-positive open/high/low are filled from the close, and
+  high/low are widened to contain the open and close;
+* isolated spikes (a large adjusted-close move, far outside the series'
+  robust scale, that almost fully reverses on the next bar) are dropped.
+  A short incremental fetch has too few moves for a reliable scale, so
+  the caller passes the stored bars before it as ``reference`` and
+  their moves join the scale estimate.
+
+Every dropped or repaired bar is recorded in ``price_flags``. Dropped
+dates are also deleted from ``prices``, so bad bars stored before
+cleaning existed go away on the next fetch. Bars on NYSE holidays or
+weekends are flagged ``non_session`` but kept, since tickers from other
+venues legitimately trade then.
+
+Settings come from the environment:
+
+    QUALITY_SPIKE_Z         robust z-score both legs of a spike must exceed
+    QUALITY_SPIKE_MIN_MOVE  smallest absolute log move treated as a spike
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import price_store
+import shared_arrays
+import trading_calendar
+from db import get_connection
+from price_store import TICKER_ID
+
+QUALITY_SPIKE_Z = float(os.environ.get("QUALITY_SPIKE_Z", "10"))
+QUALITY_SPIKE_MIN_MOVE = float(os.environ.get("QUALITY_SPIKE_MIN_MOVE", "0.1"))
+# Stored bars before an incremental fetch that seed the spike scale
+QUALITY_REFERENCE_BARS = 60
+
+# Flags whose bars are removed rather than repaired or collapsed
+DROP_FLAGS = ('missing_close', 'non_positive', 'spike')
+
+
+def session_dates(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """New York session date of each bar.
+
+    Yahoo timestamps are naive UTC instants; values already at midnight
+    are taken to be dates.
+    """
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    local = index.tz_localize('UTC').tz_convert(trading_calendar.EXCHANGE_TZ).tz_localize(None).normalize()
+    is_date = index == index.normalize()
+    return pd.DatetimeIndex(np.where(is_date, index.values, local.values), name='date')
+
+
+def _spikes(adj_close: np.ndarray, reference: Optional[np.ndarray] = None) -> np.ndarray:
+    """Mask of bars whose move in and out are both extreme and mostly cancel.
+
+    Moves of ``reference`` (earlier adjusted closes) count toward the
+    median and scale but are never flagged.
+    """
+    spikes = np.zeros(len(adj_close), dtype=bool)
+    if len(adj_close) < 3:
+        return spikes
+    returns = np.diff(np.log(adj_close))
+    sample = returns
+    if reference is not None and len(reference) > 1:
+        sample = np.concatenate([np.diff(np.log(reference)), returns])
+    center = np.median(sample)
+    deviation = np.abs(returns - center)
+    scale = 1.4826 * np.median(np.abs(sample - center))
+    extreme = (np.abs(returns) >= QUALITY_SPIKE_MIN_MOVE) & (deviation > QUALITY_SPIKE_Z * scale)
+    move_in, move_out = returns[:-1], returns[1:]
+    reverts = np.abs(move_in + move_out) < 0.2 * np.abs(move_in)
+    spikes[1:-1] = extreme[:-1] & extreme[1:] & reverts
+    return spikes
+
+
+def clean(df: pd.DataFrame, reference: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return clean bars indexed by session date and a frame of flags.
+
+    Flags have ``date``, ``flag`` and ``value`` (the offending price or
+    log move) columns. ``reference`` holds stored adjusted closes from
+    before ``df`` that seed the spike scale.
+    """
+    flags: List[pd.DataFrame] = []
+
+    def flag(name: str, dates, values) -> None:
+        if len(dates):
+            flags.append(pd.DataFrame({'date': pd.DatetimeIndex(dates).strftime('%Y-%m-%d'),
+                                       'flag': name, 'value': np.asarray(values, dtype=np.float64)}))
+
+    df = df.sort_index(kind='stable')
+    df.index = session_dates(df.index)
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    adj_close = df['adj_close'].to_numpy(dtype=np.float64)
+    missing = np.isnan(close) | np.isnan(adj_close)
+    non_positive = ~missing & ((close <= 0) | (adj_close <= 0))
+    flag('missing_close', df.index[missing], close[missing])
+    flag('non_positive', df.index[non_positive], close[non_positive])
+    df = df[~(missing | non_positive)]
+
+    duplicate = df.index.duplicated(keep='last')
+    flag('duplicate', df.index[duplicate], df['close'].to_numpy(dtype=np.float64)[duplicate])
+    df = df[~duplicate]
+
+    adj_close = df['adj_close'].to_numpy(dtype=np.float64)
+    spikes = _spikes(adj_close, reference)
+    if spikes.any():
+        moves = np.log(adj_close[1:] / adj_close[:-1])
+        flag('spike', df.index[spikes], moves[spikes[1:]])
+        df = df[~spikes]
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    prices = {}
+    filled = np.zeros(len(df), dtype=bool)
+    for name in ('open', 'high', 'low'):
+        column = df[name].to_numpy(dtype=np.float64)
+        bad = np.isnan(column) | (column <= 0)
+        filled |= bad
+        prices[name] = np.where(bad, close, column)
+    flag('filled', df.index[filled], close[filled])
+
+    high = np.maximum.reduce([prices['high'], prices['open'], close])
+    low = np.minimum.reduce([prices['low'], prices['open'], close])
+    repaired = ~filled & ((high != prices['high']) | (low != prices['low']))
+    flag('ohlc_repaired', df.index[repaired], close[repaired])
+
+    df = df.assign(open=prices['open'], high=high, low=low)
+
+    closed = [np.datetime64(day, 'ns') for year in set(df.index.year)
+              for day in trading_calendar.holidays(year) | trading_calendar.SPECIAL_CLOSURES]
+    off_session = (df.index.dayofweek >= 5) | df.index.isin(closed)
+    flag('non_session', df.index[off_session], close[off_session])
+
+    report = pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=['date', 'flag', 'value'])
+    return df, report
+
+
+def record(ticker: str, report: pd.DataFrame, kept: pd.DatetimeIndex) -> None:
+    """Store flags and delete stored bars on dropped dates with no ``kept`` bar."""
+    if report.empty:
+        return
+    ticker = ticker.upper()
+    flagged_at = datetime.now().isoformat(timespec='seconds')
+    dropped = report.loc[report['flag'].isin(DROP_FLAGS), 'date']
+    dropped = sorted(set(dropped) - set(kept.strftime('%Y-%m-%d')))
+    conn = get_connection()
+    try:
+        price_store.ensure_migrated(conn, ticker)
+        conn.executemany("""
+            INSERT OR REPLACE INTO price_flags (ticker, date, flag, value, flagged_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(ticker, d, f, None if np.isnan(v) else v, flagged_at)
+              for d, f, v in report[['date', 'flag', 'value']].itertuples(index=False)])
+        conn.executemany(
+            f"DELETE FROM prices WHERE ticker_id = {TICKER_ID} AND day = ?",
+            [(ticker, price_store.day_number(d)) for d in dropped],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    if dropped:
+        shared_arrays.invalidate(ticker)
+    for name, count in report['flag'].value_counts().items():
+        metrics.increment(f'quality_{name}', int(count))
+
+
+def get_report(ticker: str, limit: int = 100) -> Dict[str, object]:
+    """Flag counts and the most recent flagged bars for ``ticker``."""
+    ticker = ticker.upper()
+    conn = get_connection()
+    try:
+        counts = conn.execute(
+            "SELECT flag, COUNT(*) AS n FROM price_flags WHERE ticker = ? GROUP BY flag ORDER BY flag",
+            (ticker,),
+        ).fetchall()
+        rows = conn.execute("""
+            SELECT date, flag, value, flagged_at FROM price_flags
+            WHERE ticker = ? ORDER BY date DESC, flag LIMIT ?
+        """, (ticker, limit)).fetchall()
+    finally:
+        conn.close()
+    return {
+        "ticker": ticker,
+        "counts": {row['flag']: row['n'] for row in counts},
+        "flags": [dict(row) for row in rows],
+    }
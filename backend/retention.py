@@ -0,0 +1,287 @@
+"""Size-bounded retention for the price cache.
+
+Reads note per-ticker accesses in memory (``record_access``) instead of
+writing on every request. A maintenance pass (``run_maintenance``, run
+periodically from the app's lifespan) then:
+
+* flushes those access stamps to ``cache_metadata`` in one write,
+* trims daily bars and intraday sessions older than the retention horizon,
+* evicts least-recently-accessed tickers until the ticker and size limits
+  hold, and
+* returns freed pages to the filesystem with ``PRAGMA incremental_vacuum``
+  in short steps.
+
+The database runs in WAL mode, so readers keep going while this happens.
+Files from before incremental auto-vacuum are converted by ``init_db`` at
+startup, never here. Only one worker per database runs these passes: the
+one holding an exclusive ``flock`` on ``<database>.maintenance.lock``
+(``claim_maintenance``). The others only flush their access stamps, and
+take over when the holder exits.
+
+Settings come from the environment (0 disables a limit):
+
+    CACHE_MAX_BYTES             upper bound on live database size
+    CACHE_MAX_TICKERS           tickers kept in the cache
+    CACHE_MAX_HISTORY_YEARS     drop bars older than this many years
+    CACHE_MAX_INTRADAY_DAYS     drop intraday sessions older than this many
+                                days (0 follows CACHE_MAX_HISTORY_YEARS)
+    CACHE_MAINTENANCE_INTERVAL  seconds between background passes
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import db
+import metrics
+import price_store
+from db import AUTO_VACUUM_INCREMENTAL, get_connection
+from price_store import TICKER_ID
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", "0"))
+CACHE_MAX_TICKERS = int(os.environ.get("CACHE_MAX_TICKERS", "0"))
+CACHE_MAX_HISTORY_YEARS = int(os.environ.get("CACHE_MAX_HISTORY_YEARS", "0"))
+CACHE_MAX_INTRADAY_DAYS = int(os.environ.get("CACHE_MAX_INTRADAY_DAYS", "0"))
+CACHE_MAINTENANCE_INTERVAL = float(os.environ.get("CACHE_MAINTENANCE_INTERVAL", "300"))
+VACUUM_STEP_PAGES = 256
+
+# Tables keyed by ticker that are cleared when a ticker is evicted, besides
+# ``prices`` and ``tickers``.
+TICKER_TABLES = ['cache_metadata', 'intraday_blocks', 'forecast_state',
+                 'price_flags', 'corporate_actions']
+
+_lock = threading.Lock()
+_pending: Dict[str, list] = {}
+# Open lock file while this process is the maintenance worker
+_maintainer = None
+
+
+def record_access(ticker: str) -> None:
+    """Note that ``ticker`` was read; persisted by ``flush_access_log``."""
+    stamp = datetime.now().isoformat(timespec='seconds')
+    with _lock:
+        entry = _pending.setdefault(ticker.upper(), [stamp, 0])
+        entry[0] = stamp
+        entry[1] += 1
+
+
+def flush_access_log() -> int:
+    """Write pending access stamps to ``cache_metadata``; return tickers flushed."""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+
+    conn = get_connection()
+    try:
+        conn.executemany("""
+            INSERT INTO cache_metadata (ticker, last_accessed, access_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(ticker) DO UPDATE SET
+                last_accessed = excluded.last_accessed,
+                access_count = access_count + excluded.access_count
+        """, [(ticker, stamp, count) for ticker, (stamp, count) in pending.items()])
+        conn.commit()
+    except sqlite3.Error:
+        # Put the stamps back so the next pass can retry them
+        with _lock:
+            for ticker, (stamp, count) in pending.items():
+                entry = _pending.setdefault(ticker, [stamp, 0])
+                entry[1] += count
+        raise
+    finally:
+        conn.close()
+    return len(pending)
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def file_bytes(conn: sqlite3.Connection) -> int:
+    return _pragma(conn, 'page_count') * _pragma(conn, 'page_size')
+
+
+def used_bytes(conn: sqlite3.Connection) -> int:
+    """Database size excluding free pages awaiting vacuum."""
+    return (_pragma(conn, 'page_count') - _pragma(conn, 'freelist_count')) * _pragma(conn, 'page_size')
+
+
+def lru_tickers(conn: sqlite3.Connection) -> List[str]:
+    """Cached tickers, least recently accessed first.
+
+    A ticker counts as cached if any ticker-keyed table holds rows for it,
+    so tickers with only intraday sessions or forecast state are evicted
+    too. Tickers that were bulk-loaded and never read sort first.
+    """
+    cached = "SELECT symbol AS ticker FROM tickers t WHERE EXISTS (SELECT 1 FROM prices WHERE ticker_id = t.id)"
+    for table in TICKER_TABLES:
+        cached += f" UNION SELECT DISTINCT ticker FROM {table}"
+    if price_store.legacy_pending(conn):
+        cached += f" UNION SELECT DISTINCT ticker FROM {price_store.LEGACY_TABLE}"
+    rows = conn.execute(f"""
+        SELECT p.ticker
+        FROM ({cached}) p
+        LEFT JOIN cache_metadata m ON m.ticker = p.ticker
+        ORDER BY COALESCE(m.last_accessed, m.last_updated, ''), p.ticker
+    """).fetchall()
+    return [row[0] for row in rows]
+
+
+def evict_ticker(conn: sqlite3.Connection, ticker: str) -> None:
+    if price_store.legacy_pending(conn):
+        conn.execute(f"DELETE FROM {price_store.LEGACY_TABLE} WHERE ticker = ?", (ticker,))
+    conn.execute(f"DELETE FROM prices WHERE ticker_id = {TICKER_ID}", (ticker,))
+    conn.execute("DELETE FROM tickers WHERE symbol = ?", (ticker,))
+    for table in TICKER_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE ticker = ?", (ticker,))
+    conn.commit()
+    _invalidate_arrays(ticker)
+
+
+def _invalidate_arrays(*tickers: str) -> None:
+    # Imported here so the app can import retention without loading numpy
+    import shared_arrays
+    shared_arrays.invalidate(*tickers)
+
+
+def evict_lru(conn: sqlite3.Connection, max_tickers: int = 0, max_bytes: int = 0) -> List[str]:
+    """Evict least-recently-accessed tickers until both limits hold."""
+    candidates = lru_tickers(conn)
+    evicted = []
+    if max_tickers and len(candidates) > max_tickers:
+        excess = len(candidates) - max_tickers
+        for ticker in candidates[:excess]:
+            evict_ticker(conn, ticker)
+            evicted.append(ticker)
+        candidates = candidates[excess:]
+    if max_bytes:
+        # Deleted rows land on the freelist, so used_bytes drops right away.
+        # The most recently used ticker is always kept.
+        while len(candidates) > 1 and used_bytes(conn) > max_bytes:
+            ticker = candidates.pop(0)
+            evict_ticker(conn, ticker)
+            evicted.append(ticker)
+    return evicted
+
+
+def trim_history(conn: sqlite3.Connection, years: int, intraday_days: int = 0) -> int:
+    """Delete bars older than ``years`` and intraday sessions older than
+    ``intraday_days`` (``years`` when 0); return the number of rows removed.
+    """
+    now = datetime.now()
+    cutoff = price_store.day_number((now - timedelta(days=years * 365)).strftime('%Y-%m-%d')) if years else None
+    intraday_days = intraday_days or years * 365
+    intraday_cutoff = (now - timedelta(days=intraday_days)).strftime('%Y-%m-%d') if intraday_days else None
+    removed = 0
+    # One short transaction per ticker keeps the write lock brief
+    for ticker in lru_tickers(conn):
+        if cutoff is not None:
+            price_store.ensure_migrated(conn, ticker)
+            cursor = conn.execute(
+                f"DELETE FROM prices WHERE ticker_id = {TICKER_ID} AND day < ?", (ticker, cutoff)
+            )
+            if cursor.rowcount:
+                _invalidate_arrays(ticker)
+            removed += cursor.rowcount
+        if intraday_cutoff is not None:
+            cursor = conn.execute(
+                "DELETE FROM intraday_blocks WHERE ticker = ? AND day < ?", (ticker, intraday_cutoff)
+            )
+            removed += cursor.rowcount
+        conn.commit()
+    return removed
+
+
+def claim_maintenance() -> bool:
+    """True if this process runs maintenance, claiming the role when it's free.
+
+    The lock is held until ``release_maintenance`` or process exit.
+    """
+    global _maintainer
+    if _maintainer is not None:
+        return True
+    if fcntl is None:
+        return True
+    handle = open(f"{db.DB_PATH}.maintenance.lock", "a+b")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return False
+    _maintainer = handle
+    return True
+
+
+def release_maintenance() -> None:
+    global _maintainer
+    if _maintainer is not None:
+        _maintainer.close()
+        _maintainer = None
+
+
+def compact(conn: sqlite3.Connection, step_pages: int = VACUUM_STEP_PAGES,
+            pause: float = 0.0) -> int:
+    """Release free pages to the filesystem in small steps; return pages freed."""
+    if _pragma(conn, 'auto_vacuum') != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    freed = 0
+    while True:
+        free = _pragma(conn, 'freelist_count')
+        if not free:
+            break
+        step = min(step_pages, free)
+        # Each step is its own short write transaction
+        conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+        conn.commit()
+        freed += step
+        if pause:
+            time.sleep(pause)
+    # Copy the shrunken pages back so the main file is truncated
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return freed
+
+
+def run_maintenance(max_bytes: Optional[int] = None, max_tickers: Optional[int] = None,
+                    history_years: Optional[int] = None,
+                    intraday_days: Optional[int] = None) -> dict:
+    """Flush access stamps, apply retention limits and compact the file.
+
+    Limits default to the module settings.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_tickers = CACHE_MAX_TICKERS if max_tickers is None else max_tickers
+    history_years = CACHE_MAX_HISTORY_YEARS if history_years is None else history_years
+    intraday_days = CACHE_MAX_INTRADAY_DAYS if intraday_days is None else intraday_days
+
+    started = time.perf_counter()
+    flushed = flush_access_log()
+    conn = get_connection()
+    try:
+        trimmed = trim_history(conn, history_years, intraday_days) if history_years or intraday_days else 0
+        evicted = evict_lru(conn, max_tickers, max_bytes)
+        freed = compact(conn)
+        size = file_bytes(conn)
+    finally:
+        conn.close()
+
+    metrics.observe('cache_maintenance', time.perf_counter() - started)
+    metrics.increment('cache_evictions', len(evicted))
+    metrics.increment('cache_trimmed_rows', trimmed)
+    metrics.increment('cache_vacuumed_pages', freed)
+    metrics.set_gauge('cache_db_bytes', size)
+    return {
+        'accesses_flushed': flushed,
+        'rows_trimmed': trimmed,
+        'evicted': evicted,
+        'pages_freed': freed,
+        'db_bytes': size,
+    }
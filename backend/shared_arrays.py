@@ -0,0 +1,245 @@
+"""Memory-mapped array files shared by every worker process.
+
+Hot tickers' decoded series are written once as ``.npy`` files and opened
+with ``mmap_mode='r'``. All uvicorn workers on a host then read the same
+page-cache pages instead of each re-reading SQLite and holding a private
+copy.
+
+Protocol:
+
+* A file is published by writing a temp file and ``os.replace``-ing it
+  into place, so readers only ever see complete files.
+* Writers of the underlying rows call ``invalidate`` after committing,
+  which unlinks the file. Readers ``stat`` the path on every lookup and
+  drop their mapping when the file is gone or has a new inode. Mappings
+  already handed out stay valid, since an unlinked file lives on until
+  it is unmapped.
+* Publishing (read rows, write, replace) and unlinking both hold an
+  exclusive ``flock`` on the directory's lock file. A publish therefore
+  either finishes before a concurrent invalidation and is removed by it,
+  or starts after it and reads the new rows.
+* ``publish_many`` reads and writes its temp files without the lock, and
+  takes it only around each rename. Every invalidation bumps a counter
+  in ``.generation``, and a rename is skipped once the counter has moved
+  since the rows were read.
+
+Settings come from the environment:
+
+    ARRAY_CACHE_DIR          directory for the files (default: next to the database)
+    ARRAY_CACHE_MAX_TICKERS  files kept; the oldest published go first (0 disables)
+    ARRAY_CACHE_MIN_READS    reads within a worker before a ticker is published
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import db
+import metrics
+import price_store
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+ARRAY_CACHE_DIR = os.environ.get("ARRAY_CACHE_DIR", "")
+ARRAY_CACHE_MAX_TICKERS = int(os.environ.get("ARRAY_CACHE_MAX_TICKERS", "500"))
+ARRAY_CACHE_MIN_READS = int(os.environ.get("ARRAY_CACHE_MIN_READS", "2"))
+
+_lock = threading.Lock()
+# ticker -> (mapped array, inode, mtime_ns)
+_maps: Dict[str, Tuple[np.ndarray, int, int]] = {}
+_reads: Dict[str, int] = {}
+
+
+def enabled() -> bool:
+    return ARRAY_CACHE_MAX_TICKERS > 0
+
+
+def directory() -> Path:
+    return Path(ARRAY_CACHE_DIR) if ARRAY_CACHE_DIR else Path(f"{db.DB_PATH}.arrays")
+
+
+def _path(ticker: str) -> Path:
+    # The symbol becomes a file name, so it must not carry separators
+    if not price_store.valid_ticker(ticker):
+        raise ValueError(f"Invalid ticker: {ticker!r}")
+    return directory() / f"{ticker.upper()}.npy"
+
+
+@contextmanager
+def _exclusive():
+    path = directory()
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / ".lock", "a+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield path
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def load(ticker: str) -> Optional[np.ndarray]:
+    """The published array for ``ticker`` (read-only, shared), or None."""
+    if not enabled() or not price_store.valid_ticker(ticker):
+        return None
+    ticker = ticker.upper()
+    try:
+        stat = os.stat(_path(ticker))
+    except FileNotFoundError:
+        with _lock:
+            _maps.pop(ticker, None)
+        return None
+
+    held = _maps.get(ticker)
+    if held is not None and held[1:] == (stat.st_ino, stat.st_mtime_ns):
+        metrics.increment('shared_array_hits')
+        return held[0]
+    try:
+        array = np.load(_path(ticker), mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+        # Unlinked (or replaced) between the stat and the open
+        return None
+    with _lock:
+        _maps[ticker] = (array, stat.st_ino, stat.st_mtime_ns)
+    metrics.increment('shared_array_hits')
+    return array
+
+
+def note_read(ticker: str) -> bool:
+    """Count a read that missed; True once ``ticker`` is hot enough to publish."""
+    if not enabled() or not price_store.valid_ticker(ticker):
+        return False
+    ticker = ticker.upper()
+    with _lock:
+        _reads[ticker] = _reads.get(ticker, 0) + 1
+        return _reads[ticker] >= ARRAY_CACHE_MIN_READS
+
+
+def publish(ticker: str, read: Callable[[], Optional[np.ndarray]]) -> Optional[np.ndarray]:
+    """Publish the array returned by ``read`` and return its shared mapping.
+
+    ``read`` runs under the directory lock so an invalidation can't slip
+    between reading the rows and replacing the file. Nothing is written
+    when it returns None.
+    """
+    ticker = ticker.upper()
+    with _exclusive() as path:
+        array = read()
+        if array is None:
+            return None
+        _write(path, ticker, array)
+        _evict_oldest(path)
+    with _lock:
+        _reads.pop(ticker, None)
+    metrics.increment('shared_array_publishes')
+    return load(ticker)
+
+
+def publish_many(tickers: List[str],
+                 read: Callable[[List[str]], Iterable[Tuple[str, np.ndarray]]]) -> int:
+    """Publish arrays for those of ``tickers`` that have none; return how many.
+
+    ``read`` gets the missing tickers and yields ``(ticker, array)`` pairs,
+    so they can all come from one pass over the rows. Unlike ``publish``,
+    it runs outside the directory lock, which is only held per rename;
+    files read before a concurrent invalidation are discarded. At most
+    ``ARRAY_CACHE_MAX_TICKERS`` tickers are considered.
+    """
+    if not enabled() or not tickers:
+        return 0
+    with _exclusive() as path:
+        generation = _generation(path)
+    missing = [t.upper() for t in tickers[:ARRAY_CACHE_MAX_TICKERS]
+               if price_store.valid_ticker(t) and not _path(t).exists()]
+    published = 0
+    if missing:
+        for ticker, array in read(missing):
+            tmp = _save(path, array)
+            with _exclusive():
+                current = _generation(path) == generation
+                if current:
+                    os.replace(tmp, _path(ticker))
+            if not current:
+                # Rows may have changed since they were read; later arrays too
+                os.unlink(tmp)
+                break
+            published += 1
+        with _exclusive():
+            _evict_oldest(path)
+    metrics.increment('shared_array_publishes', published)
+    return published
+
+
+def _save(path: Path, array: np.ndarray) -> str:
+    """Write ``array`` to a new temp file in ``path``; return its name."""
+    fd, tmp = tempfile.mkstemp(dir=path, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            np.save(handle, np.ascontiguousarray(array))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp
+
+
+def _write(path: Path, ticker: str, array: np.ndarray) -> None:
+    tmp = _save(path, array)
+    try:
+        os.replace(tmp, _path(ticker))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _generation(path: Path) -> int:
+    try:
+        return int((path / ".generation").read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _bump_generation(path: Path) -> None:
+    # Only called under the directory lock
+    (path / ".generation").write_text(str(_generation(path) + 1))
+
+
+def _evict_oldest(path: Path) -> None:
+    files = sorted(path.glob("*.npy"), key=lambda p: p.stat().st_mtime_ns)
+    for stale in files[:max(len(files) - ARRAY_CACHE_MAX_TICKERS, 0)]:
+        stale.unlink(missing_ok=True)
+
+
+def invalidate(*tickers: str) -> None:
+    """Drop published arrays; call after committing changes to their rows."""
+    if not enabled() or not directory().exists():
+        return
+    with _exclusive() as path:
+        _bump_generation(path)
+        for ticker in tickers:
+            # Symbols that can't name a file were never published
+            if price_store.valid_ticker(ticker):
+                _path(ticker).unlink(missing_ok=True)
+    with _lock:
+        for ticker in tickers:
+            _maps.pop(ticker.upper(), None)
+    metrics.increment('shared_array_invalidations', len(tickers))
+
+
+def clear() -> None:
+    """Remove every published file and forget this worker's mappings."""
+    if directory().exists():
+        with _exclusive() as path:
+            _bump_generation(path)
+            for stale in path.glob("*.npy"):
+                stale.unlink(missing_ok=True)
+    with _lock:
+        _maps.clear()
+        _reads.clear()
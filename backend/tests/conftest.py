@@ -0,0 +1,50 @@
+import pytest
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture(autouse=True, scope='session')
+def cache_db(tmp_path_factory):
+    """Run the suite against a migrated throwaway database."""
+    path = tmp_path_factory.mktemp('cache') / 'price_cache.db'
+    with patch('db.DB_PATH', path):
+        from db import init_db
+        init_db()
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def upstream_state():
+    """Give each test an unthrottled limiter and a closed circuit breaker."""
+    import upstream
+    with patch('upstream.limiter', upstream.TokenBucket(0, 1, 100)), \
+            patch('upstream.breaker', upstream.CircuitBreaker(5, 30)):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def negative_cache_state():
+    """Don't let tickers remembered as missing leak between tests."""
+    import negative_cache
+    yield
+    negative_cache.purge()
+
+
+@pytest.fixture(autouse=True)
+def shared_array_state():
+    """Start each test without published arrays, since tests write rows directly."""
+    import shared_arrays
+    shared_arrays.clear()
+    yield
+    shared_arrays.clear()
+
+
+@pytest.fixture(autouse=True)
+def benchmark_state():
+    """Build the benchmark from each test's own bars rather than an earlier test's."""
+    import beta
+    beta.clear_cache()
+    yield
+    beta.clear_cache()
@@ -0,0 +1,151 @@
+import pytest
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+import compute
+
+
+def price_frame(days=300, seed=0, drop=()):
+    """Daily bars ending at the last session with a seeded random walk."""
+    dates = pd.bdate_range(end='2024-06-28', periods=days)
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    df = pd.DataFrame({'adj_close': prices}, index=dates)
+    df = df.drop(df.index[list(drop)])
+    df.attrs['stale'] = False
+    return df
+
+
+def beta_of(market_df, ticker_df):
+    import beta
+    market = beta.build('SPY', market_df.index.values, compute.as_float_array(market_df['adj_close']))
+    returns = compute.log_returns(compute.as_float_array(ticker_df['adj_close']))
+    stds = {window: compute.rolling_std(returns, window) for window in beta.WINDOWS}
+    return beta.rolling_beta(market, ticker_df.index.values, returns, stds)
+
+
+class TestRollingBeta:
+    """Test rolling beta and correlation against the benchmark."""
+
+    @pytest.mark.parametrize('window', [30, 90])
+    def test_matches_pandas_rolling(self, window):
+        """Test that beta and correlation match pandas rolling cov, var and corr."""
+        market_df, ticker_df = price_frame(seed=1), price_frame(seed=2)
+        m = np.log(market_df['adj_close']).diff()
+        r = np.log(ticker_df['adj_close']).diff()
+
+        beta, correlation = beta_of(market_df, ticker_df)[window]
+
+        expected_beta = (r.rolling(window).cov(m) / m.rolling(window).var()).to_numpy()
+        np.testing.assert_allclose(beta, expected_beta, rtol=1e-8)
+        np.testing.assert_allclose(correlation, r.rolling(window).corr(m).to_numpy(), rtol=1e-8)
+
+    def test_beta_of_benchmark_with_itself_is_one(self):
+        """Test that the benchmark measured against itself has beta and correlation 1."""
+        df = price_frame()
+
+        beta, correlation = beta_of(df, df)[30]
+
+        np.testing.assert_allclose(beta[30:], 1.0)
+        np.testing.assert_allclose(correlation[30:], 1.0)
+
+    def test_missing_bar_blanks_windows_containing_it(self):
+        """Test that a return spanning a gap in the ticker's bars isn't compared."""
+        market_df, ticker_df = price_frame(seed=1), price_frame(seed=2, drop=[100])
+
+        beta, _ = beta_of(market_df, ticker_df)[30]
+
+        # Ticker position 100 is the return across the missing bar
+        assert np.isnan(beta[100:130]).all()
+        assert np.isfinite(beta[130:]).all()
+        assert np.isfinite(beta[30:100]).all()
+
+    def test_ticker_outside_benchmark_dates(self):
+        """Test that no overlap gives all-NaN results."""
+        market_df = price_frame(seed=1)
+        ticker_df = price_frame(seed=2)
+        ticker_df.index = ticker_df.index - pd.DateOffset(years=5)
+
+        for beta, correlation in beta_of(market_df, ticker_df).values():
+            assert np.isnan(beta).all() and np.isnan(correlation).all()
+
+
+class TestBenchmarkCache:
+    """Test the shared benchmark cache."""
+
+    def test_built_once_per_session(self):
+        """Test that the benchmark is loaded once and then shared."""
+        import metrics
+        from beta import get_benchmark
+
+        metrics.reset()
+        calls = []
+        load = lambda ticker, years: calls.append((ticker, years)) or price_frame()
+
+        first = get_benchmark(5, load)
+        assert get_benchmark(5, load) is first
+        assert calls == [('SPY', 5)]
+        counters = metrics.snapshot()['counters']
+        assert counters['benchmark_cache_hits'] == 1
+        assert counters['benchmark_cache_misses'] == 1
+
+    def test_concurrent_misses_build_once(self):
+        """Test that threads missing the same key wait for a single load."""
+        import threading
+        import time
+        from beta import get_benchmark
+
+        calls = []
+
+        def load(ticker, years):
+            calls.append(ticker)
+            time.sleep(0.05)
+            return price_frame()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_benchmark(5, load))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ['SPY']
+        assert len(results) == 8 and all(result is results[0] for result in results)
+
+    def test_stale_bars_not_cached(self):
+        """Test that a benchmark built from stale bars is rebuilt next time."""
+        from beta import get_benchmark
+
+        df = price_frame()
+        df.attrs['stale'] = True
+        calls = []
+        load = lambda ticker, years: calls.append(ticker) or df
+
+        get_benchmark(5, load)
+        get_benchmark(5, load)
+        assert len(calls) == 2
+
+    def test_invalidate(self):
+        """Test that invalidating the benchmark ticker drops its entries."""
+        from beta import get_benchmark, invalidate
+
+        calls = []
+        load = lambda ticker, years: calls.append(ticker) or price_frame()
+
+        get_benchmark(5, load)
+        invalidate('QQQ')
+        get_benchmark(5, load)
+        invalidate('SPY')
+        get_benchmark(5, load)
+        assert len(calls) == 2
+
+    def test_ticker_from_environment_setting(self):
+        """Test that BENCHMARK_TICKER picks the index that is loaded."""
+        from beta import get_benchmark
+
+        with patch('beta.BENCHMARK_TICKER', 'QQQ'):
+            assert get_benchmark(5, lambda ticker, years: price_frame()).ticker == 'QQQ'
@@ -0,0 +1,209 @@
+import pytest
+import pandas as pd
+import numpy as np
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Point the cache at an empty database for the duration of a test."""
+    with patch('db.DB_PATH', tmp_path / 'bulk.db'):
+        from db import init_db
+        init_db()
+        yield tmp_path
+
+
+def write_ticker_csv(path, days=10, start='2024-01-01'):
+    dates = pd.date_range(start, periods=days, freq='D')
+    df = pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Open': np.arange(days) + 100.0,
+        'High': np.arange(days) + 105.0,
+        'Low': np.arange(days) + 95.0,
+        'Close': np.arange(days) + 102.0,
+        'Adj Close': np.arange(days) + 101.0,
+        'Volume': [1000000] * days,
+    })
+    df.to_csv(path, index=False)
+    return df
+
+
+class TestImportFiles:
+    """Test the import_files function."""
+
+    def test_imports_single_ticker_file(self, temp_db):
+        """Test that a per-ticker file is loaded under its file name."""
+        from bulk_load import import_files
+        from cache import get_cached_data
+
+        path = temp_db / 'spy.csv'
+        write_ticker_csv(path, days=10)
+
+        stats = import_files([path])
+        result = get_cached_data('SPY', '2024-01-01', '2024-01-31')
+
+        assert stats['rows'] == 10
+        assert stats['tickers'] == 1
+        assert len(result) == 10
+        assert result['adj_close'].iloc[0] == 101.0
+
+    def test_explicit_ticker_overrides_file_name(self, temp_db):
+        """Test that --ticker is used for files without a ticker column."""
+        from bulk_load import import_files
+        from cache import get_cached_data
+
+        path = temp_db / 'dump.csv'
+        write_ticker_csv(path, days=5)
+
+        import_files([path], ticker='aapl')
+
+        assert len(get_cached_data('AAPL', '2024-01-01', '2024-01-31')) == 5
+
+    def test_imports_long_file_in_chunks(self, temp_db):
+        """Test that a long file with a ticker column streams in small chunks."""
+        from bulk_load import import_files
+        from cache import get_cached_data
+
+        dates = pd.date_range('2024-01-01', periods=20, freq='D').strftime('%Y-%m-%d')
+        df = pd.DataFrame({
+            'ticker': ['spy'] * 20 + ['qqq'] * 20,
+            'date': list(dates) * 2,
+            'close': np.linspace(100, 140, 40),
+            'volume': [500] * 40,
+        })
+        path = temp_db / 'long.csv'
+        df.to_csv(path, index=False)
+
+        stats = import_files([path], chunk_size=7)
+
+        assert stats['rows'] == 40
+        assert stats['tickers'] == 2
+        qqq = get_cached_data('QQQ', '2024-01-01', '2024-01-31')
+        assert len(qqq) == 20
+        # Missing adj_close falls back to close
+        assert (qqq['adj_close'] == qqq['close']).all()
+
+    def test_replaces_existing_rows(self, temp_db):
+        """Test that reimporting the same dates replaces rather than duplicates."""
+        from bulk_load import import_files
+        from cache import get_cached_data
+
+        path = temp_db / 'spy.csv'
+        write_ticker_csv(path, days=5)
+        import_files([path])
+        import_files([path])
+
+        assert len(get_cached_data('SPY', '2024-01-01', '2024-01-31')) == 5
+
+    def test_mark_fresh_updates_metadata(self, temp_db):
+        """Test that mark_fresh makes imported tickers skip the refetch."""
+        from bulk_load import import_files
+        from cache import needs_update
+
+        path = temp_db / 'msft.csv'
+        write_ticker_csv(path, days=5)
+
+        import_files([path])
+        assert needs_update('MSFT') is True
+
+        import_files([path], mark_fresh=True)
+        assert needs_update('MSFT') is False
+
+    def test_cleans_and_records_flags(self, temp_db):
+        """Test that imported bars go through the same cleaning as fetched ones."""
+        from bulk_load import import_files
+        from cache import get_cached_data
+        from quality import get_report
+
+        path = temp_db / 'spy.csv'
+        df = write_ticker_csv(path, days=30, start='2024-01-02')
+        df.loc[10, ['Close', 'Adj Close']] = [300.0, 300.0]
+        df.loc[20, 'Open'] = np.nan
+        df.to_csv(path, index=False)
+
+        stats = import_files([path])
+
+        result = get_cached_data('SPY', '2024-01-01', '2024-02-29')
+        flags = get_report('SPY')['counts']
+        assert len(result) == 29
+        assert pd.Timestamp(df.loc[10, 'Date']) not in result.index
+        assert result.loc[pd.Timestamp(df.loc[20, 'Date']), 'open'] == df.loc[20, 'Close']
+        assert flags['spike'] == 1 and flags['filled'] == 1
+        assert stats['flagged'] >= 2
+
+    def test_invalid_ticker_rejected_before_staging(self, temp_db):
+        """Test that symbols the API would reject are never stored."""
+        from bulk_load import import_files
+        from db import get_connection
+
+        path = temp_db / 'long.csv'
+        pd.DataFrame({'ticker': ['SPY', '../X'], 'date': ['2024-01-02'] * 2,
+                      'close': [1.0, 2.0]}).to_csv(path, index=False)
+
+        with pytest.raises(ValueError, match="long.csv: Invalid ticker symbols: '../X'"):
+            import_files([path])
+        conn = get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM tickers").fetchone()[0] == 0
+        conn.close()
+
+    def test_missing_close_column_raises(self, temp_db):
+        """Test that files without prices are rejected."""
+        from bulk_load import import_files
+
+        path = temp_db / 'bad.csv'
+        pd.DataFrame({'date': ['2024-01-01'], 'volume': [1]}).to_csv(path, index=False)
+
+        with pytest.raises(ValueError, match="close"):
+            import_files([path])
+
+
+class TestExportCache:
+    """Test the export_cache function."""
+
+    def test_round_trip(self, temp_db):
+        """Test that an export can be reimported unchanged."""
+        from bulk_load import import_files, export_cache, EXPORT_COLUMNS
+
+        write_ticker_csv(temp_db / 'spy.csv', days=8)
+        write_ticker_csv(temp_db / 'iwm.csv', days=4)
+        import_files([temp_db / 'spy.csv', temp_db / 'iwm.csv'])
+
+        out = temp_db / 'export.csv'
+        stats = export_cache(str(out), chunk_size=3)
+        exported = pd.read_csv(out)
+
+        assert stats['rows'] == 12
+        assert list(exported.columns) == EXPORT_COLUMNS
+        assert sorted(exported['ticker'].unique()) == ['IWM', 'SPY']
+
+    def test_filters_tickers(self, temp_db):
+        """Test that only requested tickers are exported."""
+        from bulk_load import import_files, export_cache
+
+        write_ticker_csv(temp_db / 'spy.csv', days=8)
+        write_ticker_csv(temp_db / 'iwm.csv', days=4)
+        import_files([temp_db / 'spy.csv', temp_db / 'iwm.csv'])
+
+        out = temp_db / 'export.csv'
+        stats = export_cache(str(out), tickers=['iwm'])
+
+        assert stats['rows'] == 4
+        assert set(pd.read_csv(out)['ticker']) == {'IWM'}
+
+
+class TestMain:
+    """Test the command-line entry point."""
+
+    def test_import_and_export_commands(self, temp_db):
+        """Test that the CLI dispatches to import and export."""
+        from bulk_load import main
+
+        write_ticker_csv(temp_db / 'spy.csv', days=3)
+        out = temp_db / 'out.csv'
+
+        assert main(['import', str(temp_db / 'spy.csv'), '--quiet']) == 0
+        assert main(['export', str(out), '--quiet']) == 0
+        assert len(pd.read_csv(out)) == 3
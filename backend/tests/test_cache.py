@@ -2,7 +2,7 @@ import pytest
 import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 import tempfile
@@ -33,18 +33,17 @@ class TestGetConnection:
 class TestInitDb:
     """Test the init_db function."""
 
-    def test_creates_daily_prices_table(self):
-        """Test that init_db creates daily_prices table."""
+    def test_creates_prices_tables(self):
+        """Test that init_db creates the prices and tickers tables."""
         from cache import init_db, get_connection
 
         conn = get_connection()
-        cursor = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='daily_prices'"
-        )
-        result = cursor.fetchone()
+        tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('prices', 'tickers')"
+        )}
         conn.close()
 
-        assert result is not None
+        assert tables == {'prices', 'tickers'}
 
     def test_creates_cache_metadata_table(self):
         """Test that init_db creates cache_metadata table."""
@@ -225,11 +224,64 @@ class TestNeedsUpdate:
 
         assert result is False
 
+    def _set_fetch(self, ticker, last_updated, fetched_at):
+        from cache import get_connection
+        conn = get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_metadata (ticker, last_updated, fetched_at) VALUES (?, ?, ?)",
+            (ticker, last_updated, fetched_at),
+        )
+        conn.commit()
+        conn.close()
+
+    def test_weekend_does_not_refetch(self):
+        """Test that a fetch after Friday's close stays fresh over the weekend."""
+        from cache import needs_update
+        import metrics
+
+        # Friday 2024-03-08 17:00 New York, checked Sunday
+        self._set_fetch('CAL_WEEKEND', '2024-03-08', '2024-03-08T22:00:00+00:00')
+        before = metrics.snapshot()['counters'].get('cache_fetches_avoided', 0)
+
+        result = needs_update('CAL_WEEKEND', now=datetime(2024, 3, 10, 15, 0, tzinfo=timezone.utc))
+
+        assert result is False
+        assert metrics.snapshot()['counters']['cache_fetches_avoided'] == before + 1
+
+    def test_holiday_does_not_refetch(self):
+        """Test that an exchange holiday does not trigger a refetch."""
+        from cache import needs_update
+
+        # Thursday before Good Friday 2024-03-29, checked on the holiday evening
+        self._set_fetch('CAL_HOLIDAY', '2024-03-28', '2024-03-28T21:00:00+00:00')
+
+        assert needs_update('CAL_HOLIDAY', now=datetime(2024, 3, 29, 23, 0, tzinfo=timezone.utc)) is False
+
+    def test_fetch_before_close_goes_stale_after_close(self):
+        """Test that an intraday fetch is refreshed once the session's bar is final."""
+        from cache import needs_update
+
+        # Fetched Tuesday 11:00 New York
+        self._set_fetch('CAL_INTRADAY', '2024-03-12', '2024-03-12T15:00:00+00:00')
+
+        assert needs_update('CAL_INTRADAY', now=datetime(2024, 3, 12, 19, 0, tzinfo=timezone.utc)) is False
+        assert needs_update('CAL_INTRADAY', now=datetime(2024, 3, 12, 21, 0, tzinfo=timezone.utc)) is True
+
+    def test_legacy_row_without_fetch_time(self):
+        """Test that rows without fetched_at fall back to the fetch date."""
+        from cache import needs_update
+
+        self._set_fetch('CAL_LEGACY', '2024-03-09', None)
+
+        # Saturday's fetch covers Friday's bar until Monday's close
+        assert needs_update('CAL_LEGACY', now=datetime(2024, 3, 11, 15, 0, tzinfo=timezone.utc)) is False
+        assert needs_update('CAL_LEGACY', now=datetime(2024, 3, 11, 21, 0, tzinfo=timezone.utc)) is True
+
 
 class TestFetchFromYahoo:
     """Test the fetch_from_yahoo function."""
 
-    @patch('cache.requests.get')
+    @patch('upstream.requests.Session.get')
     def test_returns_dataframe(self, mock_get):
         """Test that fetch_from_yahoo returns a DataFrame."""
         from cache import fetch_from_yahoo
@@ -265,7 +317,7 @@ class TestFetchFromYahoo:
         assert isinstance(result, pd.DataFrame)
         assert not result.empty
 
-    @patch('cache.requests.get')
+    @patch('upstream.requests.Session.get')
     def test_raises_for_no_data(self, mock_get):
         """Test that missing chart data raises ValueError."""
         from cache import fetch_from_yahoo
@@ -285,7 +337,19 @@ class TestFetchFromYahoo:
         with pytest.raises(ValueError, match="No data found"):
             fetch_from_yahoo('INVALID', start, end)
 
-    @patch('cache.requests.get')
+    @patch('upstream.requests.Session.get')
+    def test_raises_for_upstream_404(self, mock_get):
+        """Test that an unknown symbol reported as HTTP 404 raises ValueError."""
+        from cache import fetch_from_yahoo
+
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_get.return_value = mock_response
+
+        with pytest.raises(ValueError, match="No data found"):
+            fetch_from_yahoo('INVALID', datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    @patch('upstream.requests.Session.get')
     def test_raises_for_no_timestamps(self, mock_get):
         """Test that missing timestamps raises ValueError."""
         from cache import fetch_from_yahoo
@@ -310,7 +374,7 @@ class TestFetchFromYahoo:
         with pytest.raises(ValueError, match="No price data found"):
             fetch_from_yahoo('TEST', start, end)
 
-    @patch('cache.requests.get')
+    @patch('upstream.requests.Session.get')
     def test_handles_missing_adjclose(self, mock_get):
         """Test handling when adjclose is missing from response."""
         from cache import fetch_from_yahoo
@@ -342,7 +406,7 @@ class TestFetchFromYahoo:
         # Should use close price as adj_close
         assert 'adj_close' in result.columns
 
-    @patch('cache.requests.get')
+    @patch('upstream.requests.Session.get')
     def test_uppercase_ticker(self, mock_get):
         """Test that ticker is converted to uppercase."""
         from cache import fetch_from_yahoo
@@ -440,6 +504,38 @@ class TestFetchAndCache:
         with pytest.raises(ValueError, match="No data found"):
             fetch_and_cache('INVALID', years=1)
 
+    @patch('cache.fetch_from_yahoo')
+    @patch('cache.needs_update')
+    def test_remembers_tickers_without_data(self, mock_needs_update, mock_fetch):
+        """Test that a ticker with no upstream data is not fetched again."""
+        from cache import fetch_and_cache
+
+        mock_needs_update.return_value = True
+        mock_fetch.return_value = pd.DataFrame()
+
+        with pytest.raises(ValueError, match="No data found"):
+            fetch_and_cache('TYPO', years=1)
+        with pytest.raises(ValueError, match="No data found"):
+            fetch_and_cache('typo', years=1)
+
+        assert mock_fetch.call_count == 1
+
+    @patch('cache.fetch_from_yahoo')
+    @patch('cache.needs_update')
+    def test_does_not_remember_upstream_failures(self, mock_needs_update, mock_fetch):
+        """Test that outages are not mistaken for unknown tickers."""
+        from cache import fetch_and_cache
+        from upstream import UpstreamUnavailable
+
+        mock_needs_update.return_value = True
+        mock_fetch.side_effect = UpstreamUnavailable("down")
+
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                fetch_and_cache('SPY', years=1)
+
+        assert mock_fetch.call_count == 2
+
     @patch('cache.fetch_from_yahoo')
     @patch('cache.needs_update')
     def test_ticker_is_uppercase(self, mock_needs_update, mock_fetch):
@@ -463,3 +559,137 @@ class TestFetchAndCache:
 
         # Check needs_update was called with uppercase
         mock_needs_update.assert_called_with('SPY')
+
+
+def make_price_df(days=10, end='2024-01-31'):
+    dates = pd.date_range(end=end, periods=days, freq='D')
+    return pd.DataFrame({
+        'open': [100.0] * days,
+        'high': [105.0] * days,
+        'low': [95.0] * days,
+        'close': [102.0] * days,
+        'adj_close': [102.0] * days,
+        'volume': [1000000] * days,
+    }, index=dates)
+
+
+class TestStaleWhileRevalidate:
+    """Test serving stale cached data while refreshing in the background."""
+
+    @patch('cache.schedule_refresh')
+    @patch('cache.fetch_from_yahoo')
+    @patch('cache.get_cached_data')
+    @patch('cache.last_updated')
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.CACHE_STALE_WHILE_REVALIDATE', True)
+    def test_serves_stale_and_schedules_refresh(self, mock_needs_update, mock_last_updated,
+                                                mock_get_cached, mock_fetch, mock_schedule):
+        """Test that out-of-date data within the limit is returned immediately."""
+        from cache import fetch_and_cache
+
+        mock_last_updated.return_value = datetime.now().date() - timedelta(days=1)
+        mock_get_cached.return_value = make_price_df()
+
+        result = fetch_and_cache('SPY', years=1)
+
+        assert result.attrs['stale'] is True
+        assert not mock_fetch.called
+        mock_schedule.assert_called_once_with('SPY', 1)
+
+    @patch('cache.schedule_refresh')
+    @patch('cache.fetch_from_yahoo')
+    @patch('cache.get_cached_data')
+    @patch('cache.last_updated')
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.CACHE_STALE_WHILE_REVALIDATE', True)
+    @patch('cache.CACHE_MAX_STALENESS_DAYS', 3)
+    def test_refreshes_synchronously_past_max_staleness(self, mock_needs_update, mock_last_updated,
+                                                        mock_get_cached, mock_fetch, mock_schedule):
+        """Test that data older than the staleness limit is refetched inline."""
+        from cache import fetch_and_cache
+
+        mock_last_updated.return_value = datetime.now().date() - timedelta(days=4)
+        mock_fetch.return_value = make_price_df()
+
+        result = fetch_and_cache('SPY', years=1)
+
+        assert mock_fetch.called
+        assert not mock_schedule.called
+        assert result.attrs['stale'] is False
+
+    @patch('cache.fetch_from_yahoo')
+    @patch('cache.get_cached_data')
+    @patch('cache.needs_update', return_value=True)
+    def test_disabled_by_default(self, mock_needs_update, mock_get_cached, mock_fetch):
+        """Test that without opting in, out-of-date data is refetched inline."""
+        from cache import fetch_and_cache
+
+        mock_fetch.return_value = make_price_df()
+
+        fetch_and_cache('SPY', years=1)
+
+        assert mock_fetch.called
+        assert not mock_get_cached.called
+
+    @patch('cache.fetch_from_yahoo')
+    def test_refresh_is_deduplicated(self, mock_fetch):
+        """Test that concurrent refreshes of one ticker collapse into one fetch."""
+        import threading
+        import cache
+
+        release = threading.Event()
+
+        def slow_fetch(*args):
+            release.wait(5)
+            return make_price_df()
+
+        mock_fetch.side_effect = slow_fetch
+        try:
+            assert cache.schedule_refresh('swr', 1) is True
+            assert cache.schedule_refresh('SWR', 1) is False
+        finally:
+            release.set()
+            cache.shutdown_refresh(wait=True)
+
+        assert mock_fetch.call_count == 1
+        assert cache.last_updated('SWR') == datetime.now().date()
+        assert 'SWR' not in cache._refreshing
+
+
+class TestIterCachedRows:
+    """Test the iter_cached_rows and has_cached_data functions."""
+
+    def test_streams_ordered_chunks(self):
+        """Test that rows stream in date order with NULLs as NaN."""
+        from cache import save_to_cache, iter_cached_rows
+
+        dates = pd.date_range('2023-03-01', periods=7, freq='D')
+        df = pd.DataFrame({
+            'open': [100] * 7,
+            'high': [105] * 7,
+            'low': [95] * 7,
+            'close': [102, 103, None, 105, 106, 107, 108],
+            'adj_close': [102] * 7,
+            'volume': [1000000] * 7
+        }, index=dates)
+        save_to_cache('TEST_ITER', df)
+
+        chunks = list(iter_cached_rows('test_iter', end_date='2023-03-06', chunk_size=4))
+
+        assert [len(dates) for dates, _ in chunks] == [4, 2]
+        assert chunks[0][0][0] == '2023-03-01'
+        assert np.isnan(chunks[0][1]['close'][2])
+
+    def test_has_cached_data(self):
+        """Test that has_cached_data reflects stored rows."""
+        from cache import save_to_cache, has_cached_data
+
+        dates = pd.date_range('2023-04-01', periods=2, freq='D')
+        df = pd.DataFrame({
+            'open': [1, 1], 'high': [1, 1], 'low': [1, 1], 'close': [1, 1],
+            'adj_close': [1, 1], 'volume': [1, 1]
+        }, index=dates)
+        save_to_cache('TEST_HAS', df)
+
+        assert has_cached_data('test_has') is True
+        assert has_cached_data('TEST_HAS_NOT') is False
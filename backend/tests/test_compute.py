@@ -0,0 +1,253 @@
+import pytest
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+import compute
+
+
+def random_prices(days=400, seed=7):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+
+
+class TestLogReturns:
+    """Test the log_returns function."""
+
+    def test_matches_pandas_shift(self):
+        """Test that log returns match the pandas formulation."""
+        prices = random_prices()
+        s = pd.Series(prices)
+        expected = np.log(s / s.shift(1)).to_numpy()
+
+        np.testing.assert_array_equal(compute.log_returns(prices), expected)
+
+    def test_first_value_is_nan(self):
+        """Test that the first return is NaN."""
+        assert np.isnan(compute.log_returns(np.array([1.0, 2.0]))[0])
+
+    def test_empty_input(self):
+        """Test that an empty array gives an empty result."""
+        assert len(compute.log_returns(np.array([]))) == 0
+
+
+class TestRollingStd:
+    """Test the rolling_std function."""
+
+    @pytest.mark.parametrize('window', [2, 30, 90])
+    def test_matches_pandas_rolling(self, window):
+        """Test that rolling std matches pandas rolling().std()."""
+        returns = compute.log_returns(random_prices())
+        expected = pd.Series(returns).rolling(window=window).std().to_numpy()
+
+        np.testing.assert_allclose(compute.rolling_std(returns, window), expected, rtol=1e-8)
+
+    def test_nan_inside_window_propagates(self):
+        """Test that a NaN anywhere in the window yields NaN."""
+        values = np.arange(10, dtype=float)
+        values[4] = np.nan
+        result = compute.rolling_std(values, 3)
+
+        assert np.isnan(result[4:7]).all()
+        assert not np.isnan(result[7])
+
+    def test_short_input_is_all_nan(self):
+        """Test that a series shorter than the window is all NaN."""
+        assert np.isnan(compute.rolling_std(np.ones(5), 10)).all()
+
+
+class TestRollingCovariance:
+    """Test the window_deviations and rolling_covariance functions."""
+
+    @pytest.mark.parametrize('window', [2, 30, 90])
+    def test_matches_pandas_rolling(self, window):
+        """Test that rolling covariance matches pandas rolling().cov()."""
+        x = compute.log_returns(random_prices(seed=1))
+        y = compute.log_returns(random_prices(seed=2))
+        expected = pd.Series(x).rolling(window=window).cov(pd.Series(y)).to_numpy()
+
+        result = compute.rolling_covariance(x, compute.window_deviations(y, window), window)
+
+        np.testing.assert_allclose(result, expected, rtol=1e-8)
+
+    def test_nan_in_either_series_propagates(self):
+        """Test that a NaN in either window yields NaN."""
+        x, y = np.arange(10, dtype=float), np.arange(10, dtype=float) ** 2
+        x[2], y[6] = np.nan, np.nan
+        result = compute.rolling_covariance(x, compute.window_deviations(y, 3), 3)
+
+        assert np.isnan(result[:5]).all() and np.isnan(result[6:9]).all()
+        assert not np.isnan(result[5]) and not np.isnan(result[9])
+
+    def test_short_input_is_all_nan(self):
+        """Test that a series shorter than the window is all NaN."""
+        assert np.isnan(compute.rolling_covariance(np.ones(5), compute.window_deviations(np.ones(5), 10), 10)).all()
+
+
+def random_ranges(n, count=200, seed=3):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, n - 1, count)
+    ends = np.minimum(starts + rng.integers(1, n // 2, count), n)
+    return starts, ends
+
+
+class TestRangeFunctions:
+    """Test the per-range helpers used by the batched as-of mode."""
+
+    def test_reduce_matches_slices(self):
+        """Test that range_reduce equals reducing each slice."""
+        values = random_prices()
+        starts, ends = random_ranges(len(values))
+
+        result = compute.range_reduce(np.fmax, values, starts, ends)
+
+        assert result.tolist() == [np.fmax.reduce(values[s:e]) for s, e in zip(starts, ends)]
+
+    def test_percentiles_identical_to_per_range_calls(self):
+        """Test that thresholds and percentile ranks equal the single-range functions."""
+        values = compute.annualized_vol(compute.log_returns(random_prices()), 30)[30:]
+        starts, ends = random_ranges(len(values))
+
+        with patch('compute.RANGE_BLOCK_CELLS', 1000):
+            cutoffs, ranks = compute.range_percentiles(values, starts, ends)
+
+        for s, e, row, rank in zip(starts, ends, cutoffs, ranks):
+            assert row.tolist() == compute.thresholds(values[s:e]).tolist()
+            assert rank == compute.percentile_of(values[s:e], values[e - 1])
+
+    def test_rsi_matches_per_range_calls(self):
+        """Test that batched RSI agrees with wilder_rsi on each slice."""
+        prices = random_prices()
+        starts, ends = random_ranges(len(prices))
+
+        result = compute.wilder_rsi_ranges(prices, starts, ends)
+
+        for s, e, value in zip(starts, ends, result):
+            expected = compute.wilder_rsi(prices[s:e])
+            if expected is None:
+                assert np.isnan(value)
+            else:
+                assert value == pytest.approx(expected, abs=1e-9)
+
+    def test_rsi_without_losses_or_gains(self):
+        """Test that one-way and flat ranges give exactly 100 and 0 like wilder_rsi."""
+        prices = np.concatenate([np.linspace(1, 2, 20), np.linspace(2, 1, 20)[1:]])
+
+        result = compute.wilder_rsi_ranges(prices, np.array([0, 20]), np.array([20, 39]))
+
+        assert result.tolist() == [100.0, 0.0]
+
+
+class TestThresholdsAndBuckets:
+    """Test the threshold, percentile and bucket helpers."""
+
+    def test_thresholds_match_pandas_quantile(self):
+        """Test that thresholds match pandas quantiles."""
+        values = random_prices()
+        s = pd.Series(values)
+        expected = [s.quantile(q) for q in (0.5, 0.9, 0.99)]
+
+        np.testing.assert_array_equal(compute.thresholds(values), expected)
+
+    def test_percentile_of(self):
+        """Test the share of values at or below a value."""
+        assert compute.percentile_of(np.array([1.0, 2.0, 3.0, 4.0]), 2.0) == 50.0
+
+    @pytest.mark.parametrize('value,expected', [
+        (0.1, '<p50'), (0.2, 'p50-p90'), (0.35, 'p90-p99'), (0.5, '>p99'),
+    ])
+    def test_bucket(self, value, expected):
+        """Test each bucket boundary."""
+        assert compute.bucket(value, 0.15, 0.3, 0.4) == expected
+
+    def test_range_ignores_nan(self):
+        """Test that range highs and lows skip missing values."""
+        values = np.array([5.0, np.nan, 7.0, 1.0])
+
+        assert compute.range_high(values, 3) == 7.0
+        assert compute.range_low(values, 3) == 1.0
+
+
+def naive_percentile_rank(values, window=None, start=0):
+    out = np.full(len(values), np.nan)
+    for i in range(start, len(values)):
+        if np.isnan(values[i]):
+            continue
+        lo = 0 if window is None else max(0, i - window + 1)
+        history = values[lo:i + 1]
+        out[i] = compute.percentile_of(history[~np.isnan(history)], values[i])
+    return out
+
+
+class TestRollingPercentileRank:
+    """Test the rolling_percentile_rank function."""
+
+    @pytest.mark.parametrize('window', [None, 1, 20, 252, 1000])
+    @pytest.mark.parametrize('start', [0, 150, 399])
+    def test_matches_naive_ranks(self, window, start):
+        """Test equality with percentile_of applied at every position."""
+        rng = np.random.default_rng(3)
+        # Few distinct levels so ties are common
+        values = rng.integers(0, 25, 400).astype(float)
+        values[[0, 17, 250]] = np.nan
+
+        result = compute.rolling_percentile_rank(values, window, start)
+
+        np.testing.assert_array_equal(result, naive_percentile_rank(values, window, start))
+
+    def test_expanding_rank_ends_at_current_percentile(self):
+        """Test that the last expanding rank equals percentile_of on the series."""
+        values = random_prices()
+
+        result = compute.rolling_percentile_rank(values)
+
+        assert result[-1] == compute.percentile_of(values, values[-1])
+
+    def test_all_nan_and_empty(self):
+        """Test degenerate inputs."""
+        assert np.isnan(compute.rolling_percentile_rank(np.array([np.nan, np.nan]))).all()
+        assert len(compute.rolling_percentile_rank(np.array([]))) == 0
+
+
+class TestWilderRsi:
+    """Test the wilder_rsi function."""
+
+    def test_too_short_returns_none(self):
+        """Test that fewer than period+1 prices gives None."""
+        assert compute.wilder_rsi(np.arange(10, dtype=float)) is None
+
+    def test_all_gains_is_100(self):
+        """Test that a monotonically rising series has RSI 100."""
+        assert compute.wilder_rsi(np.arange(20, dtype=float)) == 100.0
+
+    def test_in_valid_range(self):
+        """Test that RSI of a random walk is between 0 and 100."""
+        assert 0 <= compute.wilder_rsi(random_prices()) <= 100
+
+
+class TestPeriodReturns:
+    """Test the period_returns function."""
+
+    def test_offsets(self):
+        """Test daily, week and month offsets in trading days."""
+        prices = np.arange(100, 130, dtype=float)
+        years = np.full(30, 2020)
+        result = compute.period_returns(prices, years, 2020)
+
+        assert result['daily'] == (129 - 128) / 128
+        assert result['week'] == (129 - 124) / 124
+        assert result['month'] == (129 - 108) / 108
+        assert result['ytd'] == (129 - 100) / 100
+
+    def test_no_current_year(self):
+        """Test that YTD is None without observations in the current year."""
+        result = compute.period_returns(np.array([1.0, 2.0]), np.array([2020, 2020]), 2024)
+        assert result['ytd'] is None
+
+    def test_single_price(self):
+        """Test that one price gives no returns."""
+        result = compute.period_returns(np.array([1.0]), np.array([2024]), 2024)
+        assert all(v is None for v in result.values())
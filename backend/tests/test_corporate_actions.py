@@ -0,0 +1,279 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+def sessions(days, end=None):
+    """The last ``days`` NYSE sessions up to ``end`` (default: yesterday)."""
+    from trading_calendar import is_trading_day
+    end = end or date.today() - timedelta(days=1)
+    candidates = pd.bdate_range(end=end, periods=days * 2)
+    return pd.DatetimeIndex([d for d in candidates if is_trading_day(d.date())][-days:], name='date')
+
+
+def bars(index, close=100.0, adj_close=None, volume=1000):
+    close = np.broadcast_to(np.asarray(close, dtype=np.float64), len(index))
+    adj = close if adj_close is None else np.broadcast_to(np.asarray(adj_close, dtype=np.float64), len(index))
+    return pd.DataFrame({
+        'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close,
+        'adj_close': adj, 'volume': np.full(len(index), volume),
+    }, index=index)
+
+
+def stored(ticker):
+    from cache import get_connection
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT date(day * 86400, 'unixepoch') AS date, close, adj_close, volume
+        FROM prices WHERE ticker_id = (SELECT id FROM tickers WHERE symbol = ?) ORDER BY day
+    """, (ticker,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+class TestParseEvents:
+    """Test reading events from a chart API result."""
+
+    def test_dividends_and_splits(self):
+        """Test that events are keyed by New York date with amounts and ratios."""
+        from corporate_actions import parse_events
+
+        result = {'events': {
+            'dividends': {'1707316200': {'amount': 0.24, 'date': 1707316200}},
+            'splits': {'1717767000': {'date': 1717767000, 'numerator': 10, 'denominator': 1,
+                                      'splitRatio': '10:1'}},
+        }}
+
+        assert parse_events(result) == [('2024-02-07', 'dividend', 0.24), ('2024-06-07', 'split', 10.0)]
+        assert parse_events({}) == []
+
+    @patch('upstream.requests.Session.get')
+    def test_fetch_attaches_events(self, mock_get):
+        """Test that fetch_from_yahoo requests events and attaches them to the frame."""
+        from cache import fetch_from_yahoo
+
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'chart': {'result': [{
+            'timestamp': [1707316200],
+            'events': {'dividends': {'1707316200': {'amount': 0.24, 'date': 1707316200}}},
+            'indicators': {'quote': [{'open': [1.0], 'high': [1.0], 'low': [1.0], 'close': [1.0],
+                                      'volume': [10]}]},
+        }]}}
+
+        df = fetch_from_yahoo('MSFT', datetime(2024, 2, 1), datetime(2024, 2, 8))
+
+        assert mock_get.call_args.kwargs['params']['events'] == 'div,splits'
+        assert df.attrs['events'] == [('2024-02-07', 'dividend', 0.24)]
+
+
+class TestReconcile:
+    """Test rescaling stored history to a revised fetch."""
+
+    def test_unchanged_overlap_leaves_history(self):
+        """Test that matching overlap bars rewrite nothing."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+
+        index = sessions(30)
+        save_to_cache('CA_SAME', bars(index[:25]))
+
+        assert reconcile('CA_SAME', bars(index[20:]), []) is False
+
+    def test_dividend_rescales_adjusted_close_only(self):
+        """Test that a dividend scales older adj closes and leaves raw prices."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+        import metrics
+
+        index = sessions(30)
+        save_to_cache('CA_DIV', bars(index[:25]))
+        metrics.reset()
+        event = (index[27].strftime('%Y-%m-%d'), 'dividend', 1.0)
+
+        revised = bars(index[20:], adj_close=[99.0] * 7 + [100.0] * 3)
+        assert reconcile('CA_DIV', revised, [event]) is True
+
+        rows = stored('CA_DIV')
+        assert rows[0]['adj_close'] == pytest.approx(99.0)
+        assert rows[0]['close'] == 100.0
+        assert rows[0]['volume'] == 1000
+        counters = metrics.snapshot()['counters']
+        assert counters['price_revisions'] == 1
+        assert 'price_revisions_unexplained' not in counters
+
+    def test_split_rescales_prices_and_volume(self):
+        """Test that a 2:1 split halves older prices and doubles volume."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+
+        index = sessions(30)
+        save_to_cache('CA_SPLIT', bars(index[:25]))
+
+        revised = bars(index[20:], close=50.0, volume=2000)
+        reconcile('CA_SPLIT', revised, [(index[27].strftime('%Y-%m-%d'), 'split', 2.0)])
+
+        rows = stored('CA_SPLIT')
+        assert (rows[0]['close'], rows[0]['adj_close'], rows[0]['volume']) == (50.0, 50.0, 2000)
+
+    def test_revision_without_event_is_counted(self):
+        """Test that a revision with no recorded event is flagged as unexplained."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+        import metrics
+
+        index = sessions(30)
+        save_to_cache('CA_ODD', bars(index[:25]))
+        metrics.reset()
+
+        reconcile('CA_ODD', bars(index[20:], adj_close=98.0), [])
+
+        assert metrics.snapshot()['counters']['price_revisions_unexplained'] == 1
+
+    def test_rescales_persisted_forecast_state(self):
+        """Test that the stored forecast state follows the rescaled history."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+        from forecast import ForecastState, load_state, save_state
+
+        index = sessions(30)
+        save_to_cache('CA_FC', bars(index[:25]))
+        state = ForecastState(index[10].strftime('%Y-%m-%d'), 100.0, 10, 1e-4, 1e-6, 0.05, 0.9, 1e-4, 10, 'x')
+        save_state('CA_FC', state)
+
+        reconcile('CA_FC', bars(index[20:], adj_close=[90.0] * 7 + [100.0] * 3),
+                  [(index[27].strftime('%Y-%m-%d'), 'dividend', 10.0)])
+
+        assert load_state('CA_FC').last_price == pytest.approx(90.0)
+
+    @patch('forecast._fit')
+    def test_forecast_state_in_overlap_rolls_forward(self, mock_fit):
+        """Test that a state ending inside the overlap takes the revised price and isn't refit."""
+        from cache import save_to_cache, get_cached_data
+        from corporate_actions import reconcile
+        from forecast import ForecastState, load_state, save_state, update_state
+
+        index = sessions(130)
+        history = bars(index[:125], adj_close=np.linspace(90, 100, 125))
+        save_to_cache('CA_FC_NEW', history)
+        last = index[122].strftime('%Y-%m-%d')
+        state = ForecastState(last, float(history['adj_close'].iloc[122]), 121, 1e-4, 1e-6, 0.05, 0.9, 1e-4, 121, 'x')
+        save_state('CA_FC_NEW', state)
+
+        revised = bars(index[120:], adj_close=np.r_[history['adj_close'].to_numpy()[120:] * 0.9, [100.0] * 5])
+        reconcile('CA_FC_NEW', revised, [(index[127].strftime('%Y-%m-%d'), 'dividend', 10.0)])
+        save_to_cache('CA_FC_NEW', revised)
+
+        rescaled = load_state('CA_FC_NEW')
+        assert rescaled.last_price == pytest.approx(revised['adj_close'].iloc[2])
+        df = get_cached_data('CA_FC_NEW', '2000-01-01', '2100-01-01')
+        update_state(df.index.values, df['adj_close'].to_numpy(), rescaled)
+        assert not mock_fit.called
+
+    def test_new_event_without_overlap_drops_history(self):
+        """Test that history which can't be measured against is deleted."""
+        from cache import save_to_cache
+        from corporate_actions import reconcile
+
+        index = sessions(30)
+        save_to_cache('CA_GAP', bars(index[:10]))
+
+        assert reconcile('CA_GAP', bars(index[20:]), [(index[25].strftime('%Y-%m-%d'), 'split', 2.0)])
+        assert stored('CA_GAP') == []
+
+    def test_events_recorded_once(self):
+        """Test that repeated events are stored once."""
+        from cache import get_connection, save_to_cache
+        from corporate_actions import reconcile
+
+        index = sessions(10)
+        save_to_cache('CA_ONCE', bars(index))
+        event = (index[5].strftime('%Y-%m-%d'), 'dividend', 0.5)
+
+        reconcile('CA_ONCE', bars(index[5:]), [event])
+        reconcile('CA_ONCE', bars(index[5:]), [event])
+
+        conn = get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM corporate_actions WHERE ticker = 'CA_ONCE'").fetchone()[0]
+        conn.close()
+        assert count == 1
+
+
+class TestIncrementalUpdate:
+    """Test that updates fetch only recent bars and apply revisions."""
+
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.fetch_from_yahoo')
+    def test_fetches_only_after_cache(self, mock_fetch, mock_needs_update):
+        """Test that a cached ticker is updated from shortly before its last bar."""
+        from cache import fetch_and_cache, save_to_cache
+
+        index = sessions(300)
+        save_to_cache('CA_INC', bars(index[:-5]))
+        mock_fetch.return_value = bars(index[-12:])
+
+        df = fetch_and_cache('CA_INC', years=1)
+
+        start = mock_fetch.call_args.args[1]
+        assert start.date() == (index[-6] - timedelta(days=10)).date()
+        assert df.index[-1] == index[-1]
+        assert len(df) == len(stored('CA_INC')[-len(df):])
+
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.fetch_from_yahoo')
+    def test_revision_invalidates_derived_data(self, mock_fetch, mock_needs_update):
+        """Test that a dividend rescales history and drops cached portfolio data."""
+        import portfolio
+        from cache import fetch_and_cache, save_to_cache
+
+        index = sessions(300)
+        save_to_cache('CA_PF', bars(index[:-5]))
+        portfolio._universes[(('CA_PF',), 1, None)] = object()
+        portfolio._universes[(('OTHER',), 1, None)] = object()
+        revised = bars(index[-12:], adj_close=[95.0] * 9 + [100.0] * 3)
+        revised.attrs['events'] = [(index[-3].strftime('%Y-%m-%d'), 'dividend', 5.0)]
+        mock_fetch.return_value = revised
+
+        df = fetch_and_cache('CA_PF', years=1)
+
+        assert df['adj_close'].iloc[0] == pytest.approx(95.0)
+        assert df['adj_close'].iloc[-1] == 100.0
+        assert list(portfolio._universes) == [(('OTHER',), 1, None)]
+        portfolio.clear_cache()
+
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.fetch_from_yahoo')
+    def test_dropped_history_is_refetched(self, mock_fetch, mock_needs_update):
+        """Test that history that couldn't be rescaled is fetched in full."""
+        from cache import fetch_and_cache, save_to_cache
+
+        index = sessions(300)
+        save_to_cache('CA_FULL', bars(index[:-5]))
+        recent = bars(index[-3:], close=50.0)
+        recent.attrs['events'] = [(index[-2].strftime('%Y-%m-%d'), 'split', 2.0)]
+        mock_fetch.side_effect = [recent, bars(index, close=50.0)]
+
+        df = fetch_and_cache('CA_FULL', years=1)
+
+        assert mock_fetch.call_count == 2
+        assert len(df) == 300
+        assert (df['close'] == 50.0).all()
+
+    @patch('cache.CACHE_OVERLAP_DAYS', 0)
+    @patch('cache.needs_update', return_value=True)
+    @patch('cache.fetch_from_yahoo')
+    def test_disabled_refetches_window(self, mock_fetch, mock_needs_update):
+        """Test that CACHE_OVERLAP_DAYS=0 refetches the whole window."""
+        from cache import fetch_and_cache, save_to_cache
+
+        index = sessions(300)
+        save_to_cache('CA_OFF', bars(index[:-5]))
+        mock_fetch.return_value = bars(index)
+
+        fetch_and_cache('CA_OFF', years=1)
+
+        assert (datetime.now() - mock_fetch.call_args.args[1]).days == 365
@@ -0,0 +1,86 @@
+import pytest
+import sqlite3
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """Point the connection at a database that has not been migrated."""
+    path = tmp_path / 'fresh.db'
+    with patch('db.DB_PATH', path):
+        yield path
+
+
+class TestInitDb:
+    """Test schema migrations."""
+
+    def test_migrates_empty_database(self, fresh_db):
+        """Test that init_db creates the tables and records the version."""
+        from db import init_db, get_connection, SCHEMA_VERSION
+
+        assert init_db() == SCHEMA_VERSION
+
+        conn = get_connection()
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+
+        assert {'prices', 'tickers', 'cache_metadata'} <= tables
+        assert 'daily_prices' not in tables
+        assert version == SCHEMA_VERSION
+
+    def test_new_database_uses_wal_and_incremental_vacuum(self, fresh_db):
+        """Test that a new database is created ready for online compaction."""
+        from db import init_db, get_connection
+
+        init_db()
+
+        conn = get_connection()
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        conn.close()
+
+        assert journal_mode == 'wal'
+        assert auto_vacuum == 2
+
+    def test_is_idempotent(self, fresh_db):
+        """Test that running migrations twice is harmless."""
+        from db import init_db, SCHEMA_VERSION
+
+        init_db()
+        assert init_db() == SCHEMA_VERSION
+
+    def test_adopts_unversioned_database(self, fresh_db):
+        """Test that a database created before versioning is migrated in place."""
+        from db import init_db, get_connection, SCHEMA_VERSION
+
+        conn = sqlite3.connect(fresh_db)
+        conn.execute("""
+            CREATE TABLE daily_prices (
+                ticker TEXT NOT NULL, date TEXT NOT NULL, open REAL, high REAL, low REAL,
+                close REAL, adj_close REAL, volume INTEGER, PRIMARY KEY (ticker, date)
+            )
+        """)
+        conn.execute("INSERT INTO daily_prices VALUES ('SPY', '2024-01-02', 1, 1, 1, 1, 1, 1)")
+        conn.commit()
+        conn.close()
+
+        assert init_db() == SCHEMA_VERSION
+
+        conn = get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM daily_prices").fetchone()[0]
+        conn.close()
+        assert count == 1
+
+    def test_connection_does_not_migrate(self, fresh_db):
+        """Test that opening a connection alone does no schema work."""
+        from db import get_connection
+
+        conn = get_connection()
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+        conn.close()
+
+        assert tables == []
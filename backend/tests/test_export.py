@@ -0,0 +1,102 @@
+import json
+import csv
+import io
+import numpy as np
+import pandas as pd
+
+import sys
+sys.path.insert(0, '..')
+
+import compute
+
+
+def seed(ticker, days=400):
+    from cache import save_to_cache
+    dates = pd.bdate_range('2020-01-01', periods=days)
+    rng = np.random.default_rng(5)
+    prices = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    df = pd.DataFrame({
+        'open': prices, 'high': prices, 'low': prices, 'close': prices,
+        'adj_close': prices, 'volume': [1000] * days,
+    }, index=dates)
+    save_to_cache(ticker, df)
+    return df
+
+
+class TestRollingSeries:
+    """Test chunked computation in compute.RollingSeries."""
+
+    def test_chunks_match_whole_series(self):
+        """Test that any chunking yields the same values as one pass."""
+        rng = np.random.default_rng(9)
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 300)))
+        series = compute.RollingSeries()
+        parts = [series.update(c) for c in np.array_split(prices, [1, 2, 50, 51, 170])]
+        combined = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+        returns = compute.log_returns(prices)
+        np.testing.assert_array_equal(combined['log_return'], returns)
+        np.testing.assert_array_equal(combined['vol_30d'], compute.annualized_vol(returns, 30))
+        np.testing.assert_array_equal(combined['vol_90d'], compute.annualized_vol(returns, 90))
+        for i in (14, 15, 120, 299):
+            assert combined['rsi'][i] == compute.wilder_rsi(prices[:i + 1])
+        assert np.isnan(combined['rsi'][:14]).all()
+
+
+class TestIterTickerRows:
+    """Test per-ticker row streaming."""
+
+    def test_streams_in_chunks(self):
+        """Test that rows arrive in bounded chunks covering the full history."""
+        from export import iter_ticker_rows
+        seed('EXPORT_CHUNKS', days=250)
+
+        chunks = list(iter_ticker_rows('export_chunks', chunk_size=64))
+
+        assert max(len(c) for c in chunks) <= 64
+        assert sum(len(c) for c in chunks) == 250
+        assert chunks[0][0][0] == 'EXPORT_CHUNKS'
+
+    def test_start_filters_but_keeps_warmup(self):
+        """Test that rows before start are dropped after warming up the windows."""
+        from export import iter_ticker_rows
+        df = seed('EXPORT_START', days=300)
+        start = df.index[200].strftime('%Y-%m-%d')
+
+        rows = [r for c in iter_ticker_rows('EXPORT_START', start=start, chunk_size=50) for r in c]
+
+        assert rows[0][1] == start
+        assert len(rows) == 100
+        # vol_90d is defined on the first exported row thanks to the warm-up
+        assert rows[0][6] is not None
+
+
+class TestStreams:
+    """Test the NDJSON and CSV encoders."""
+
+    def test_ndjson_lines(self):
+        """Test that each NDJSON line is a JSON object with null for undefined values."""
+        from export import stream_ndjson, EXPORT_FIELDS
+        seed('EXPORT_NDJSON', days=120)
+
+        lines = ''.join(stream_ndjson(['EXPORT_NDJSON'], chunk_size=40)).splitlines()
+        first = json.loads(lines[0])
+
+        assert len(lines) == 120
+        assert list(first) == EXPORT_FIELDS
+        assert first['log_return'] is None
+        assert json.loads(lines[-1])['vol_90d'] is not None
+
+    def test_csv_has_single_header(self):
+        """Test that CSV output has one header across tickers and chunks."""
+        from export import stream_csv, EXPORT_FIELDS
+        seed('EXPORT_CSV_A', days=60)
+        seed('EXPORT_CSV_B', days=30)
+
+        rows = list(csv.reader(io.StringIO(''.join(
+            stream_csv(['EXPORT_CSV_A', 'EXPORT_CSV_B'], chunk_size=25)
+        ))))
+
+        assert rows[0] == EXPORT_FIELDS
+        assert len(rows) == 91
+        assert {r[0] for r in rows[1:]} == {'EXPORT_CSV_A', 'EXPORT_CSV_B'}
@@ -0,0 +1,208 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+def garch_prices(days=800, omega=2e-6, alpha=0.07, beta=0.91, seed=0):
+    """Prices whose log returns follow a GARCH(1,1) process."""
+    rng = np.random.default_rng(seed)
+    returns = np.empty(days - 1)
+    variance = omega / (1 - alpha - beta)
+    for i in range(days - 1):
+        returns[i] = np.sqrt(variance) * rng.standard_normal()
+        variance = omega + alpha * returns[i] ** 2 + beta * variance
+    dates = pd.bdate_range('2020-01-01', periods=days).values
+    return dates, 100 * np.exp(np.concatenate([[0.0], np.cumsum(returns)]))
+
+
+@pytest.fixture(autouse=True)
+def empty_state_cache():
+    import forecast
+    forecast.clear_cache()
+    yield
+    forecast.clear_cache()
+
+
+class TestFitGarch:
+    """Test GARCH(1,1) maximum likelihood fitting."""
+
+    def test_recovers_parameters(self):
+        """Test that a fit on simulated returns lands near the true parameters."""
+        from forecast import fit_garch
+
+        _, prices = garch_prices(days=3000)
+        omega, alpha, beta = fit_garch(np.diff(np.log(prices)))
+
+        assert alpha == pytest.approx(0.07, abs=0.04)
+        assert alpha + beta == pytest.approx(0.98, abs=0.02)
+        assert omega > 0
+
+    def test_warm_start_matches_cold_fit(self):
+        """Test that starting from earlier parameters reaches the same optimum."""
+        from forecast import fit_garch
+
+        _, prices = garch_prices()
+        returns = np.diff(np.log(prices))
+        cold = fit_garch(returns)
+
+        warm = fit_garch(returns, start=(0.05, 0.90))
+
+        assert warm[1] == pytest.approx(cold[1], abs=5e-3)
+        assert warm[2] == pytest.approx(cold[2], abs=5e-3)
+
+
+class TestUpdateState:
+    """Test incremental filter updates and refits."""
+
+    def test_new_bars_roll_filters_forward(self):
+        """Test that a few new bars update variances without refitting."""
+        from forecast import update_state, garch_filter, ewma_filter
+
+        dates, prices = garch_prices()
+        state = update_state(dates[:-5], prices[:-5])
+
+        updated = update_state(dates, prices, state)
+
+        new = np.diff(np.log(prices[-6:]))
+        assert (updated.alpha, updated.beta, updated.fitted_at) == (state.alpha, state.beta, state.fitted_at)
+        assert updated.last_date == np.datetime_as_string(dates[-1], unit='D')
+        assert updated.observations == state.observations + 5
+        expected, _ = garch_filter((new * new).tolist(), state.omega, state.alpha, state.beta,
+                                   state.garch_variance)
+        assert updated.garch_variance == pytest.approx(expected)
+        assert updated.ewma_variance == pytest.approx(ewma_filter((new * new).tolist(), state.ewma_variance))
+
+    def test_no_new_bars_returns_same_state(self):
+        """Test that an up-to-date state is returned unchanged."""
+        from forecast import update_state
+
+        dates, prices = garch_prices()
+        state = update_state(dates, prices)
+
+        assert update_state(dates, prices, state) is state
+
+    @patch('forecast.FORECAST_REFIT_DAYS', 3)
+    @patch('forecast.fit_garch', wraps=__import__('forecast').fit_garch)
+    def test_refits_warm_after_enough_returns(self, mock_fit):
+        """Test that GARCH is refitted from the previous parameters."""
+        from forecast import update_state
+
+        dates, prices = garch_prices()
+        state = update_state(dates[:-3], prices[:-3])
+
+        updated = update_state(dates, prices, state)
+
+        assert mock_fit.call_args.args[1] == (state.alpha, state.beta)
+        assert updated.fitted_observations == updated.observations
+
+    @patch('forecast.fit_garch', wraps=__import__('forecast').fit_garch)
+    def test_revised_history_refits_from_scratch(self, mock_fit):
+        """Test that a changed last price throws the old state away."""
+        from forecast import update_state
+
+        dates, prices = garch_prices()
+        state = update_state(dates, prices)
+
+        update_state(dates, prices * 0.5, state)
+
+        assert mock_fit.call_args.args[1] is None
+
+    def test_short_history_raises(self):
+        """Test that too few returns raise ValueError."""
+        from forecast import update_state
+
+        dates, prices = garch_prices(days=50)
+
+        with pytest.raises(ValueError, match="Not enough data"):
+            update_state(dates, prices)
+
+
+class TestTermStructure:
+    """Test forecasts built from the state."""
+
+    def test_garch_reverts_to_long_run_and_ewma_is_flat(self):
+        """Test the shape of both term structures."""
+        from forecast import ForecastState, term_structure
+
+        state = ForecastState('2024-01-02', 100.0, 1000, 4e-4, 2e-6, 0.07, 0.91, 4e-4, 1000, '')
+
+        curves = term_structure(state, [1, 21, 252])
+
+        long_run = np.sqrt(2e-6 / 0.02 * 252)
+        garch = [point['vol'] for point in curves['garch']]
+        assert garch[0] == round(np.sqrt(4e-4 * 252), 4)
+        assert garch[0] > garch[1] > garch[2] > long_run
+        assert len({point['vol'] for point in curves['ewma']}) == 1
+
+
+class TestCalculateForecast:
+    """Test persisted and in-memory forecast state."""
+
+    def frame(self, dates, prices, stale=False):
+        df = pd.DataFrame({'adj_close': prices}, index=pd.DatetimeIndex(dates))
+        df.attrs['stale'] = stale
+        return df
+
+    @patch('forecast.fetch_and_cache')
+    def test_repeat_requests_served_from_memory(self, mock_fetch):
+        """Test that a second request in the same session reads no prices."""
+        from forecast import calculate_forecast
+
+        mock_fetch.return_value = self.frame(*garch_prices())
+
+        first = calculate_forecast('fc_mem', [1, 10])
+        second = calculate_forecast('FC_MEM', [21])
+
+        assert mock_fetch.call_count == 1
+        assert first['ticker'] == 'FC_MEM'
+        assert [p['horizon'] for p in second['forecasts']['garch']] == [21]
+        assert first['vol_30d'] is not None
+
+    @patch('forecast.fetch_and_cache')
+    @patch('forecast.fit_garch', wraps=__import__('forecast').fit_garch)
+    def test_next_session_rolls_persisted_state_forward(self, mock_fit, mock_fetch):
+        """Test that state saved in SQLite is reused by a fresh process."""
+        import forecast
+
+        dates, prices = garch_prices()
+        mock_fetch.return_value = self.frame(dates[:-1], prices[:-1])
+        with patch('forecast.trading_calendar.last_completed_session', return_value=date(2024, 1, 8)):
+            forecast.calculate_forecast('FC_DB')
+        forecast.clear_cache()
+        mock_fetch.return_value = self.frame(dates, prices)
+
+        with patch('forecast.trading_calendar.last_completed_session', return_value=date(2024, 1, 9)):
+            result = forecast.calculate_forecast('FC_DB')
+
+        assert mock_fit.call_count == 1
+        assert result['data_as_of'] == np.datetime_as_string(dates[-1], unit='D')
+        assert forecast.load_state('FC_DB').last_date == result['data_as_of']
+
+    @patch('forecast.fetch_and_cache')
+    def test_stale_prices_not_kept_in_memory(self, mock_fetch):
+        """Test that state built from stale bars is re-checked next request."""
+        from forecast import calculate_forecast
+
+        mock_fetch.return_value = self.frame(*garch_prices(), stale=True)
+
+        calculate_forecast('FC_STALE')
+        calculate_forecast('FC_STALE')
+
+        assert mock_fetch.call_count == 2
+
+    @patch('forecast.fetch_and_cache')
+    def test_memory_holds_most_recent_tickers(self, mock_fetch):
+        """Test that in-memory states are capped, dropping the least recently used."""
+        import forecast
+
+        mock_fetch.return_value = self.frame(*garch_prices())
+        with patch('forecast.FORECAST_CACHE_SIZE', 2):
+            for ticker in ('FC_A', 'FC_B', 'FC_A', 'FC_C'):
+                forecast.get_state(ticker)
+
+            assert list(forecast._states) == ['FC_A', 'FC_C']
@@ -0,0 +1,207 @@
+import pytest
+import numpy as np
+from datetime import date, datetime, timezone
+from unittest.mock import patch, MagicMock
+
+import sys
+sys.path.insert(0, '..')
+
+
+def session_bars(day, bars=78, step=300, seed=0):
+    """One session of bars starting at 09:30 New York (winter, UTC-5)."""
+    rng = np.random.default_rng(seed)
+    open_ts = datetime(day.year, day.month, day.day, 14, 30, tzinfo=timezone.utc).timestamp()
+    ts = open_ts + np.arange(bars) * step
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, bars)))
+    return ts, close * 0.999, close * 1.001, close * 0.998, close, np.full(bars, 1000.0)
+
+
+def stack(*sessions):
+    return [np.concatenate(cols) for cols in zip(*sessions)]
+
+
+class TestIngest:
+    """Test storing intraday bars as per-session blocks."""
+
+    def test_groups_bars_by_session_and_computes_rv(self):
+        """Test that each session becomes one block with its realized variance."""
+        from intraday import ingest, get_realized_variance
+
+        first = session_bars(date(2024, 1, 8), seed=1)
+        second = session_bars(date(2024, 1, 9), seed=2)
+
+        written = ingest('rv_a', '5m', *stack(second, first), through=date(2024, 1, 9))
+
+        days = get_realized_variance('RV_A', '5m', '2024-01-01', '2024-01-31')
+        assert written == 2
+        assert [d['day'] for d in days] == ['2024-01-08', '2024-01-09']
+        assert days[0]['bars'] == 78
+        expected = np.sum(np.diff(np.log(first[4])) ** 2)
+        assert days[0]['realized_variance'] == pytest.approx(expected, rel=1e-12)
+
+    def test_evening_utc_bars_belong_to_new_york_session(self):
+        """Test that bars after midnight UTC stay in the New York session."""
+        from intraday import ingest, get_realized_variance
+
+        # 19:00 New York is 00:00 UTC the next day
+        ts, *cols = session_bars(date(2024, 1, 8), bars=3, step=3600)
+        ts = ts + 7.5 * 3600
+
+        ingest('RV_TZ', '60m', ts, *cols, through=date(2024, 1, 10))
+
+        assert [d['day'] for d in get_realized_variance('RV_TZ', '60m', '2024-01-01', '2024-01-31')] == ['2024-01-08']
+
+    def test_skips_incomplete_sessions_and_missing_closes(self):
+        """Test that sessions after ``through`` and bars without a close are dropped."""
+        from intraday import ingest, get_bars
+
+        ts, o, h, low, close, v = stack(session_bars(date(2024, 1, 8)), session_bars(date(2024, 1, 9)))
+        close = close.copy()
+        close[5] = np.nan
+
+        ingest('RV_SKIP', '5m', ts, o, h, low, close, v, through=date(2024, 1, 8))
+
+        bars = get_bars('RV_SKIP', '5m', '2024-01-01', '2024-01-31')
+        assert len(bars['ts']) == 77
+        assert not np.isnan(bars['close']).any()
+
+    def test_skips_non_positive_closes(self):
+        """Test that zero or negative closes are dropped instead of storing a NaN variance."""
+        from intraday import ingest, get_realized_variance
+
+        ts, o, h, l, c, v = session_bars(date(2024, 1, 10))
+        c = c.copy()
+        c[[3, 7]] = [0.0, -1.0]
+
+        assert ingest('RV_ZERO', '5m', ts, o, h, l, c, v, through=date(2024, 1, 10)) == 1
+        day = get_realized_variance('RV_ZERO', '5m', '2024-01-10', '2024-01-10')[0]
+        assert day['bars'] == 76
+        assert np.isfinite(day['realized_variance'])
+
+    def test_reingest_merges_and_replaces_overlapping_bars(self):
+        """Test that re-ingesting a session merges bars and newer values win."""
+        from intraday import ingest, get_bars
+
+        ts, o, h, low, close, v = session_bars(date(2024, 1, 8))
+        ingest('RV_MERGE', '5m', ts[:50], o[:50], h[:50], low[:50], close[:50], v[:50],
+               through=date(2024, 1, 8))
+        revised = close.copy()
+        revised[40:] += 1.0
+        ingest('RV_MERGE', '5m', ts[40:], o[40:], h[40:], low[40:], revised[40:], v[40:],
+               through=date(2024, 1, 8))
+
+        bars = get_bars('RV_MERGE', '5m', '2024-01-08', '2024-01-08')
+        np.testing.assert_array_equal(bars['ts'], ts)
+        np.testing.assert_array_equal(bars['close'], np.concatenate([close[:40], revised[40:]]))
+
+    def test_get_bars_spans_sessions_in_order(self):
+        """Test that a range query returns contiguous, ordered arrays."""
+        from intraday import ingest, get_bars
+
+        sessions = [session_bars(date(2024, 1, d), seed=d) for d in (8, 9, 10)]
+        ingest('RV_RANGE', '5m', *stack(*sessions), through=date(2024, 1, 10))
+
+        bars = get_bars('RV_RANGE', '5m', '2024-01-09', '2024-01-10')
+
+        assert len(bars['ts']) == 156
+        assert (np.diff(bars['ts']) > 0).all()
+        assert get_bars('RV_RANGE', '5m', '2023-01-01', '2023-12-31')['ts'].size == 0
+
+
+class TestFetchIntraday:
+    """Test fetching intraday bars from upstream."""
+
+    @patch('intraday.upstream.get')
+    def test_splits_requests_by_interval_limit(self, mock_get):
+        """Test that 1m history is requested in 7-day windows."""
+        from intraday import fetch_intraday
+
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'chart': {'result': [{
+            'timestamp': [1704724200],
+            'indicators': {'quote': [{'open': [1.0], 'high': [1.0], 'low': [1.0],
+                                      'close': [1.0], 'volume': [10]}]},
+        }]}}
+        mock_get.return_value = response
+
+        bars = fetch_intraday('SPY', '1m', datetime(2024, 1, 1), datetime(2024, 1, 21))
+
+        assert mock_get.call_count == 3
+        assert mock_get.call_args.kwargs['params']['interval'] == '1m'
+        assert len(bars['ts']) == 3
+
+    @patch('intraday.upstream.get')
+    def test_raises_when_no_bars(self, mock_get):
+        """Test that an empty result raises ValueError."""
+        from intraday import fetch_intraday
+
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'chart': {'result': None}}
+        mock_get.return_value = response
+
+        with pytest.raises(ValueError, match="No 5m data"):
+            fetch_intraday('NOPE', '5m', datetime(2024, 1, 1), datetime(2024, 1, 5))
+
+
+class TestRealizedVolatility:
+    """Test the realized volatility calculation."""
+
+    @patch('intraday.fetch_intraday')
+    @patch('intraday.trading_calendar.last_completed_session', return_value=date(2024, 1, 9))
+    def test_up_to_date_ticker_is_not_fetched(self, mock_session, mock_fetch):
+        """Test that no upstream call is made once the last session is stored."""
+        from intraday import ingest, update
+
+        ingest('RV_FRESH', '5m', *session_bars(date(2024, 1, 9)), through=date(2024, 1, 9))
+
+        assert update('RV_FRESH', '5m') == 0
+        assert not mock_fetch.called
+
+    @patch('intraday.fetch_intraday')
+    @patch('intraday.trading_calendar.last_completed_session', return_value=date(2024, 1, 10))
+    def test_empty_incremental_window_keeps_stored_sessions(self, mock_session, mock_fetch):
+        """Test that no new upstream bars leave the stored sessions in place."""
+        from cache import NoDataError
+        from intraday import ingest, update, get_realized_variance
+
+        mock_fetch.side_effect = NoDataError("No 5m data found for ticker: RV_IDLE")
+        ingest('RV_IDLE', '5m', *session_bars(date(2024, 1, 9)), through=date(2024, 1, 9))
+
+        assert update('RV_IDLE', '5m') == 0
+        assert len(get_realized_variance('RV_IDLE', '5m', '2024-01-01', '2024-01-31')) == 1
+
+    @patch('intraday.fetch_intraday')
+    @patch('intraday.trading_calendar.last_completed_session', return_value=date(2024, 1, 10))
+    def test_no_data_for_new_ticker_raises(self, mock_session, mock_fetch):
+        """Test that a ticker with nothing stored still reports missing data."""
+        from cache import NoDataError
+        from intraday import update
+
+        mock_fetch.side_effect = NoDataError("No 5m data found for ticker: RV_NEW")
+
+        with pytest.raises(NoDataError):
+            update('RV_NEW', '5m')
+
+    @patch('intraday.update')
+    def test_payload(self, mock_update):
+        """Test the per-day and window realized vol."""
+        from intraday import ingest, calculate_realized_volatility
+
+        sessions = [session_bars(date(2024, 1, d), seed=d) for d in (8, 9)]
+        ingest('RV_PAYLOAD', '5m', *stack(*sessions), through=date(2024, 1, 9))
+
+        result = calculate_realized_volatility('rv_payload', '5m', date(2024, 1, 1), date(2024, 1, 31))
+
+        rv = [np.sum(np.diff(np.log(s[4])) ** 2) for s in sessions]
+        assert result['ticker'] == 'RV_PAYLOAD'
+        assert len(result['days']) == 2
+        assert result['days'][0]['realized_vol'] == round(np.sqrt(rv[0] * 252), 4)
+        assert result['realized_vol'] == round(np.sqrt(np.mean(rv) * 252), 4)
+
+    @patch('intraday.update')
+    def test_no_data_raises(self, mock_update):
+        """Test that an empty window raises ValueError."""
+        from intraday import calculate_realized_volatility
+
+        with pytest.raises(ValueError, match="No 5m data"):
+            calculate_realized_volatility('RV_NONE', '5m', date(2024, 1, 1), date(2024, 1, 31))
@@ -1,4 +1,7 @@
 import pytest
+import subprocess
+from datetime import date
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 import httpx
 
@@ -35,11 +38,29 @@ class TestHealthCheck:
         assert data["status"] == "healthy"
 
 
+class TestMetrics:
+    """Test the metrics endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_returns_snapshot(self, client):
+        """Test that metrics exposes counters, timings and gauges."""
+        import metrics
+        metrics.increment('test_counter')
+
+        response = await client.get("/api/metrics")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['counters']['test_counter'] >= 1
+        assert 'timings' in data
+        assert 'gauges' in data
+
+
 class TestGetVolatility:
     """Test the volatility endpoint."""
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
     async def test_returns_volatility_data(self, mock_calc, client):
         """Test that endpoint returns volatility data."""
         mock_calc.return_value = {
@@ -70,7 +91,7 @@ class TestGetVolatility:
         assert 'vol_90d' in data
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
     async def test_accepts_lookback_years_param(self, mock_calc, client):
         """Test that lookback_years parameter is passed."""
         mock_calc.return_value = {
@@ -95,10 +116,10 @@ class TestGetVolatility:
         response = await client.get("/api/volatility/AAPL?lookback_years=3")
 
         assert response.status_code == 200
-        mock_calc.assert_called_once_with('AAPL', 3)
+        mock_calc.assert_called_once_with('AAPL', 3, None)
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
     async def test_default_lookback_years(self, mock_calc, client):
         """Test that default lookback_years is 5."""
         mock_calc.return_value = {
@@ -122,10 +143,10 @@ class TestGetVolatility:
 
         response = await client.get("/api/volatility/MSFT")
 
-        mock_calc.assert_called_once_with('MSFT', 5)
+        mock_calc.assert_called_once_with('MSFT', 5, None)
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
     async def test_returns_404_for_value_error(self, mock_calc, client):
         """Test that ValueError results in 404 response."""
         mock_calc.side_effect = ValueError("No data found for ticker: INVALID")
@@ -137,7 +158,7 @@ class TestGetVolatility:
         assert "No data found" in data['detail']
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
     async def test_returns_500_for_other_errors(self, mock_calc, client):
         """Test that other exceptions result in 500 response."""
         mock_calc.side_effect = Exception("Database error")
@@ -149,7 +170,19 @@ class TestGetVolatility:
         assert "Error calculating volatility" in data['detail']
 
     @pytest.mark.asyncio
-    @patch('main.calculate_volatility')
+    @patch('volatility.calculate_volatility')
+    async def test_returns_503_when_upstream_unavailable(self, mock_calc, client):
+        """Test that an exhausted upstream results in 503 response."""
+        from upstream import UpstreamUnavailable
+        mock_calc.side_effect = UpstreamUnavailable("Upstream data provider is unavailable")
+
+        response = await client.get("/api/volatility/SPY")
+
+        assert response.status_code == 503
+        assert "unavailable" in response.json()['detail']
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
     async def test_case_insensitive_ticker(self, mock_calc, client):
         """Test that lowercase ticker works."""
         mock_calc.return_value = {
@@ -174,7 +207,392 @@ class TestGetVolatility:
         response = await client.get("/api/volatility/aapl")
 
         assert response.status_code == 200
-        mock_calc.assert_called_once_with('aapl', 5)
+        mock_calc.assert_called_once_with('aapl', 5, None)
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
+    async def test_rejects_invalid_ticker(self, mock_calc, client):
+        """Test that symbols outside the ticker pattern return 422."""
+        for ticker in ('A%20B', 'A;B', '.hidden', 'x' * 30):
+            response = await client.get(f"/api/volatility/{ticker}")
+            assert response.status_code == 422
+        assert not mock_calc.called
+
+
+class TestVolatilityRankWindow:
+    """Test the rank_window_years query parameter."""
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
+    async def test_passes_rank_window(self, mock_calc, client):
+        """Test that a trailing rank window is forwarded to the calculation."""
+        mock_calc.return_value = {"ticker": "SPY"}
+
+        response = await client.get("/api/volatility/SPY?lookback_years=10&rank_window_years=3")
+
+        assert response.status_code == 200
+        mock_calc.assert_called_once_with('SPY', 10, 3)
+
+    @pytest.mark.asyncio
+    async def test_rejects_non_positive_window(self, client):
+        """Test that a zero-year window is a validation error."""
+        response = await client.get("/api/volatility/SPY?rank_window_years=0")
+
+        assert response.status_code == 422
+
+
+class TestVolatilityFields:
+    """Test the fields query parameter."""
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
+    async def test_forwards_resolved_fields(self, mock_calc, client):
+        """Test that groups and single keys are expanded to payload keys."""
+        mock_calc.return_value = {"ticker": "SPY"}
+
+        response = await client.get("/api/volatility/SPY?fields=vol_30d,percentiles")
+
+        assert response.status_code == 200
+        fields = mock_calc.call_args.kwargs['fields']
+        assert 'vol_30d' in fields and 'percentile_thresholds' in fields
+        assert 'history' not in fields and 'vol_90d' not in fields
+
+    @pytest.mark.asyncio
+    async def test_rejects_unknown_field(self, client):
+        """Test that unknown or empty field lists return 422."""
+        for fields in ('vol_30d,nope', ','):
+            response = await client.get(f"/api/volatility/SPY?fields={fields}")
+            assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
+    async def test_batch_forwards_fields(self, mock_calc, client):
+        """Test that the batch endpoint applies fields to every ticker."""
+        mock_calc.return_value = {"ticker": "SPY"}
+
+        response = await client.get("/api/volatility?tickers=SPY,QQQ&fields=vol")
+
+        assert response.status_code == 200
+        mock_calc.assert_any_call('QQQ', 5, None, fields=frozenset({'vol_30d', 'vol_90d'}))
+
+
+class TestVolatilityBatch:
+    """Test the multi-ticker volatility endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility')
+    async def test_returns_results_and_errors_per_ticker(self, mock_calc, client):
+        """Test that one bad ticker does not fail the whole batch."""
+        def calc(ticker, lookback_years, rank_window_years=None):
+            if ticker == 'TYPO':
+                raise ValueError("No data found for ticker: TYPO")
+            return {"ticker": ticker}
+        mock_calc.side_effect = calc
+
+        response = await client.get("/api/volatility?tickers=spy,TYPO,SPY&lookback_years=2")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"] == {"SPY": {"ticker": "SPY"}}
+        assert data["errors"]["TYPO"]["status"] == 404
+        assert mock_calc.call_count == 2
+        mock_calc.assert_any_call('SPY', 2, None)
+
+    @pytest.mark.asyncio
+    @patch('volatility.fetch_and_cache')
+    async def test_benchmark_fetched_once_per_batch(self, mock_fetch, client):
+        """Test that every ticker's beta uses the same benchmark load."""
+        import numpy as np
+        import pandas as pd
+        prices = 100 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.02, 300)))
+        mock_fetch.return_value = pd.DataFrame(
+            {column: prices for column in ('open', 'high', 'low', 'close', 'adj_close')},
+            index=pd.bdate_range(end='2024-06-28', periods=300),
+        )
+
+        response = await client.get("/api/volatility?tickers=AAA,BBB,CCC&fields=beta")
+
+        assert response.status_code == 200
+        assert {result["benchmark"] for result in response.json()["results"].values()} == {"SPY"}
+        assert [call.args[0] for call in mock_fetch.call_args_list].count('SPY') == 1
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_batch(self, client):
+        """Test that batches above the limit are rejected."""
+        from main import MAX_BATCH_TICKERS
+        tickers = ','.join(f'T{i}' for i in range(MAX_BATCH_TICKERS + 1))
+
+        response = await client.get(f"/api/volatility?tickers={tickers}")
+
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_rejects_invalid_ticker(self, client):
+        """Test that one malformed symbol rejects the batch."""
+        response = await client.get("/api/volatility?tickers=SPY,../QQQ")
+
+        assert response.status_code == 422
+
+
+class TestVolatilityAsOf:
+    """Test the as-of query modes."""
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility_as_of')
+    @patch('volatility.calculate_volatility')
+    async def test_as_of_param_uses_cache_only_path(self, mock_calc, mock_as_of, client):
+        """Test that as_of routes to the point-in-time calculation."""
+        from datetime import date
+        mock_as_of.return_value = {'ticker': 'SPY', 'as_of': '2024-03-01'}
+
+        response = await client.get("/api/volatility/SPY?as_of=2024-03-01&lookback_years=2")
+
+        assert response.status_code == 200
+        mock_as_of.assert_called_once_with('SPY', date(2024, 3, 1), 2, None)
+        assert not mock_calc.called
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility_as_of')
+    async def test_as_of_keeps_rank_window(self, mock_as_of, client):
+        """Test that rank_window_years also applies to as-of requests."""
+        from datetime import date
+        mock_as_of.return_value = {'ticker': 'SPY'}
+
+        response = await client.get("/api/volatility/SPY?as_of=2024-03-01&rank_window_years=2")
+
+        assert response.status_code == 200
+        mock_as_of.assert_called_once_with('SPY', date(2024, 3, 1), 5, 2)
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility_as_of_many')
+    async def test_many_dates(self, mock_many, client):
+        """Test that comma-separated dates are parsed and evaluated together."""
+        from datetime import date
+        mock_many.return_value = [{'as_of': '2024-01-02'}, {'as_of': '2024-02-01'}]
+
+        response = await client.get("/api/volatility/spy/as-of?dates=2024-01-02,2024-02-01")
+
+        assert response.status_code == 200
+        assert response.json()['ticker'] == 'SPY'
+        assert len(response.json()['results']) == 2
+        mock_many.assert_called_once_with(
+            'spy', [date(2024, 1, 2), date(2024, 2, 1)], 5, include_history=False
+        )
+
+    @pytest.mark.asyncio
+    async def test_many_rejects_bad_dates(self, client):
+        """Test that malformed dates return 422."""
+        response = await client.get("/api/volatility/SPY/as-of?dates=2024-13-01")
+
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('volatility.calculate_volatility_as_of_many')
+    async def test_many_returns_404_for_uncached_ticker(self, mock_many, client):
+        """Test that a ticker without cached data returns 404."""
+        mock_many.side_effect = ValueError("No cached data for XYZ")
+
+        response = await client.get("/api/volatility/XYZ/as-of?dates=2024-01-02")
+
+        assert response.status_code == 404
+
+
+class TestForecast:
+    """Test the volatility forecast endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('forecast.calculate_forecast')
+    async def test_parses_horizons(self, mock_calc, client):
+        """Test that comma-separated horizons are forwarded as integers."""
+        mock_calc.return_value = {'ticker': 'SPY'}
+
+        response = await client.get("/api/volatility/SPY/forecast?horizons=1,10,21")
+
+        assert response.status_code == 200
+        mock_calc.assert_called_once_with('SPY', [1, 10, 21])
+
+    @pytest.mark.asyncio
+    async def test_rejects_bad_horizons(self, client):
+        """Test that non-integer or out-of-range horizons return 422."""
+        for horizons in ('abc', '0', '300'):
+            response = await client.get(f"/api/volatility/SPY/forecast?horizons={horizons}")
+            assert response.status_code == 422
+
+
+class TestPortfolio:
+    """Test the portfolio volatility endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('portfolio.calculate_portfolio_volatility')
+    async def test_normalizes_tickers(self, mock_calc, client):
+        """Test that tickers are upper-cased and the lookback is forwarded."""
+        mock_calc.return_value = {'vol_30d': 0.12}
+
+        response = await client.post("/api/portfolio/volatility",
+                                     json={"weights": {"spy": 0.6, " tlt ": 0.4}, "lookback_years": 3})
+
+        assert response.status_code == 200
+        mock_calc.assert_called_once_with({'SPY': 0.6, 'TLT': 0.4}, 3)
+
+    @pytest.mark.asyncio
+    async def test_rejects_bad_requests(self, client):
+        """Test that empty, duplicate, malformed or all-zero weights return 422."""
+        for body in ({"weights": {}}, {"weights": {"spy": 0.5, "SPY": 0.5}},
+                     {"weights": {"SPY": 0}}, {"weights": {"SPY": 1}, "lookback_years": 0},
+                     {"weights": {"../SPY": 1}}):
+            response = await client.post("/api/portfolio/volatility", json=body)
+            assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('portfolio.calculate_portfolio_volatility')
+    async def test_returns_404_for_value_error(self, mock_calc, client):
+        """Test that missing data returns 404."""
+        mock_calc.side_effect = ValueError("No data found for ticker: XYZ")
+
+        response = await client.post("/api/portfolio/volatility", json={"weights": {"XYZ": 1}})
+
+        assert response.status_code == 404
+
+
+class TestValueAtRisk:
+    """Test the VaR endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('risk.calculate_var')
+    async def test_forwards_options(self, mock_calc, client):
+        """Test that method, levels, horizons, paths and seed are forwarded."""
+        mock_calc.return_value = {'results': []}
+
+        response = await client.post("/api/risk/var", json={
+            "weights": {"spy": 1}, "method": "monte_carlo", "confidences": [0.99],
+            "horizons": [10], "paths": 200000, "seed": 3,
+        })
+
+        assert response.status_code == 200
+        mock_calc.assert_called_once_with({'SPY': 1}, 'monte_carlo', [0.99], [10], 5, 200000, 3)
+
+    @pytest.mark.asyncio
+    async def test_rejects_bad_options(self, client):
+        """Test that unknown methods and out-of-range values return 422."""
+        for extra in ({"method": "parametric"}, {"confidences": [1.0]}, {"horizons": [0]},
+                      {"paths": 10}):
+            response = await client.post("/api/risk/var", json={"weights": {"SPY": 1}, **extra})
+            assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('risk.calculate_var')
+    async def test_returns_500_for_other_errors(self, mock_calc, client):
+        """Test that unexpected failures name the VaR calculation."""
+        mock_calc.side_effect = Exception("Database error")
+
+        response = await client.post("/api/risk/var", json={"weights": {"SPY": 1}})
+
+        assert response.status_code == 500
+        assert response.json()['detail'] == "Error calculating VaR: Database error"
+
+
+class TestRealizedVolatility:
+    """Test the intraday realized-vol endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('intraday.calculate_realized_volatility')
+    async def test_passes_interval_and_range(self, mock_calc, client):
+        """Test that the interval and date range are forwarded."""
+        mock_calc.return_value = {'ticker': 'SPY', 'interval': '1m', 'realized_vol': 0.12, 'days': []}
+
+        response = await client.get("/api/intraday/SPY/realized-vol?interval=1m&start=2024-01-02&end=2024-01-05")
+
+        assert response.status_code == 200
+        assert response.json()['realized_vol'] == 0.12
+        mock_calc.assert_called_once_with('SPY', '1m', date(2024, 1, 2), date(2024, 1, 5))
+
+    @pytest.mark.asyncio
+    async def test_rejects_unknown_interval(self, client):
+        """Test that an unsupported interval returns 422."""
+        response = await client.get("/api/intraday/SPY/realized-vol?interval=1d")
+
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('intraday.calculate_realized_volatility')
+    async def test_returns_404_without_data(self, mock_calc, client):
+        """Test that a ticker without intraday data returns 404."""
+        mock_calc.side_effect = ValueError("No 5m data for XYZ")
+
+        response = await client.get("/api/intraday/XYZ/realized-vol")
+
+        assert response.status_code == 404
+
+
+class TestQualityReport:
+    """Test the data quality report endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('quality.get_report')
+    async def test_forwards_limit(self, mock_report, client):
+        """Test that the report is returned with the requested limit."""
+        mock_report.return_value = {'ticker': 'SPY', 'counts': {}, 'flags': []}
+
+        response = await client.get("/api/quality/SPY?limit=5")
+
+        assert response.status_code == 200
+        assert response.json()['ticker'] == 'SPY'
+        mock_report.assert_called_once_with('SPY', 5)
+
+    @pytest.mark.asyncio
+    async def test_rejects_bad_limit(self, client):
+        """Test that a non-positive limit returns 422."""
+        response = await client.get("/api/quality/SPY?limit=0")
+
+        assert response.status_code == 422
+
+
+class TestExport:
+    """Test the streaming export endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('cache.has_cached_data', return_value=True)
+    @patch('export.stream_export')
+    async def test_streams_ndjson(self, mock_stream, mock_has, client):
+        """Test that NDJSON is streamed with the right media type."""
+        mock_stream.return_value = iter(['{"ticker": "SPY"}\n', '{"ticker": "SPY"}\n'])
+
+        response = await client.get("/api/export?tickers=spy,qqq")
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        assert len(response.text.splitlines()) == 2
+        mock_stream.assert_called_once_with('ndjson', ['SPY', 'QQQ'], None, None)
+
+    @pytest.mark.asyncio
+    @patch('cache.has_cached_data', return_value=True)
+    @patch('export.stream_export')
+    async def test_streams_csv(self, mock_stream, mock_has, client):
+        """Test that CSV is streamed as an attachment."""
+        mock_stream.return_value = iter(['ticker,date\n'])
+
+        response = await client.get("/api/export?tickers=SPY&format=csv&start=2020-01-01")
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/csv')
+        assert 'attachment' in response.headers['content-disposition']
+        mock_stream.assert_called_once_with('csv', ['SPY'], '2020-01-01', None)
+
+    @pytest.mark.asyncio
+    async def test_rejects_unknown_format(self, client):
+        """Test that unsupported formats return 422."""
+        response = await client.get("/api/export?tickers=SPY&format=xml")
+
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    @patch('cache.has_cached_data', side_effect=lambda t: t == 'SPY')
+    async def test_missing_tickers_return_404(self, mock_has, client):
+        """Test that uncached tickers are reported before streaming starts."""
+        response = await client.get("/api/export?tickers=SPY,NOPE")
+
+        assert response.status_code == 404
+        assert 'NOPE' in response.json()['detail']
 
 
 class TestCORS:
@@ -198,3 +616,152 @@ class TestAppConfiguration:
     def test_app_title(self):
         """Test that app has correct title."""
         assert app.title == "Volatility Analysis API"
+
+
+class TestAdminNegativeCache:
+    """Test the negative cache admin endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_token(self, client):
+        """Test that admin endpoints refuse requests when no token is set."""
+        with patch('main.ADMIN_TOKEN', ''):
+            response = await client.get("/api/admin/negative-cache")
+
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_rejects_wrong_token(self, client):
+        """Test that a bad token is rejected."""
+        with patch('main.ADMIN_TOKEN', 'secret'):
+            response = await client.delete(
+                "/api/admin/negative-cache", headers={"X-Admin-Token": "wrong"}
+            )
+
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_lists_and_purges_entries(self, client):
+        """Test that entries can be listed and purged with a valid token."""
+        import negative_cache
+        negative_cache.remember('TYPO', 'No data found for ticker: TYPO')
+        negative_cache.remember('GONE', 'No data found for ticker: GONE')
+        headers = {"X-Admin-Token": "secret"}
+
+        with patch('main.ADMIN_TOKEN', 'secret'):
+            listed = await client.get("/api/admin/negative-cache", headers=headers)
+            one = await client.delete("/api/admin/negative-cache/typo", headers=headers)
+            rest = await client.delete("/api/admin/negative-cache", headers=headers)
+
+        assert {e['ticker'] for e in listed.json()['entries']} == {'TYPO', 'GONE'}
+        assert one.json() == {"purged": 1}
+        assert rest.json() == {"purged": 1}
+
+
+class TestProfiling:
+    """Test per-request profiling."""
+
+    @pytest.mark.asyncio
+    async def test_plain_requests_are_not_profiled(self, client, tmp_path):
+        """Test that requests without the header carry no profile."""
+        with patch('main.ADMIN_TOKEN', 'secret'), patch('profiling.PROFILE_DIR', str(tmp_path)):
+            response = await client.get("/api/quality/spy", headers={"X-Admin-Token": "secret"})
+
+        assert response.status_code == 200
+        assert 'x-profile-id' not in response.headers
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_requires_admin_token(self, client):
+        """Test that profiling without a valid token is refused."""
+        with patch('main.ADMIN_TOKEN', 'secret'):
+            response = await client.get("/api/quality/spy", headers={"X-Profile": "1", "X-Admin-Token": "x"})
+
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_profile_is_stored_and_served(self, client, tmp_path):
+        """Test that a profiled request's SQL timings and stacks can be fetched."""
+        headers = {"X-Admin-Token": "secret"}
+
+        with patch('main.ADMIN_TOKEN', 'secret'), patch('profiling.PROFILE_DIR', str(tmp_path)):
+            response = await client.get("/api/quality/spy?limit=5", headers={**headers, "X-Profile": "1"})
+            profile_id = response.headers['x-profile-id']
+            listed = await client.get("/api/admin/profiles", headers=headers)
+            summary = await client.get(f"/api/admin/profiles/{profile_id}", headers=headers)
+            folded = await client.get(f"/api/admin/profiles/{profile_id}?format=folded", headers=headers)
+            missing = await client.get("/api/admin/profiles/20240101T000000-00000000", headers=headers)
+
+        assert response.status_code == 200
+        assert [entry['id'] for entry in listed.json()['profiles']] == [profile_id]
+        assert summary.json()['request'] == 'GET /api/quality/spy?limit=5'
+        assert summary.json()['status'] == 200
+        assert summary.json()['sql']['queries'] == 2
+        assert any('FROM price_flags' in item['sql'] for item in summary.json()['sql']['statements'])
+        assert folded.headers['content-type'].startswith('text/plain')
+        assert missing.status_code == 404
+
+
+class TestStartup:
+    """Test the startup lifecycle."""
+
+    @pytest.mark.asyncio
+    async def test_lifespan_runs_migrations(self):
+        """Test that the lifespan hook migrates the schema once at startup."""
+        with patch('main.init_db') as mock_init:
+            async with app.router.lifespan_context(app):
+                assert mock_init.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_lifespan_flushes_access_log_on_shutdown(self):
+        """Test that pending cache access stamps are written at shutdown."""
+        with patch('main.init_db'), patch('main.retention.flush_access_log') as mock_flush:
+            async with app.router.lifespan_context(app):
+                mock_flush.assert_not_called()
+            mock_flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_ready_after_warmup(self, client):
+        """Test that readiness waits for warmup and its stats are exposed."""
+        import asyncio
+        import metrics
+        release = asyncio.Event()
+        stats = {'tickers': 3, 'published': 1, 'bytes': 4096, 'seconds': 0.01}
+
+        async def slow_warm(fn, limit):
+            await release.wait()
+            return stats
+
+        with patch('main.init_db'), patch('main.CACHE_WARMUP_TICKERS', 3), \
+                patch('main.asyncio.to_thread', side_effect=slow_warm):
+            async with app.router.lifespan_context(app):
+                assert (await client.get("/api/ready")).status_code == 503
+                assert (await client.get("/api/health")).status_code == 200
+                release.set()
+                for _ in range(100):
+                    if app.state.ready:
+                        break
+                    await asyncio.sleep(0.01)
+                assert (await client.get("/api/ready")).status_code == 200
+
+        assert metrics.snapshot()['gauges']['warmup_bytes'] == 4096
+
+    @pytest.mark.asyncio
+    async def test_ready_without_warmup(self, client):
+        """Test that a worker without warmup is ready once started."""
+        with patch('main.init_db'):
+            async with app.router.lifespan_context(app):
+                assert (await client.get("/api/ready")).status_code == 200
+
+    def test_import_does_not_load_heavy_modules(self):
+        """Test that importing main leaves pandas, numpy and requests unloaded."""
+        code = (
+            "import sys, main; "
+            "print(sorted(m for m in ('pandas', 'numpy', 'requests') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True, check=True,
+        )
+        assert result.stdout.strip() == '[]'
+
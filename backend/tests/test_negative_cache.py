@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+class TestNegativeCache:
+    """Test remembering tickers without upstream data."""
+
+    def test_lookup_returns_remembered_reason(self):
+        """Test that a remembered ticker is found case-insensitively."""
+        import negative_cache
+
+        negative_cache.remember('typo', 'No data found for ticker: TYPO')
+
+        assert negative_cache.lookup('TYPO') == 'No data found for ticker: TYPO'
+        assert negative_cache.lookup('SPY') is None
+
+    def test_entries_expire(self):
+        """Test that entries are ignored once their TTL has passed."""
+        import negative_cache
+
+        with patch('negative_cache.time.time', return_value=1000.0):
+            negative_cache.remember('GONE', 'delisted', ttl=10)
+        with patch('negative_cache.time.time', return_value=1011.0):
+            assert negative_cache.lookup('GONE') is None
+            assert negative_cache.entries() == []
+
+    def test_shared_through_sqlite(self):
+        """Test that another worker's entry is found and cached in memory."""
+        import negative_cache
+
+        negative_cache.remember('OTHER', 'No data found for ticker: OTHER')
+        negative_cache._entries.clear()
+
+        assert negative_cache.lookup('OTHER') is not None
+        assert 'OTHER' in negative_cache._entries
+
+    def test_memory_hit_skips_sqlite(self):
+        """Test that a fresh in-memory entry needs no database round trip."""
+        import negative_cache
+
+        negative_cache.remember('FAST', 'missing')
+
+        with patch('negative_cache.get_connection') as mock_conn:
+            assert negative_cache.lookup('FAST') == 'missing'
+            mock_conn.assert_not_called()
+
+    def test_purge_one_and_all(self):
+        """Test that entries can be purged individually or all at once."""
+        import negative_cache
+
+        negative_cache.remember('AAA', 'missing')
+        negative_cache.remember('BBB', 'missing')
+
+        assert negative_cache.purge('aaa') == 1
+        assert negative_cache.lookup('AAA') is None
+        assert negative_cache.purge() == 1
+        assert negative_cache.lookup('BBB') is None
+
+    def test_disabled_with_zero_ttl(self):
+        """Test that a TTL of zero turns negative caching off."""
+        import negative_cache
+
+        with patch('negative_cache.NEGATIVE_CACHE_TTL', 0):
+            negative_cache.remember('OFF', 'missing')
+            assert negative_cache.lookup('OFF') is None
+
+    def test_memory_is_bounded(self):
+        """Test that the in-memory copy drops its oldest entries."""
+        import negative_cache
+
+        with patch('negative_cache.NEGATIVE_CACHE_MAX_ENTRIES', 2):
+            for ticker in ('AAA', 'BBB', 'CCC'):
+                negative_cache.remember(ticker, 'missing')
+
+            assert list(negative_cache._entries) == ['BBB', 'CCC']
@@ -0,0 +1,182 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+import compute
+
+
+def price_frame(days=300, seed=0, drop=()):
+    """Daily bars ending today with a seeded random walk."""
+    dates = pd.date_range(end=datetime.now().date(), periods=days, freq='D')
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    df = pd.DataFrame({'adj_close': prices, 'close': prices}, index=dates)
+    df = df.drop(df.index[list(drop)])
+    df.attrs['stale'] = False
+    return df
+
+
+@pytest.fixture(autouse=True)
+def empty_universe_cache():
+    import portfolio
+    portfolio.clear_cache()
+    yield
+    portfolio.clear_cache()
+
+
+def frames(**by_ticker):
+    return lambda ticker, years: by_ticker[ticker]
+
+
+class TestPortfolioVolatility:
+    """Test portfolio vol and risk contributions."""
+
+    @patch('portfolio.fetch_and_cache')
+    def test_single_name_matches_ticker_vol(self, mock_fetch):
+        """Test that a one-name portfolio has that name's rolling vol."""
+        from portfolio import calculate_portfolio_volatility
+
+        df = price_frame()
+        mock_fetch.side_effect = frames(SPY=df)
+
+        result = calculate_portfolio_volatility({'spy': 1.0})
+
+        returns = compute.log_returns(compute.as_float_array(df['adj_close']))
+        assert result['vol_30d'] == round(compute.annualized_vol(returns, 30)[-1], 4)
+        assert result['vol_90d'] == round(compute.annualized_vol(returns, 90)[-1], 4)
+        assert result['history'][-1]['vol_30d'] == result['vol_30d']
+
+    @patch('portfolio.fetch_and_cache')
+    def test_accounts_for_correlation(self, mock_fetch):
+        """Test that vol comes from the weighted return series, not per-name vols."""
+        from portfolio import calculate_portfolio_volatility
+
+        a, b = price_frame(seed=1), price_frame(seed=2)
+        mock_fetch.side_effect = frames(AAA=a, BBB=b)
+
+        result = calculate_portfolio_volatility({'AAA': 0.7, 'BBB': -0.3})
+
+        combined = (0.7 * np.diff(np.log(a['adj_close'].to_numpy()))
+                    - 0.3 * np.diff(np.log(b['adj_close'].to_numpy())))
+        expected = np.std(combined[-90:], ddof=1) * np.sqrt(252)
+        assert result['vol_90d'] == pytest.approx(expected, abs=1e-4)
+
+    @patch('portfolio.fetch_and_cache')
+    def test_components_sum_to_portfolio_vol(self, mock_fetch):
+        """Test that component contributions add up to the portfolio vol."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame(seed=1), BBB=price_frame(seed=2),
+                                        CCC=price_frame(seed=3))
+
+        result = calculate_portfolio_volatility({'CCC': 0.2, 'AAA': 0.5, 'BBB': 0.3})
+
+        rows = result['contributions']['30d']
+        assert [r['ticker'] for r in rows] == ['AAA', 'BBB', 'CCC']
+        assert sum(r['component'] for r in rows) == pytest.approx(result['vol_30d'], abs=1e-3)
+        assert sum(r['percent'] for r in rows) == pytest.approx(100, abs=0.2)
+
+    @patch('portfolio.fetch_and_cache')
+    def test_history_contributions_match_latest(self, mock_fetch):
+        """Test that the rolling contributions end on the point-in-time split."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame(seed=1), BBB=price_frame(seed=2))
+
+        result = calculate_portfolio_volatility({'AAA': 0.6, 'BBB': 0.4})
+
+        for window in ('30d', '90d'):
+            latest = result['history'][-1]['contributions'][window]
+            expected = result['contributions'][window]
+            assert [r['ticker'] for r in latest] == ['AAA', 'BBB']
+            for row, point in zip(latest, expected):
+                assert row['component'] == pytest.approx(point['component'], abs=1e-4)
+                assert row['percent'] == pytest.approx(point['percent'], abs=0.1)
+        for entry in result['history']:
+            rows = entry['contributions']['30d']
+            assert sum(r['component'] for r in rows) == pytest.approx(entry['vol_30d'], abs=1e-3)
+
+    @patch('portfolio.fetch_and_cache')
+    def test_missing_prices_are_dropped(self, mock_fetch):
+        """Test that a NaN price drops its date instead of leaking NaN into the payload."""
+        import json
+        from portfolio import calculate_portfolio_volatility
+
+        gappy = price_frame(seed=2)
+        gappy.iloc[-5, gappy.columns.get_loc('adj_close')] = np.nan
+        mock_fetch.side_effect = frames(AAA=price_frame(seed=1), BBB=gappy)
+
+        result = calculate_portfolio_volatility({'AAA': 0.5, 'BBB': 0.5})
+
+        assert result['observations'] == 298
+        json.dumps(result, allow_nan=False)
+
+    @patch('portfolio.fetch_and_cache')
+    def test_aligns_on_common_dates(self, mock_fetch):
+        """Test that only dates every name traded are used."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame(), BBB=price_frame(seed=2, drop=(10, 20, 30)))
+
+        result = calculate_portfolio_volatility({'AAA': 0.5, 'BBB': 0.5})
+
+        assert result['observations'] == 296
+
+    @patch('portfolio.fetch_and_cache')
+    def test_short_overlap_raises(self, mock_fetch):
+        """Test that too little shared history raises ValueError."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame(days=60), BBB=price_frame(days=60))
+
+        with pytest.raises(ValueError, match="Not enough overlapping history"):
+            calculate_portfolio_volatility({'AAA': 0.5, 'BBB': 0.5})
+
+
+class TestUniverseCache:
+    """Test reuse of the aligned return matrix and covariances."""
+
+    @patch('portfolio.fetch_and_cache')
+    def test_new_weights_reuse_universe(self, mock_fetch):
+        """Test that re-weighting the same names reads the cache once."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame(seed=1), BBB=price_frame(seed=2))
+
+        first = calculate_portfolio_volatility({'AAA': 0.5, 'BBB': 0.5})
+        second = calculate_portfolio_volatility({'bbb': 0.9, 'aaa': 0.1})
+
+        assert mock_fetch.call_count == 2
+        assert first['vol_30d'] != second['vol_30d']
+
+    @patch('portfolio.fetch_and_cache')
+    def test_next_session_rebuilds(self, mock_fetch):
+        """Test that a new completed session invalidates the cached universe."""
+        from portfolio import calculate_portfolio_volatility
+
+        mock_fetch.side_effect = frames(AAA=price_frame())
+        with patch('portfolio.trading_calendar.last_completed_session', return_value=date(2024, 1, 8)):
+            calculate_portfolio_volatility({'AAA': 1.0})
+        with patch('portfolio.trading_calendar.last_completed_session', return_value=date(2024, 1, 9)):
+            calculate_portfolio_volatility({'AAA': 1.0})
+
+        assert mock_fetch.call_count == 2
+
+    @patch('portfolio.fetch_and_cache')
+    def test_stale_data_is_not_cached(self, mock_fetch):
+        """Test that a universe built from stale bars is rebuilt next time."""
+        from portfolio import calculate_portfolio_volatility
+
+        df = price_frame()
+        df.attrs['stale'] = True
+        mock_fetch.side_effect = frames(AAA=df)
+
+        calculate_portfolio_volatility({'AAA': 1.0})
+        calculate_portfolio_volatility({'AAA': 1.0})
+
+        assert mock_fetch.call_count == 2
@@ -0,0 +1,135 @@
+import pytest
+import sqlite3
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database from before the compact layout, with bars for three tickers."""
+    import retention
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE daily_prices (
+            ticker TEXT NOT NULL, date TEXT NOT NULL, open REAL, high REAL, low REAL,
+            close REAL, adj_close REAL, volume INTEGER, PRIMARY KEY (ticker, date)
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO daily_prices VALUES (?, ?, 1, 2, 0.5, ?, ?, 100)",
+        [(ticker, f'2024-01-{day:02d}', day, day) for ticker in ('AAA', 'BBB', 'CCC') for day in (2, 3, 4)],
+    )
+    conn.commit()
+    conn.close()
+    with patch('db.DB_PATH', path), patch.dict(retention._pending, clear=True):
+        from db import init_db
+        init_db()
+        yield path
+
+
+def legacy_tickers():
+    from db import get_connection
+    conn = get_connection()
+    try:
+        return {row[0] for row in conn.execute("SELECT DISTINCT ticker FROM daily_prices")}
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+class TestDayNumbers:
+    """Test the integer date encoding."""
+
+    def test_round_trip(self):
+        """Test that day numbers count from the Unix epoch and convert back."""
+        from price_store import day_number, day_string
+
+        assert day_number('1970-01-01') == 0
+        assert day_number('2024-01-02 00:00:00') == 19724
+        assert day_string(19724) == '2024-01-02'
+
+    def test_matches_sqlite_conversion(self, legacy_db):
+        """Test that the SQL used to move rows agrees with day_number."""
+        from db import get_connection
+        from price_store import day_number
+
+        conn = get_connection()
+        day = conn.execute("SELECT CAST(julianday('2024-03-10') - 2440587.5 AS INTEGER)").fetchone()[0]
+        conn.close()
+
+        assert day == day_number('2024-03-10')
+
+
+class TestOnlineMigration:
+    """Test moving legacy bars to the compact layout."""
+
+    def test_legacy_rows_kept_until_moved(self, legacy_db):
+        """Test that init_db leaves a non-empty legacy table in place."""
+        assert legacy_tickers() == {'AAA', 'BBB', 'CCC'}
+
+    def test_read_moves_ticker_on_first_touch(self, legacy_db):
+        """Test that reading a legacy ticker migrates it and returns its bars."""
+        from cache import get_cached_data
+
+        df = get_cached_data('BBB', '2024-01-01', '2024-01-31')
+
+        assert df['close'].tolist() == [2.0, 3.0, 4.0]
+        assert df.index[0] == df.index[0].normalize()
+        assert legacy_tickers() == {'AAA', 'CCC'}
+
+    def test_batches_then_drops_legacy_table(self, legacy_db):
+        """Test that batches move every ticker and the empty table is dropped."""
+        import metrics
+        from cache import get_cached_data
+        from price_store import migrate_batch, migration_pending
+
+        metrics.reset()
+        assert migrate_batch(limit=2) == 2
+        assert len(legacy_tickers()) == 1
+        assert migrate_batch(limit=2) == 1
+        assert migrate_batch(limit=2) == 0
+
+        assert legacy_tickers() is None
+        assert migration_pending() is False
+        assert metrics.snapshot()['counters']['prices_migrated_tickers'] == 3
+        assert len(get_cached_data('CCC', '2024-01-01', '2024-01-31')) == 3
+
+    def test_newer_bars_win_over_legacy(self, legacy_db):
+        """Test that a bar already saved in the new layout is not overwritten."""
+        import pandas as pd
+        from cache import get_cached_data, save_to_cache
+        from price_store import migrate_batch
+
+        df = pd.DataFrame({'open': [9.0], 'high': [9.0], 'low': [9.0], 'close': [9.0],
+                           'adj_close': [9.0], 'volume': [1]}, index=pd.DatetimeIndex(['2024-01-04']))
+        save_to_cache('AAA', df)
+        while migrate_batch():
+            pass
+
+        assert get_cached_data('AAA', '2024-01-01', '2024-01-31')['close'].tolist() == [2.0, 3.0, 9.0]
+
+    def test_retention_sees_unmigrated_tickers(self, legacy_db):
+        """Test that eviction covers tickers still in the legacy table."""
+        from db import get_connection
+        from retention import evict_ticker, lru_tickers
+
+        conn = get_connection()
+        assert lru_tickers(conn) == ['AAA', 'BBB', 'CCC']
+        evict_ticker(conn, 'AAA')
+        conn.close()
+
+        assert legacy_tickers() == {'BBB', 'CCC'}
+
+    @pytest.mark.asyncio
+    async def test_app_migrates_in_background(self, legacy_db):
+        """Test that the lifespan task moves everything."""
+        from main import migrate_prices
+
+        with patch('price_store.PRICES_MIGRATION_PAUSE', 0):
+            await migrate_prices()
+
+        assert legacy_tickers() is None
@@ -0,0 +1,102 @@
+import pytest
+import sqlite3
+import time
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    with patch('profiling.PROFILE_DIR', str(tmp_path / 'profiles')):
+        yield tmp_path / 'profiles'
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestQueryTimings:
+    """Test SQL timing on profiled connections."""
+
+    def test_counts_statements_and_rows(self):
+        """Test that executes and fetched rows are totalled per statement."""
+        from profiling import ProfiledConnection, QueryStats
+
+        stats = QueryStats()
+        conn = sqlite3.connect(':memory:', factory=ProfiledConnection)
+        conn.stats = stats
+        conn.execute("CREATE TABLE t (a)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(5)])
+        for _ in range(2):
+            conn.execute("SELECT a FROM t").fetchall()
+        assert len(list(conn.execute("SELECT a FROM t WHERE a > 2"))) == 2
+        conn.close()
+
+        assert stats.statements["SELECT a FROM t"][0] == 2
+        assert stats.statements["SELECT a FROM t"][2] == 10
+        assert stats.statements["SELECT a FROM t WHERE a > 2"][2] == 2
+
+    def test_other_contexts_get_plain_connections(self, profile_dir):
+        """Test that only the profiled context is wrapped, and only while profiling."""
+        import db
+        import profiling
+        import contextvars
+
+        profile = profiling.begin('test')
+        try:
+            assert isinstance(db.get_connection(), profiling.ProfiledConnection)
+            other = contextvars.Context().run(db.get_connection)
+            assert not isinstance(other, profiling.ProfiledConnection)
+        finally:
+            profiling.end(profile)
+
+        assert db.connect is sqlite3.connect
+
+
+class TestProfile:
+    """Test sampling, storage and lookup of profiles."""
+
+    def test_samples_request_threads(self, profile_dir):
+        """Test that stacks of the profiled thread are stored in collapsed form."""
+        import profiling
+        from db import get_connection
+
+        with patch('profiling.PROFILE_INTERVAL', 0.0005):
+            profile = profiling.begin('GET /test')
+            get_connection().execute("SELECT 1").fetchall()
+            busy_wait(0.05)
+            summary = profiling.end(profile, 200)
+
+        folded = profiling.load(profile.id, folded=True)
+        assert 'busy_wait (test_profiling.py:' in folded
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in folded.splitlines())
+        assert 'profile-sampler' not in folded
+        assert summary['status'] == 200
+        assert summary['samples'] > 0
+        assert summary['sql']['queries'] == 1
+        assert profiling.load(profile.id) == summary
+
+    def test_keeps_newest_profiles(self, profile_dir):
+        """Test that older profiles beyond PROFILE_KEEP are deleted."""
+        import profiling
+
+        with patch('profiling.PROFILE_KEEP', 2):
+            ids = []
+            for i in range(3):
+                profile = profiling.begin(f'GET /{i}')
+                profile.id = f"20240101T00000{i}-0000000{i}"
+                profiling.end(profile)
+                ids.append(profile.id)
+
+        assert [entry['id'] for entry in profiling.entries()] == ids[:0:-1]
+        assert profiling.load(ids[0]) is None
+
+    def test_rejects_malformed_ids(self, profile_dir):
+        """Test that ids that aren't profile ids never reach the filesystem."""
+        from profiling import load
+
+        assert load('../price_cache') is None
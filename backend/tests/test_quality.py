@@ -0,0 +1,216 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+def raw_bars(days=60, seed=0):
+    """Yahoo-style bars: naive UTC timestamps at the 09:30 New York open."""
+    from trading_calendar import is_trading_day
+    sessions = [d for d in pd.bdate_range('2024-02-01', periods=days * 2) if is_trading_day(d.date())][:days]
+    dates = pd.DatetimeIndex(sessions) + pd.Timedelta(hours=14, minutes=30)
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    return pd.DataFrame({
+        'open': close * 0.999, 'high': close * 1.01, 'low': close * 0.99,
+        'close': close, 'adj_close': close, 'volume': np.full(days, 1000.0),
+    }, index=pd.DatetimeIndex(dates, name='date'))
+
+
+def flags_of(report, name):
+    return report.loc[report['flag'] == name, 'date'].tolist()
+
+
+class TestClean:
+    """Test the vectorized cleaning stage."""
+
+    def test_clean_input_passes_through(self):
+        """Test that good bars are only re-indexed by session date."""
+        from quality import clean
+
+        raw = raw_bars()
+        df, report = clean(raw)
+
+        assert report.empty
+        assert (df.index == df.index.normalize()).all()
+        np.testing.assert_array_equal(df['close'], raw['close'])
+
+    def test_collapses_bars_on_the_same_session(self):
+        """Test that an intraday repeat of the last bar keeps only the latest."""
+        from quality import clean
+
+        raw = raw_bars(days=5)
+        live = raw.iloc[[-1]].copy()
+        live.index = live.index + pd.Timedelta(hours=5)
+        live['close'] = 123.0
+        df, report = clean(pd.concat([raw, live]))
+
+        assert len(df) == 5
+        assert df['close'].iloc[-1] == 123.0
+        assert flags_of(report, 'duplicate') == ['2024-02-07']
+
+    def test_evening_utc_timestamp_maps_to_new_york_date(self):
+        """Test that 01:00 UTC belongs to the previous New York session."""
+        from quality import session_dates
+
+        index = pd.DatetimeIndex(['2024-02-02 01:00', '2024-02-05'])
+
+        assert session_dates(index).strftime('%Y-%m-%d').tolist() == ['2024-02-01', '2024-02-05']
+
+    def test_drops_missing_and_non_positive_closes(self):
+        """Test that bars without a usable close are removed and flagged."""
+        from quality import clean
+
+        raw = raw_bars(days=10)
+        raw.iloc[2, raw.columns.get_loc('close')] = np.nan
+        raw.iloc[4, raw.columns.get_loc('adj_close')] = 0.0
+        df, report = clean(raw)
+
+        assert len(df) == 8
+        assert not df.isna().any().any()
+        assert flags_of(report, 'missing_close') == ['2024-02-05']
+        assert flags_of(report, 'non_positive') == ['2024-02-07']
+
+    def test_fills_and_repairs_ohlc(self):
+        """Test that null OHLC values are filled and ranges widened."""
+        from quality import clean
+
+        raw = raw_bars(days=10)
+        raw.iloc[1, raw.columns.get_loc('open')] = np.nan
+        raw.iloc[3, raw.columns.get_loc('high')] = raw['close'].iloc[3] * 0.5
+        df, report = clean(raw)
+
+        assert df['open'].iloc[1] == raw['close'].iloc[1]
+        assert df['high'].iloc[3] == raw['close'].iloc[3]
+        assert (df['high'] >= df[['open', 'close']].max(axis=1)).all()
+        assert (df['low'] <= df[['open', 'close']].min(axis=1)).all()
+        assert flags_of(report, 'filled') == ['2024-02-02']
+        assert flags_of(report, 'ohlc_repaired') == ['2024-02-06']
+
+    def test_drops_reverting_spike_but_keeps_real_moves(self):
+        """Test that a one-day bad tick is removed and a lasting jump is not."""
+        from quality import clean
+
+        raw = raw_bars()
+        raw.iloc[20, raw.columns.get_loc('adj_close')] *= 3
+        raw.iloc[40:, raw.columns.get_loc('adj_close')] *= 0.6
+        df, report = clean(raw)
+
+        assert flags_of(report, 'spike') == [raw.index[20].strftime('%Y-%m-%d')]
+        assert len(df) == 59
+
+    def test_reference_scale_keeps_real_reversal_in_short_window(self):
+        """Test that stored bars set the spike scale for a short overlap fetch."""
+        from quality import clean
+
+        rng = np.random.default_rng(3)
+        reference = 100 * np.exp(np.cumsum(rng.normal(0, 0.08, 60)))
+        raw = raw_bars(days=10)
+        close = raw['adj_close'].to_numpy() * 0.001 + 100
+        close[5] = close[4] * 1.16
+        raw['adj_close'] = close
+
+        assert len(flags_of(clean(raw)[1], 'spike')) == 1
+        df, report = clean(raw, reference)
+
+        assert flags_of(report, 'spike') == []
+        assert len(df) == 10
+
+    def test_flags_but_keeps_non_session_bars(self):
+        """Test that weekend and holiday bars are flagged, not dropped."""
+        from quality import clean
+
+        raw = raw_bars(days=3)
+        extra = raw.iloc[[0, 0]].copy()
+        extra.index = pd.DatetimeIndex(['2024-02-03 14:30', '2024-02-19 14:30'], name='date')
+        df, report = clean(pd.concat([raw, extra]))
+
+        assert len(df) == 5
+        assert flags_of(report, 'non_session') == ['2024-02-03', '2024-02-19']
+
+
+class TestRecord:
+    """Test persisting the quality report."""
+
+    def test_report_and_deletes_dropped_bars(self):
+        """Test that flags are stored and previously stored bad bars removed."""
+        from cache import save_to_cache, get_cached_data
+        from quality import clean, record, get_report
+
+        raw = raw_bars(days=10)
+        save_to_cache('QA_REC', clean(raw)[0])
+        raw.iloc[4, raw.columns.get_loc('close')] = np.nan
+
+        df, report = clean(raw)
+        save_to_cache('QA_REC', df)
+        record('QA_REC', report, df.index)
+
+        stored = get_cached_data('QA_REC', '2024-01-01', '2024-12-31')
+        assert len(stored) == 9
+        result = get_report('qa_rec')
+        assert result['counts'] == {'missing_close': 1}
+        assert result['flags'][0]['date'] == '2024-02-07'
+
+    def test_kept_duplicate_date_is_not_deleted(self):
+        """Test that collapsing duplicates never deletes the surviving bar."""
+        from cache import save_to_cache, get_cached_data
+        from quality import clean, record
+
+        raw = raw_bars(days=3)
+        bad = raw.iloc[[-1]].copy()
+        bad.index = bad.index - pd.Timedelta(hours=1)
+        bad['close'] = np.nan
+
+        df, report = clean(pd.concat([raw, bad]))
+        save_to_cache('QA_DUP', df)
+        record('QA_DUP', report, df.index)
+
+        assert len(get_cached_data('QA_DUP', '2024-01-01', '2024-12-31')) == 3
+
+
+class TestFetchCleans:
+    """Test that fetched bars are cleaned before they are stored."""
+
+    @patch('cache.fetch_from_yahoo')
+    def test_dirty_fetch_stored_clean(self, mock_fetch):
+        """Test that _fetch_and_store keeps only clean bars."""
+        from cache import _fetch_and_store, get_cached_data
+
+        raw = raw_bars(days=10)
+        raw.iloc[3, raw.columns.get_loc('adj_close')] = np.nan
+        mock_fetch.return_value = raw
+
+        returned = _fetch_and_store('QA_FETCH', datetime(2024, 1, 1), datetime(2024, 3, 1))
+
+        assert len(returned) == 9
+        assert len(get_cached_data('QA_FETCH', '2024-01-01', '2024-12-31')) == 9
+
+    @patch('cache.fetch_from_yahoo')
+    def test_all_bars_invalid_raises(self, mock_fetch):
+        """Test that a fetch with no usable bars raises NoDataError."""
+        from cache import _fetch_and_store, NoDataError
+
+        raw = raw_bars(days=3)
+        raw['close'] = np.nan
+        mock_fetch.return_value = raw
+
+        with pytest.raises(NoDataError, match="No valid price data"):
+            _fetch_and_store('QA_EMPTY', datetime(2024, 1, 1), datetime(2024, 3, 1))
+
+    def test_stored_tail_is_oldest_first_before_window(self):
+        """Test that the reference tail is the last stored bars before the fetch start."""
+        from cache import save_to_cache, _stored_tail
+        from quality import clean
+
+        with patch('quality.QUALITY_REFERENCE_BARS', 5):
+            df = clean(raw_bars(days=20))[0]
+            save_to_cache('QA_TAIL', df)
+
+            tail = _stored_tail('qa_tail', df.index[15].to_pydatetime())
+
+        np.testing.assert_array_equal(tail, df['adj_close'].to_numpy()[10:15])
+
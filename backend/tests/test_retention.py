@@ -0,0 +1,316 @@
+import pytest
+import sqlite3
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Point the cache at an empty database with no pending access stamps."""
+    import retention
+    path = tmp_path / 'retention.db'
+    with patch('db.DB_PATH', path), patch.dict(retention._pending, clear=True):
+        from db import init_db
+        init_db()
+        yield path
+
+
+def seed_prices(ticker, days=100, end=None):
+    from db import get_connection
+    from price_store import add_ticker, day_number
+    end = end or datetime.now()
+    conn = get_connection()
+    add_ticker(conn, ticker)
+    ticker_id = conn.execute("SELECT id FROM tickers WHERE symbol = ?", (ticker,)).fetchone()[0]
+    rows = [
+        (ticker_id, day_number((end - timedelta(days=i)).strftime('%Y-%m-%d')), 1.0, 1.0, 1.0, 1.0, 1.0, 1000)
+        for i in range(days)
+    ]
+    conn.executemany("INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def set_last_accessed(ticker, stamp):
+    from db import get_connection
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO cache_metadata (ticker, last_accessed) VALUES (?, ?) "
+        "ON CONFLICT(ticker) DO UPDATE SET last_accessed = excluded.last_accessed",
+        (ticker, stamp),
+    )
+    conn.commit()
+    conn.close()
+
+
+def seed_intraday(ticker, days=10, end=None):
+    from db import get_connection
+    end = end or datetime.now()
+    conn = get_connection()
+    rows = [
+        (ticker, '5m', (end - timedelta(days=i)).strftime('%Y-%m-%d'), 78, 0.0001, b'')
+        for i in range(days)
+    ]
+    conn.executemany("INSERT INTO intraday_blocks VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def cached_tickers():
+    from db import get_connection
+    conn = get_connection()
+    tickers = {row[0] for row in conn.execute(
+        "SELECT DISTINCT t.symbol FROM prices p JOIN tickers t ON t.id = p.ticker_id"
+    )}
+    conn.close()
+    return tickers
+
+
+class TestAccessLog:
+    """Test access tracking."""
+
+    def test_flush_writes_stamp_and_count(self, temp_db):
+        """Test that repeated accesses are flushed as one row with a count."""
+        from retention import record_access, flush_access_log
+        from db import get_connection
+
+        record_access('spy')
+        record_access('SPY')
+
+        assert flush_access_log() == 1
+        assert flush_access_log() == 0
+
+        conn = get_connection()
+        row = conn.execute(
+            "SELECT last_accessed, access_count FROM cache_metadata WHERE ticker = 'SPY'"
+        ).fetchone()
+        conn.close()
+        assert row['access_count'] == 2
+        assert row['last_accessed'] is not None
+
+    def test_refresh_keeps_access_stats(self, temp_db):
+        """Test that re-caching a ticker does not reset its access stats."""
+        import pandas as pd
+        from cache import save_to_cache
+        from retention import record_access, flush_access_log
+        from db import get_connection
+
+        df = pd.DataFrame(
+            {'open': [1.0], 'high': [1.0], 'low': [1.0], 'close': [1.0], 'adj_close': [1.0], 'volume': [1]},
+            index=pd.to_datetime(['2024-01-02']),
+        )
+        record_access('AAPL')
+        flush_access_log()
+        save_to_cache('AAPL', df)
+
+        conn = get_connection()
+        row = conn.execute(
+            "SELECT last_updated, access_count FROM cache_metadata WHERE ticker = 'AAPL'"
+        ).fetchone()
+        conn.close()
+        assert row['access_count'] == 1
+        assert row['last_updated'] is not None
+
+    def test_cache_reads_record_access(self, temp_db):
+        """Test that reading cached data counts as an access."""
+        from cache import get_cached_data
+        import retention
+
+        seed_prices('MSFT', days=5)
+        get_cached_data('MSFT', '2000-01-01', '2100-01-01')
+        get_cached_data('NOPE', '2000-01-01', '2100-01-01')
+
+        assert set(retention._pending) == {'MSFT'}
+
+    def test_access_only_row_needs_update(self, temp_db):
+        """Test that a ticker seen only by access tracking is still fetched."""
+        from cache import needs_update
+
+        set_last_accessed('QQQ', '2024-01-02T10:00:00')
+
+        assert needs_update('QQQ') is True
+
+
+class TestEviction:
+    """Test LRU eviction and history trimming."""
+
+    def test_lru_order(self, temp_db):
+        """Test that never-accessed tickers come first, then oldest access."""
+        from retention import lru_tickers
+        from db import get_connection
+
+        for ticker in ('AAA', 'BBB', 'CCC'):
+            seed_prices(ticker, days=3)
+        set_last_accessed('AAA', '2024-06-01T00:00:00')
+        set_last_accessed('CCC', '2024-01-01T00:00:00')
+
+        conn = get_connection()
+        order = lru_tickers(conn)
+        conn.close()
+
+        assert order == ['BBB', 'CCC', 'AAA']
+
+    def test_ticker_limit_evicts_least_recent(self, temp_db):
+        """Test that only the most recently accessed tickers are kept."""
+        from retention import run_maintenance
+
+        for i, ticker in enumerate(('AAA', 'BBB', 'CCC')):
+            seed_prices(ticker, days=3)
+            set_last_accessed(ticker, f'2024-01-0{i + 1}T00:00:00')
+
+        summary = run_maintenance(max_bytes=0, max_tickers=2, history_years=0)
+
+        assert summary['evicted'] == ['AAA']
+        assert cached_tickers() == {'BBB', 'CCC'}
+
+    def test_size_limit_evicts_until_under_budget(self, temp_db):
+        """Test that tickers are evicted and pages vacuumed to meet the size cap."""
+        from retention import run_maintenance, used_bytes
+        from db import get_connection
+
+        for i, ticker in enumerate(('AAA', 'BBB', 'CCC', 'DDD')):
+            seed_prices(ticker, days=2000)
+            set_last_accessed(ticker, f'2024-01-0{i + 1}T00:00:00')
+        conn = get_connection()
+        budget = used_bytes(conn) // 2
+        conn.close()
+
+        summary = run_maintenance(max_bytes=budget, max_tickers=0, history_years=0)
+
+        conn = get_connection()
+        assert used_bytes(conn) <= budget
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        conn.close()
+        assert summary['evicted'][0] == 'AAA'
+        assert summary['pages_freed'] > 0
+        assert 'DDD' in cached_tickers()
+
+    def test_trims_history_beyond_horizon(self, temp_db):
+        """Test that bars older than the retention horizon are removed."""
+        from retention import run_maintenance
+        from db import get_connection
+
+        seed_prices('SPY', days=3 * 365)
+
+        summary = run_maintenance(max_bytes=0, max_tickers=0, history_years=1)
+
+        cutoff = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        conn = get_connection()
+        oldest = conn.execute("SELECT date(MIN(day) * 86400, 'unixepoch') FROM prices").fetchone()[0]
+        conn.close()
+        assert oldest >= cutoff
+        assert summary['rows_trimmed'] > 0
+
+    def test_intraday_only_ticker_is_evicted(self, temp_db):
+        """Test that tickers with only intraday sessions count toward the limit."""
+        from retention import run_maintenance
+        from db import get_connection
+
+        seed_intraday('IDAY')
+        seed_prices('SPY', days=3)
+        set_last_accessed('SPY', '2024-01-01T00:00:00')
+
+        summary = run_maintenance(max_bytes=0, max_tickers=1, history_years=0)
+
+        conn = get_connection()
+        remaining = conn.execute("SELECT COUNT(*) FROM intraday_blocks").fetchone()[0]
+        conn.close()
+        assert summary['evicted'] == ['IDAY']
+        assert remaining == 0
+        assert cached_tickers() == {'SPY'}
+
+    def test_trims_intraday_beyond_horizon(self, temp_db):
+        """Test that intraday sessions older than their horizon are removed."""
+        from retention import run_maintenance
+        from db import get_connection
+
+        seed_intraday('SPY', days=60)
+
+        summary = run_maintenance(max_bytes=0, max_tickers=0, history_years=0, intraday_days=30)
+
+        cutoff = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        conn = get_connection()
+        oldest = conn.execute("SELECT MIN(day) FROM intraday_blocks").fetchone()[0]
+        conn.close()
+        assert oldest >= cutoff
+        assert summary['rows_trimmed'] == 29
+
+    def test_no_limits_keeps_everything(self, temp_db):
+        """Test that maintenance with retention disabled deletes nothing."""
+        from retention import run_maintenance
+
+        seed_prices('SPY', days=10)
+
+        summary = run_maintenance(max_bytes=0, max_tickers=0, history_years=0)
+
+        assert summary['evicted'] == []
+        assert summary['rows_trimmed'] == 0
+        assert cached_tickers() == {'SPY'}
+
+
+class TestCompaction:
+    """Test incremental vacuum."""
+
+    def test_legacy_database_converted_at_startup(self, tmp_path):
+        """Test that init_db converts a database without auto-vacuum, not maintenance."""
+        import retention
+        from db import init_db, get_connection
+
+        path = tmp_path / 'legacy.db'
+        legacy = sqlite3.connect(path)
+        legacy.execute("CREATE TABLE daily_prices (ticker TEXT, date TEXT)")
+        legacy.commit()
+        legacy.close()
+
+        with patch('db.DB_PATH', path), patch.dict(retention._pending, clear=True):
+            init_db()
+            conn = get_connection()
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            conn.close()
+            with patch('db.enable_incremental_vacuum') as convert:
+                retention.run_maintenance(max_bytes=10 ** 9, max_tickers=0, history_years=0)
+
+        assert auto_vacuum == 2
+        assert not convert.called
+
+
+class TestMaintenanceWorker:
+    """Test electing the one worker that runs maintenance."""
+
+    def test_only_one_holder(self, temp_db):
+        """Test that a second process can't claim maintenance until the first releases it."""
+        import retention
+
+        assert retention.claim_maintenance() is True
+        assert retention.claim_maintenance() is True
+        holder = retention._maintainer
+        try:
+            # Another worker has its own open file description
+            with patch('retention._maintainer', None):
+                assert retention.claim_maintenance() is False
+            retention.release_maintenance()
+            with patch('retention._maintainer', None):
+                assert retention.claim_maintenance() is True
+                retention.release_maintenance()
+        finally:
+            holder.close()
+            retention._maintainer = None
+
+    @pytest.mark.asyncio
+    async def test_other_workers_only_flush(self, temp_db):
+        """Test that a worker without the lock flushes its stamps and skips retention."""
+        import asyncio
+        import main
+
+        with patch('retention.claim_maintenance', return_value=False), \
+                patch('retention.run_maintenance') as run, \
+                patch('retention.flush_access_log') as flush:
+            task = asyncio.create_task(main.cache_maintenance_loop(0.01))
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+        assert flush.called
+        assert not run.called
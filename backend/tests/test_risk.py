@@ -0,0 +1,140 @@
+import math
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+@pytest.fixture(autouse=True)
+def empty_universe_cache():
+    import portfolio
+    portfolio.clear_cache()
+    yield
+    portfolio.clear_cache()
+
+
+def price_frame(days=600, seed=0):
+    dates = pd.date_range(end=datetime.now().date(), periods=days, freq='D')
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, days)))
+    df = pd.DataFrame({'adj_close': prices}, index=dates)
+    df.attrs['stale'] = False
+    return df
+
+
+class TestVarEs:
+    """Test VaR/ES from a partial loss tail."""
+
+    @pytest.mark.parametrize('confidence', [0.9, 0.95, 0.99, 0.999])
+    def test_tail_matches_full_sample(self, confidence):
+        """Test that the kept tail reproduces np.quantile and the full-sample ES."""
+        from risk import tail_size, var_es
+
+        losses = np.random.default_rng(1).standard_normal(10_007)
+        keep = tail_size(len(losses), confidence)
+        tail = np.partition(losses, len(losses) - keep)[-keep:]
+
+        stats = var_es(tail, len(losses), confidence)
+
+        var = np.quantile(losses, confidence)
+        assert stats['var'] == pytest.approx(var, abs=1e-12)
+        assert stats['es'] == pytest.approx(losses[losses >= var].mean(), abs=1e-12)
+
+
+class TestMonteCarlo:
+    """Test chunked Monte Carlo simulation."""
+
+    def test_matches_lognormal_quantile(self):
+        """Test that single-asset VaR converges to the closed form."""
+        from risk import monte_carlo_tail, tail_size, var_es
+
+        paths = 400_000
+        tail = monte_carlo_tail(np.array([0.005]), np.array([[0.004]]), np.array([1.0]),
+                                paths, tail_size(paths, 0.99), seed=3)
+
+        expected = 1 - math.exp(0.005 - 2.3263478740408408 * math.sqrt(0.004))
+        assert var_es(tail, paths, 0.99)['var'] == pytest.approx(expected, rel=0.02)
+
+    def test_seeded_results_do_not_depend_on_threads(self):
+        """Test that a seed gives the same tail with one or many workers."""
+        from risk import monte_carlo_tail
+
+        args = (np.zeros(2), np.array([[1e-4, 5e-5], [5e-5, 2e-4]]), np.array([0.5, 0.5]), 50_000, 600)
+        with patch('risk.RISK_CHUNK_PATHS', 4096), patch('risk.RISK_WORKERS', 1):
+            single = monte_carlo_tail(*args, seed=7)
+        with patch('risk.RISK_CHUNK_PATHS', 4096), patch('risk.RISK_WORKERS', 4):
+            pooled = monte_carlo_tail(*args, seed=7)
+            other_seed = monte_carlo_tail(*args, seed=8)
+
+        np.testing.assert_array_equal(np.sort(single), np.sort(pooled))
+        assert not np.array_equal(np.sort(single), np.sort(other_seed))
+
+    @patch('risk.RISK_CHUNK_PATHS', 1000)
+    def test_memory_bounded_by_chunk(self):
+        """Test that no simulated matrix exceeds one chunk of paths."""
+        import risk
+
+        with patch('risk._simulate_tail', wraps=risk._simulate_tail) as mock_chunk:
+            tail = risk.monte_carlo_tail(np.zeros(3), np.eye(3) * 1e-4, np.ones(3) / 3, 10_500, 100)
+
+        sizes = [c.args[1] for c in mock_chunk.call_args_list]
+        assert max(sizes) == 1000
+        assert sum(sizes) == 10_500
+        assert len(tail) == 100
+
+
+class TestCalculateVar:
+    """Test VaR for tickers and baskets from cached returns."""
+
+    @patch('portfolio.fetch_and_cache')
+    def test_historical_single_ticker(self, mock_fetch):
+        """Test historical VaR against the empirical quantile of daily losses."""
+        from risk import calculate_var
+
+        df = price_frame()
+        mock_fetch.return_value = df
+
+        result = calculate_var({'spy': 1.0}, confidences=[0.99], horizons=[1])
+
+        prices = df['adj_close'].to_numpy()
+        losses = 1 - prices[1:] / prices[:-1]
+        assert result['tickers'] == ['SPY']
+        assert result['results'][0]['var'] == round(np.quantile(losses, 0.99), 6)
+
+    @patch('portfolio.fetch_and_cache')
+    def test_longer_horizon_and_higher_confidence_lose_more(self, mock_fetch):
+        """Test that VaR grows with horizon and confidence, and ES exceeds VaR."""
+        from risk import calculate_var
+
+        mock_fetch.side_effect = lambda ticker, years: price_frame(seed={'AAA': 1, 'BBB': 2}[ticker])
+
+        for method in ('historical', 'monte_carlo'):
+            result = calculate_var({'AAA': 0.6, 'BBB': 0.4}, method=method, paths=20_000)
+            by_key = {(r['horizon'], r['confidence']): r for r in result['results']}
+            assert by_key[(10, 0.95)]['var'] > by_key[(1, 0.95)]['var']
+            assert by_key[(1, 0.99)]['var'] > by_key[(1, 0.95)]['var']
+            assert all(r['es'] >= r['var'] for r in result['results'])
+
+    @patch('portfolio.fetch_and_cache')
+    def test_monte_carlo_is_reproducible(self, mock_fetch):
+        """Test that the same seed gives the same numbers."""
+        from risk import calculate_var
+
+        mock_fetch.return_value = price_frame()
+
+        first = calculate_var({'SPY': 1.0}, method='monte_carlo', paths=20_000, seed=5)
+        second = calculate_var({'SPY': 1.0}, method='monte_carlo', paths=20_000, seed=5)
+
+        assert first['results'] == second['results']
+        assert first['paths'] == 20_000
+
+    def test_unknown_method_raises(self):
+        """Test that an unsupported method raises ValueError."""
+        from risk import calculate_var
+
+        with pytest.raises(ValueError, match="Unsupported method"):
+            calculate_var({'SPY': 1.0}, method='parametric')
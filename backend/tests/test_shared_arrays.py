@@ -0,0 +1,243 @@
+import os
+import subprocess
+import pytest
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, '..')
+
+
+class TestPublishAndLoad:
+    """Test publishing and mapping shared arrays."""
+
+    def test_round_trip_is_read_only_mapping(self):
+        """Test that a published array is served as a read-only memory map."""
+        import shared_arrays
+
+        data = np.arange(12, dtype=np.float64).reshape(3, 4)
+        shared_arrays.publish('SA_RT', lambda: data)
+
+        loaded = shared_arrays.load('sa_rt')
+        np.testing.assert_array_equal(loaded, data)
+        assert isinstance(loaded, np.memmap)
+        assert not loaded.flags.writeable
+
+    def test_nothing_published_when_read_returns_none(self):
+        """Test that an empty read leaves no file behind."""
+        import shared_arrays
+
+        assert shared_arrays.publish('SA_NONE', lambda: None) is None
+        assert shared_arrays.load('SA_NONE') is None
+
+    def test_invalidate_unlinks_but_handed_out_maps_stay_valid(self):
+        """Test that invalidation hides the file without breaking live readers."""
+        import shared_arrays
+
+        shared_arrays.publish('SA_INV', lambda: np.ones((2, 3)))
+        held = shared_arrays.load('SA_INV')
+
+        shared_arrays.invalidate('SA_INV')
+
+        assert shared_arrays.load('SA_INV') is None
+        assert held.sum() == 6
+
+    def test_replaced_file_is_remapped(self):
+        """Test that a worker notices a file republished by another worker."""
+        import shared_arrays
+
+        shared_arrays.publish('SA_NEW', lambda: np.zeros((2, 2)))
+        shared_arrays.load('SA_NEW')
+        # Another worker republishes without going through this process
+        np.save(shared_arrays.directory() / 'tmp.npy', np.full((2, 2), 7.0))
+        os.replace(shared_arrays.directory() / 'tmp.npy', shared_arrays.directory() / 'SA_NEW.npy')
+
+        assert shared_arrays.load('SA_NEW')[0, 0] == 7.0
+
+    def test_visible_to_other_processes(self):
+        """Test that a separate process maps the same published file."""
+        import shared_arrays
+
+        shared_arrays.publish('SA_PROC', lambda: np.full((2, 2), 3.0))
+        code = (
+            "import sys, numpy as np; "
+            "print(np.load(sys.argv[1], mmap_mode='r').sum())"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code, str(shared_arrays.directory() / 'SA_PROC.npy')],
+            capture_output=True, text=True, check=True,
+        )
+        assert float(result.stdout) == 12.0
+
+    def test_oldest_files_evicted_over_limit(self):
+        """Test that only ARRAY_CACHE_MAX_TICKERS files are kept."""
+        import shared_arrays
+
+        with patch('shared_arrays.ARRAY_CACHE_MAX_TICKERS', 2):
+            for ticker in ('SA_E1', 'SA_E2', 'SA_E3'):
+                shared_arrays.publish(ticker, lambda: np.ones(3))
+
+            assert shared_arrays.load('SA_E1') is None
+            assert shared_arrays.load('SA_E3') is not None
+
+    def test_publish_after_min_reads(self):
+        """Test that a ticker becomes hot after ARRAY_CACHE_MIN_READS misses."""
+        import shared_arrays
+
+        with patch('shared_arrays.ARRAY_CACHE_MIN_READS', 2):
+            assert shared_arrays.note_read('SA_HOT') is False
+            assert shared_arrays.note_read('SA_HOT') is True
+
+    def test_publish_many_reads_without_lock(self):
+        """Test that rows are read unlocked and arrays read before an invalidation are dropped."""
+        import fcntl
+        import shared_arrays
+
+        def read(missing):
+            with open(shared_arrays.directory() / '.lock', 'a+b') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            yield 'SA_PM1', np.ones(3)
+            array = np.ones(3)
+            # A writer commits SA_PM2's rows after they were read
+            shared_arrays.invalidate('SA_PM2')
+            yield 'SA_PM2', array
+
+        assert shared_arrays.publish_many(['SA_PM1', 'SA_PM2'], read) == 1
+
+        assert shared_arrays.load('SA_PM1') is not None
+        assert shared_arrays.load('SA_PM2') is None
+        assert not list(shared_arrays.directory().glob('*.tmp'))
+
+    def test_rejects_unsafe_ticker(self):
+        """Test that a symbol that isn't a plain ticker never names a file."""
+        import shared_arrays
+
+        with pytest.raises(ValueError, match="Invalid ticker"):
+            shared_arrays.publish('../SA_ESCAPE', lambda: np.zeros(3))
+        assert shared_arrays.load('../SA_ESCAPE') is None
+
+    def test_disabled(self):
+        """Test that a zero ticker limit turns the cache off."""
+        import shared_arrays
+
+        with patch('shared_arrays.ARRAY_CACHE_MAX_TICKERS', 0):
+            assert shared_arrays.note_read('SA_OFF') is False
+            assert shared_arrays.load('SA_OFF') is None
+
+
+def sample_frame():
+    dates = pd.date_range('2024-03-01', periods=10, freq='B')
+    prices = np.linspace(100, 109, 10)
+    return pd.DataFrame({
+        'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices,
+        'adj_close': prices * 0.99, 'volume': np.arange(10) * 1000,
+    }, index=dates)
+
+
+class TestCachedReads:
+    """Test get_cached_data served from shared arrays."""
+
+    @patch('shared_arrays.ARRAY_CACHE_MIN_READS', 2)
+    def test_hot_reads_match_sqlite(self):
+        """Test that frames served from the shared array equal the SQLite ones."""
+        from cache import save_to_cache, get_cached_data
+        import shared_arrays
+
+        save_to_cache('SA_CACHE', sample_frame())
+        from_sqlite = get_cached_data('SA_CACHE', '2024-03-04', '2024-03-12')
+        assert shared_arrays.load('SA_CACHE') is None
+
+        from_arrays = get_cached_data('SA_CACHE', '2024-03-04', '2024-03-12')
+
+        assert shared_arrays.load('SA_CACHE') is not None
+        pd.testing.assert_frame_equal(from_arrays, from_sqlite)
+
+    @patch('shared_arrays.ARRAY_CACHE_MIN_READS', 1)
+    def test_save_invalidates(self):
+        """Test that saving new bars replaces what readers see."""
+        from cache import save_to_cache, get_cached_data
+        import shared_arrays
+
+        df = sample_frame()
+        save_to_cache('SA_SAVE', df)
+        get_cached_data('SA_SAVE', '2024-03-01', '2024-03-31')
+        assert shared_arrays.load('SA_SAVE') is not None
+
+        df['close'] = 1.0
+        save_to_cache('SA_SAVE', df)
+
+        assert shared_arrays.load('SA_SAVE') is None
+        assert (get_cached_data('SA_SAVE', '2024-03-01', '2024-03-31')['close'] == 1.0).all()
+
+    @patch('shared_arrays.ARRAY_CACHE_MIN_READS', 1)
+    def test_eviction_invalidates(self):
+        """Test that evicting a ticker drops its shared array."""
+        from cache import save_to_cache, get_cached_data, get_connection
+        import retention
+        import shared_arrays
+
+        save_to_cache('SA_EVICT', sample_frame())
+        get_cached_data('SA_EVICT', '2024-03-01', '2024-03-31')
+
+        conn = get_connection()
+        retention.evict_ticker(conn, 'SA_EVICT')
+        conn.close()
+
+        assert shared_arrays.load('SA_EVICT') is None
+        assert get_cached_data('SA_EVICT', '2024-03-01', '2024-03-31').empty
+
+
+def set_access_count(ticker, count):
+    from cache import get_connection
+    conn = get_connection()
+    conn.execute("UPDATE cache_metadata SET access_count = ? WHERE ticker = ?", (count, ticker))
+    conn.commit()
+    conn.close()
+
+
+class TestWarmArrays:
+    """Test startup warming of the most-accessed tickers."""
+
+    def test_publishes_top_tickers_in_one_scan(self):
+        """Test that the hottest tickers are mapped and match the stored rows."""
+        from cache import save_to_cache, warm_arrays, _read_series
+        import shared_arrays
+
+        for ticker, count in (('SA_W1', 10**9 + 2), ('SA_W2', 10**9 + 1), ('SA_W3', 10**9)):
+            save_to_cache(ticker, sample_frame())
+            set_access_count(ticker, count)
+
+        with patch('shared_arrays.publish_many', wraps=shared_arrays.publish_many) as mock_publish:
+            stats = warm_arrays(2)
+
+        assert mock_publish.call_count == 1
+        assert stats['tickers'] == 2 and stats['published'] == 2
+        assert stats['bytes'] == 2 * 7 * 10 * 8
+        np.testing.assert_array_equal(shared_arrays.load('SA_W1'), _read_series('SA_W1'))
+        assert shared_arrays.load('SA_W2') is not None
+        assert shared_arrays.load('SA_W3') is None
+
+    def test_maps_already_published_arrays(self):
+        """Test that a second worker maps existing files without rereading rows."""
+        from cache import save_to_cache, warm_arrays
+
+        save_to_cache('SA_W4', sample_frame())
+        set_access_count('SA_W4', 10**10)
+        warm_arrays(1)
+
+        stats = warm_arrays(1)
+
+        assert (stats['tickers'], stats['published']) == (1, 0)
+
+    def test_disabled_array_cache(self):
+        """Test that warming is a no-op without the array cache."""
+        from cache import save_to_cache, warm_arrays
+
+        save_to_cache('SA_W5', sample_frame())
+        set_access_count('SA_W5', 10**11)
+        with patch('shared_arrays.ARRAY_CACHE_MAX_TICKERS', 0):
+            stats = warm_arrays(5)
+
+        assert (stats['tickers'], stats['bytes']) == (0, 0)
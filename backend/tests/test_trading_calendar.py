@@ -0,0 +1,66 @@
+import pytest
+from datetime import date, datetime, timezone
+
+import sys
+sys.path.insert(0, '..')
+
+from trading_calendar import (
+    holidays, is_trading_day, previous_trading_day, last_completed_session, session_close,
+)
+
+
+class TestHolidays:
+    """Test NYSE holiday generation."""
+
+    def test_2024_holidays(self):
+        """Test the full 2024 holiday schedule."""
+        assert holidays(2024) == {
+            date(2024, 1, 1), date(2024, 1, 15), date(2024, 2, 19), date(2024, 3, 29),
+            date(2024, 5, 27), date(2024, 6, 19), date(2024, 7, 4), date(2024, 9, 2),
+            date(2024, 11, 28), date(2024, 12, 25),
+        }
+
+    def test_weekend_observance(self):
+        """Test that Sunday holidays move to Monday and Saturday ones to Friday."""
+        assert date(2022, 12, 26) in holidays(2022)
+        assert date(2022, 6, 20) in holidays(2022)
+        assert date(2026, 7, 3) in holidays(2026)
+
+    def test_saturday_new_year_not_observed(self):
+        """Test that New Year's Day on a Saturday closes nothing the prior Friday."""
+        assert date(2021, 12, 31) not in holidays(2021)
+        assert is_trading_day(date(2021, 12, 31))
+
+    def test_juneteenth_starts_in_2022(self):
+        """Test that Juneteenth is only a holiday from 2022."""
+        assert date(2021, 6, 18) not in holidays(2021)
+        assert date(2023, 6, 19) in holidays(2023)
+
+    def test_special_closure(self):
+        """Test that one-off closures are included."""
+        assert not is_trading_day(date(2025, 1, 9))
+
+
+class TestSessions:
+    """Test session arithmetic."""
+
+    def test_previous_trading_day_skips_weekend_and_holiday(self):
+        """Test that the previous session skips non-trading days."""
+        assert previous_trading_day(date(2024, 3, 11)) == date(2024, 3, 8)
+        assert previous_trading_day(date(2024, 4, 1)) == date(2024, 3, 28)
+
+    def test_session_close_is_new_york_time(self):
+        """Test that the close is 16:00 New York plus the buffer, across DST."""
+        winter = session_close(date(2024, 1, 5)).astimezone(timezone.utc)
+        summer = session_close(date(2024, 7, 5)).astimezone(timezone.utc)
+        assert (winter.hour, summer.hour) == (21, 20)
+
+    @pytest.mark.parametrize('now, expected', [
+        (datetime(2024, 3, 12, 15, 0, tzinfo=timezone.utc), date(2024, 3, 11)),  # before close
+        (datetime(2024, 3, 12, 21, 0, tzinfo=timezone.utc), date(2024, 3, 12)),  # after close
+        (datetime(2024, 3, 10, 12, 0, tzinfo=timezone.utc), date(2024, 3, 8)),   # Sunday
+        (datetime(2024, 3, 29, 22, 0, tzinfo=timezone.utc), date(2024, 3, 28)),  # Good Friday
+    ])
+    def test_last_completed_session(self, now, expected):
+        """Test which session's bar is final at a given moment."""
+        assert last_completed_session(now) == expected
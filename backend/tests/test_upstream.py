@@ -0,0 +1,262 @@
+import pytest
+import threading
+import time
+import requests
+from unittest.mock import patch, MagicMock
+
+import sys
+sys.path.insert(0, '..')
+
+import metrics
+import upstream
+from upstream import TokenBucket, CircuitBreaker, UpstreamUnavailable
+
+
+def make_response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    """Skip real backoff sleeps and start each test with empty metrics."""
+    metrics.reset()
+    with patch('upstream.time.sleep') as mock_sleep:
+        yield mock_sleep
+
+
+class TestTokenBucket:
+    """Test the TokenBucket limiter."""
+
+    def test_burst_is_immediate(self):
+        """Test that up to capacity requests don't wait."""
+        bucket = TokenBucket(rate=1, capacity=3, concurrency=10)
+        waits = []
+        for _ in range(3):
+            waits.append(bucket.acquire())
+            bucket.release()
+        assert max(waits) < 0.05
+
+    def test_waits_when_empty(self, no_sleep):
+        """Test that exceeding the burst sleeps for the refill time."""
+        bucket = TokenBucket(rate=10, capacity=1, concurrency=10)
+        bucket.acquire()
+        bucket.release()
+        bucket.acquire()
+        bucket.release()
+
+        delay = no_sleep.call_args[0][0]
+        assert 0.05 < delay <= 0.1
+
+    def test_unlimited_rate(self, no_sleep):
+        """Test that a zero rate never sleeps."""
+        bucket = TokenBucket(rate=0, capacity=1, concurrency=10)
+        for _ in range(5):
+            bucket.acquire()
+            bucket.release()
+        assert not no_sleep.called
+
+    def test_caps_concurrency(self):
+        """Test that only `concurrency` holders run at once."""
+        bucket = TokenBucket(rate=0, capacity=1, concurrency=1)
+        bucket.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            bucket.acquire()
+            acquired.set()
+            bucket.release()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        assert not acquired.wait(0.05)
+        bucket.release()
+        assert acquired.wait(1)
+        thread.join()
+
+
+class TestCircuitBreaker:
+    """Test the CircuitBreaker."""
+
+    def test_opens_after_threshold(self):
+        """Test that consecutive failures open the breaker."""
+        breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.state == 'open'
+        with pytest.raises(UpstreamUnavailable):
+            breaker.allow()
+
+    def test_success_resets_failures(self):
+        """Test that a success clears the failure count."""
+        breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == 'closed'
+
+    def test_half_open_allows_single_probe(self):
+        """Test that after the reset period exactly one probe goes through."""
+        breaker = CircuitBreaker(threshold=1, reset_seconds=0)
+        breaker.record_failure()
+
+        assert breaker.state == 'half_open'
+        breaker.allow()
+        with pytest.raises(UpstreamUnavailable):
+            breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == 'closed'
+
+
+class TestGet:
+    """Test the retrying get function."""
+
+    @patch('upstream.requests.Session.get')
+    def test_returns_successful_response(self, mock_get):
+        """Test that a 200 is returned with a timeout applied."""
+        mock_get.return_value = make_response(200)
+
+        response = upstream.get('http://example.test/x', params={'a': 1})
+
+        assert response.status_code == 200
+        assert mock_get.call_args[1]['timeout'] is not None
+
+    @patch('upstream.requests.Session.get')
+    def test_retries_429_then_succeeds(self, mock_get, no_sleep):
+        """Test that throttled responses are retried with backoff."""
+        mock_get.side_effect = [make_response(429), make_response(503), make_response(200)]
+
+        response = upstream.get('http://example.test/x')
+
+        assert response.status_code == 200
+        assert mock_get.call_count == 3
+        assert no_sleep.call_count == 2
+        counters = metrics.snapshot()['counters']
+        assert counters['upstream_throttled'] == 1
+        assert counters['upstream_retries'] == 2
+
+    @patch('upstream.requests.Session.get')
+    def test_honours_retry_after(self, mock_get, no_sleep):
+        """Test that Retry-After sets a lower bound on the backoff."""
+        mock_get.side_effect = [make_response(429, {'Retry-After': '7'}), make_response(200)]
+
+        upstream.get('http://example.test/x')
+
+        assert no_sleep.call_args[0][0] >= 7
+
+    @patch('upstream.requests.Session.get')
+    def test_does_not_retry_client_errors(self, mock_get):
+        """Test that a 404 is returned to the caller without retrying."""
+        mock_get.return_value = make_response(404)
+
+        response = upstream.get('http://example.test/x')
+
+        assert response.status_code == 404
+        assert mock_get.call_count == 1
+
+    @patch('upstream.requests.Session.get')
+    def test_retries_connection_errors_then_raises(self, mock_get):
+        """Test that exhausted retries raise UpstreamUnavailable."""
+        mock_get.side_effect = requests.ConnectionError("refused")
+
+        with patch('upstream.UPSTREAM_MAX_RETRIES', 2), \
+                patch('upstream.breaker', CircuitBreaker(100, 30)):
+            with pytest.raises(UpstreamUnavailable, match="refused"):
+                upstream.get('http://example.test/x')
+
+        assert mock_get.call_count == 3
+
+    @patch('upstream.requests.Session.get')
+    def test_failed_probe_reopens_breaker(self, mock_get, no_sleep):
+        """Test that any transport error on the half-open probe is recorded."""
+        mock_get.side_effect = [requests.exceptions.ChunkedEncodingError("truncated"), make_response(200)]
+        breaker = CircuitBreaker(1, 0)
+        breaker.record_failure()
+
+        with patch('upstream.UPSTREAM_MAX_RETRIES', 1), patch('upstream.breaker', breaker):
+            response = upstream.get('http://example.test/x')
+
+        assert response.status_code == 200
+        assert breaker.state == 'closed'
+
+    @patch('upstream.requests.Session.get')
+    def test_open_breaker_fails_fast(self, mock_get):
+        """Test that an open breaker short-circuits further requests."""
+        mock_get.return_value = make_response(500)
+
+        with patch('upstream.breaker', CircuitBreaker(2, 60)):
+            with pytest.raises(UpstreamUnavailable):
+                upstream.get('http://example.test/x')
+
+        assert mock_get.call_count == 2
+
+    @patch('upstream.requests.Session.get')
+    def test_records_limiter_wait(self, mock_get):
+        """Test that limiter wait time is reported in metrics."""
+        mock_get.return_value = make_response(200)
+
+        upstream.get('http://example.test/x')
+
+        timing = metrics.snapshot()['timings']['upstream_limiter_wait']
+        assert timing['count'] == 1
+
+
+class TestSession:
+    """Test the shared pooled session."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_session(self):
+        upstream.close_session()
+        yield
+        upstream.close_session()
+
+    def test_session_is_shared(self):
+        """Test that every caller, on any thread, gets the same session."""
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(upstream.get_session())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len({id(s) for s in seen}) == 1
+        assert seen[0] is upstream.get_session()
+
+    def test_pool_size_is_configured(self):
+        """Test that the adapter pools UPSTREAM_POOL_SIZE connections."""
+        with patch('upstream.UPSTREAM_POOL_SIZE', 3):
+            adapter = upstream.get_session().get_adapter('https://query1.finance.yahoo.com')
+
+        assert adapter._pool_maxsize == 3
+        assert adapter.max_retries.total == 0
+
+    def test_compression_negotiated_by_default(self):
+        """Test that gzip responses are requested unless disabled."""
+        assert 'gzip' in upstream.get_session().headers['Accept-Encoding']
+
+    def test_compression_can_be_disabled(self):
+        """Test that UPSTREAM_COMPRESSION=0 asks for identity encoding."""
+        with patch('upstream.UPSTREAM_COMPRESSION', False):
+            assert upstream.get_session().headers['Accept-Encoding'] == 'identity'
+
+    def test_close_session_recreates(self):
+        """Test that closing the session makes the next call build a new one."""
+        first = upstream.get_session()
+        upstream.close_session()
+
+        assert upstream.get_session() is not first
+
+    @patch('upstream.requests.Session.get')
+    def test_get_uses_session(self, mock_get):
+        """Test that get goes through the pooled session."""
+        mock_get.return_value = make_response(200)
+
+        upstream.get('http://example.test/x')
+
+        assert mock_get.call_count == 1
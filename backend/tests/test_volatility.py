@@ -139,6 +139,34 @@ class TestCalculateVolatility:
             assert 'date' in entry
             assert 'vol_30d' in entry
             assert 'vol_90d' in entry
+            assert 'vol_30d_percentile' in entry
+            assert 'vol_90d_percentile' in entry
+
+    @patch('volatility.fetch_and_cache')
+    def test_history_ranks_end_at_current_percentile(self, mock_fetch):
+        """Test that the latest expanding rank equals the current percentile."""
+        mock_fetch.return_value = create_mock_df(days=600)
+
+        result = calculate_volatility('SPY')
+
+        assert result['history'][-1]['vol_30d_percentile'] == result['vol_30d_percentile']
+        assert result['history'][-1]['vol_90d_percentile'] == result['vol_90d_percentile']
+
+    @patch('volatility.fetch_and_cache')
+    def test_trailing_rank_window(self, mock_fetch):
+        """Test that a trailing window ranks only against recent vols."""
+        import compute
+        df = create_mock_df(days=900)
+        mock_fetch.return_value = df
+
+        result = calculate_volatility('SPY', 5, rank_window_years=1)
+
+        log_return = compute.log_returns(df['adj_close'].to_numpy())
+        vol_30d = compute.annualized_vol(log_return, 30)
+        vol_90d = compute.annualized_vol(log_return, 90)
+        vol_30d = vol_30d[~(np.isnan(vol_30d) | np.isnan(vol_90d))]
+        expected = compute.percentile_of(vol_30d[-252:], vol_30d[-1])
+        assert result['history'][-1]['vol_30d_percentile'] == round(expected, 1)
 
     @patch('volatility.fetch_and_cache')
     def test_history_max_length(self, mock_fetch):
@@ -215,6 +243,143 @@ class TestCalculateVolatility:
         assert result['vol_30d_bucket'] in ['<p50', 'p50-p90', 'p90-p99', '>p99']
 
 
+    @patch('volatility.fetch_and_cache')
+    def test_does_not_mutate_fetched_frame(self, mock_fetch):
+        """Test that the cached DataFrame is left untouched."""
+        df = create_mock_df()
+        mock_fetch.return_value = df
+
+        calculate_volatility('SPY')
+
+        assert list(df.columns) == ['open', 'high', 'low', 'close', 'adj_close', 'volume']
+
+    @patch('volatility.fetch_and_cache')
+    def test_reports_staleness(self, mock_fetch):
+        """Test that stale-served data is flagged with its as-of date."""
+        df = create_mock_df()
+        df.attrs['stale'] = True
+        mock_fetch.return_value = df
+
+        result = calculate_volatility('SPY')
+
+        assert result['stale'] is True
+        assert result['data_as_of'] == df.index[-1].strftime('%Y-%m-%d')
+
+    @patch('volatility.fetch_and_cache')
+    def test_fresh_data_is_not_stale(self, mock_fetch):
+        """Test that freshly fetched data is not flagged as stale."""
+        mock_fetch.return_value = create_mock_df()
+
+        result = calculate_volatility('SPY')
+
+        assert result['stale'] is False
+
+
+class TestFieldSelection:
+    """Test computing only selected parts of the payload."""
+
+    def test_resolves_groups_and_keys(self):
+        """Test that group names expand and single keys pass through."""
+        from volatility import resolve_fields
+
+        assert resolve_fields(['rsi', ' vol_30d']) == {'rsi_14d', 'vol_30d'}
+        with pytest.raises(ValueError, match="Unknown field"):
+            resolve_fields(['vol_30d', 'sharpe'])
+        with pytest.raises(ValueError, match="At least one field"):
+            resolve_fields([''])
+
+    @patch('volatility.fetch_and_cache')
+    def test_selected_values_match_full_payload(self, mock_fetch):
+        """Test that a sparse payload holds exactly the selected full-payload values."""
+        from volatility import resolve_fields
+        mock_fetch.return_value = create_mock_df()
+
+        full = calculate_volatility('SPY')
+        sparse = calculate_volatility('SPY', fields=resolve_fields(['vol', 'percentiles']))
+
+        keys = ['ticker', 'vol_30d', 'vol_90d', 'vol_30d_percentile', 'vol_90d_percentile',
+                'vol_30d_bucket', 'vol_90d_bucket', 'percentile_thresholds', 'stale', 'data_as_of']
+        assert list(sparse) == keys
+        assert sparse == {key: full[key] for key in keys}
+
+    @patch('volatility.compute.wilder_rsi')
+    @patch('volatility.compute.period_returns')
+    @patch('volatility.compute.rolling_percentile_rank')
+    @patch('volatility.compute.thresholds')
+    @patch('volatility.fetch_and_cache')
+    def test_unselected_metrics_are_not_computed(self, mock_fetch, mock_thresholds, mock_rank,
+                                                 mock_returns, mock_rsi):
+        """Test that thresholds, ranks, returns and RSI are skipped when not selected."""
+        from volatility import resolve_fields
+        mock_fetch.return_value = create_mock_df()
+
+        result = calculate_volatility('SPY', fields=resolve_fields(['vol_30d', 'current_price']))
+
+        assert set(result) == {'ticker', 'vol_30d', 'current_price', 'stale', 'data_as_of'}
+        for mock in (mock_thresholds, mock_rank, mock_returns, mock_rsi):
+            assert not mock.called
+
+
+class TestBeta:
+    """Test beta and correlation against the benchmark."""
+
+    @patch('volatility.fetch_and_cache')
+    def test_payload_against_other_ticker(self, mock_fetch):
+        """Test that beta keys are filled from the benchmark's bars."""
+        ticker_df, market_df = create_mock_df(), create_mock_df()
+        market_df['adj_close'] = market_df['adj_close'] * np.exp(np.random.default_rng(3).normal(0, 0.01, 300))
+        mock_fetch.side_effect = lambda ticker, years: market_df if ticker == 'SPY' else ticker_df
+
+        result = calculate_volatility('AAPL')
+
+        assert result['benchmark'] == 'SPY'
+        for key in ('beta_30d', 'beta_90d', 'correlation_30d', 'correlation_90d'):
+            assert isinstance(result[key], float)
+            assert result['history'][-1][key] == result[key]
+        assert -1 <= result['correlation_90d'] <= 1
+
+    @patch('volatility.fetch_and_cache')
+    def test_benchmark_against_itself(self, mock_fetch):
+        """Test that the benchmark has beta 1 and is fetched only once."""
+        from volatility import resolve_fields
+        mock_fetch.return_value = create_mock_df()
+
+        result = calculate_volatility('SPY', fields=resolve_fields(['beta']))
+
+        assert result['beta_30d'] == result['correlation_90d'] == 1.0
+        assert mock_fetch.call_count == 1
+
+    @patch('volatility.fetch_and_cache')
+    def test_benchmark_failure_leaves_beta_empty(self, mock_fetch):
+        """Test that a benchmark that can't be loaded doesn't fail the ticker."""
+        import metrics
+        ticker_df = create_mock_df()
+
+        def fetch(ticker, years):
+            if ticker == 'SPY':
+                raise ValueError("No data found for ticker: SPY")
+            return ticker_df
+        mock_fetch.side_effect = fetch
+        metrics.reset()
+
+        result = calculate_volatility('AAPL')
+
+        assert result['benchmark'] is None and result['beta_30d'] is None
+        assert result['history'][-1]['correlation_90d'] is None
+        assert result['vol_30d'] is not None
+        assert metrics.snapshot()['counters']['benchmark_errors'] == 1
+
+    @patch('volatility.fetch_and_cache')
+    def test_not_loaded_unless_selected(self, mock_fetch):
+        """Test that the benchmark is skipped when no beta keys or history are requested."""
+        from volatility import resolve_fields
+        mock_fetch.return_value = create_mock_df()
+
+        calculate_volatility('AAPL', fields=resolve_fields(['vol']))
+
+        mock_fetch.assert_called_once_with('AAPL', years=5)
+
+
 class TestTradingDaysConstant:
     """Test the TRADING_DAYS_PER_YEAR constant."""
 
@@ -471,3 +636,168 @@ class TestCalculateRsi:
         assert 'rsi_14d' in result
         assert result['rsi_14d'] is not None
         assert 0 <= result['rsi_14d'] <= 100
+
+
+def seed_cache(ticker, days=900, end='2024-06-28'):
+    """Store a deterministic business-day series in the test cache."""
+    from cache import save_to_cache
+    dates = pd.bdate_range(end=end, periods=days)
+    rng = np.random.default_rng(11)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    df = pd.DataFrame({
+        'open': prices,
+        'high': prices * 1.01,
+        'low': prices * 0.99,
+        'close': prices,
+        'adj_close': prices,
+        'volume': [1000000] * days,
+    }, index=dates)
+    save_to_cache(ticker, df)
+    return df
+
+
+class TestCalculateVolatilityAsOf:
+    """Test point-in-time volatility served from the cache."""
+
+    @patch('cache.fetch_from_yahoo')
+    def test_never_fetches_upstream(self, mock_fetch):
+        """Test that as-of queries only read the cache."""
+        from volatility import calculate_volatility_as_of
+        seed_cache('ASOF_NOFETCH')
+
+        result = calculate_volatility_as_of('ASOF_NOFETCH', datetime(2024, 3, 1).date(), 2)
+
+        assert not mock_fetch.called
+        assert result['as_of'] == '2024-03-01'
+        assert result['history'][-1]['date'] == '2024-03-01'
+
+    @pytest.mark.parametrize('lookback_years, rank_window_years', [(1, None), (3, 1)])
+    def test_matches_live_calculation_on_same_window(self, lookback_years, rank_window_years):
+        """Test that as-of output equals calculate_volatility on the sliced series."""
+        from volatility import calculate_volatility_as_of
+        df = seed_cache('ASOF_MATCH')
+        as_of = datetime(2024, 2, 15).date()
+        window = df[(df.index >= pd.Timestamp(as_of) - pd.Timedelta(days=365 * lookback_years)) &
+                    (df.index <= pd.Timestamp(as_of))]
+
+        # Measured against itself so both paths have the benchmark's bars
+        with patch('volatility.fetch_and_cache', return_value=window), \
+                patch('volatility.datetime') as mock_dt, \
+                patch('beta.BENCHMARK_TICKER', 'ASOF_MATCH'):
+            mock_dt.now.return_value = datetime(2024, 2, 15)
+            expected = calculate_volatility('ASOF_MATCH', lookback_years, rank_window_years)
+        # Freshness fields only apply to live requests
+        expected.pop('stale')
+        expected.pop('data_as_of')
+
+        with patch('beta.BENCHMARK_TICKER', 'ASOF_MATCH'):
+            result = calculate_volatility_as_of('ASOF_MATCH', as_of, lookback_years, rank_window_years)
+        result.pop('as_of')
+
+        assert result == expected
+
+    def test_ytd_uses_as_of_year(self):
+        """Test that YTD is measured within the as-of year."""
+        from volatility import calculate_volatility_as_of
+        df = seed_cache('ASOF_YTD')
+
+        result = calculate_volatility_as_of('ASOF_YTD', datetime(2023, 12, 29).date(), 2)
+
+        year = df[df.index.year == 2023]['adj_close']
+        expected = (year.iloc[-1] - year.iloc[0]) / year.iloc[0]
+        assert abs(result['returns']['ytd'] - expected) < 1e-6
+
+    def test_missing_ticker_raises(self):
+        """Test that a ticker with no cached rows raises ValueError."""
+        from volatility import calculate_volatility_as_of
+
+        with pytest.raises(ValueError, match="No cached data"):
+            calculate_volatility_as_of('ASOF_NEVER_CACHED', datetime(2024, 1, 2).date())
+
+    def test_calculate_returns_as_of(self):
+        """Test that calculate_returns accepts an as-of date for YTD."""
+        dates = pd.date_range(start='2021-01-04', periods=10, freq='D')
+        df = pd.DataFrame({'adj_close': [100 + i for i in range(10)]}, index=dates)
+
+        assert calculate_returns(df, as_of=datetime(2021, 1, 13).date())['ytd'] == 0.09
+        assert calculate_returns(df)['ytd'] is None
+
+
+class TestCalculateVolatilityAsOfMany:
+    """Test the vectorized multi-date as-of mode."""
+
+    def test_matches_single_date_results(self):
+        """Test that each batch entry equals the single-date computation."""
+        from volatility import calculate_volatility_as_of, calculate_volatility_as_of_many
+        seed_cache('ASOF_MANY')
+        as_of_dates = [datetime(2023, m, 15).date() for m in (3, 6, 9, 12)]
+
+        batch = calculate_volatility_as_of_many('ASOF_MANY', as_of_dates, 2, include_history=True)
+
+        assert [r['as_of'] for r in batch] == [d.isoformat() for d in as_of_dates]
+        for as_of, result in zip(as_of_dates, batch):
+            assert result == calculate_volatility_as_of('ASOF_MANY', as_of, 2)
+
+    def test_single_pass_over_dates(self):
+        """Test that the batch builds no per-date payloads and keeps the payload key order."""
+        import volatility
+        seed_cache('ASOF_PASS')
+        as_of_dates = [datetime(2024, 1, 2).date() + timedelta(days=7 * i) for i in range(20)]
+
+        with patch('volatility._volatility_from_arrays') as per_date:
+            batch = volatility.calculate_volatility_as_of_many('ASOF_PASS', as_of_dates, 1)
+
+        assert not per_date.called
+        single = volatility.calculate_volatility_as_of('ASOF_PASS', as_of_dates[-1], 1)
+        single.pop('history')
+        assert list(batch[-1]) == list(single)
+
+    def test_beta_matches_single_date_results(self):
+        """Test that batch betas equal the single-date ones against a cached benchmark."""
+        from cache import save_to_cache
+        from volatility import calculate_volatility_as_of, calculate_volatility_as_of_many
+        df = seed_cache('ASOF_BETA')
+        market = df.drop(df.index[400]).copy()
+        market['adj_close'] *= np.exp(np.random.default_rng(5).normal(0, 0.01, len(market)))
+        save_to_cache('ASOF_INDEX', market)
+        as_of_dates = [datetime(2023, m, 15).date() for m in (3, 6, 9, 12)]
+
+        with patch('beta.BENCHMARK_TICKER', 'ASOF_INDEX'):
+            batch = calculate_volatility_as_of_many('ASOF_BETA', as_of_dates, 1, include_history=True)
+            singles = [calculate_volatility_as_of('ASOF_BETA', as_of, 1) for as_of in as_of_dates]
+
+        assert batch[0]['benchmark'] == 'ASOF_INDEX'
+        assert all(result['beta_90d'] is not None for result in batch)
+        assert batch == singles
+
+    def test_reads_cache_once(self):
+        """Test that the whole batch is served by a single cache read per ticker."""
+        import beta
+        import volatility
+        seed_cache('ASOF_ONCE')
+        as_of_dates = [datetime(2024, 1, d).date() for d in (2, 3, 4, 5)]
+
+        with patch('volatility.get_cached_data', wraps=volatility.get_cached_data) as spy:
+            volatility.calculate_volatility_as_of_many('ASOF_ONCE', as_of_dates, 1)
+
+        assert [call.args[0] for call in spy.call_args_list] == ['ASOF_ONCE', beta.BENCHMARK_TICKER]
+
+    def test_insufficient_history_is_reported_per_date(self):
+        """Test that dates before enough history carry an error entry."""
+        from volatility import calculate_volatility_as_of_many
+        df = seed_cache('ASOF_EARLY')
+        first = df.index[0].date()
+
+        batch = calculate_volatility_as_of_many(
+            'ASOF_EARLY', [first + timedelta(days=10), datetime(2024, 6, 3).date()], 1
+        )
+
+        assert 'error' in batch[0]
+        assert 'vol_30d' in batch[1]
+        assert 'history' not in batch[1]
+
+    def test_empty_dates(self):
+        """Test that no dates gives no results."""
+        from volatility import calculate_volatility_as_of_many
+
+        assert calculate_volatility_as_of_many('ANY', []) == []
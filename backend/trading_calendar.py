@@ -0,0 +1,109 @@
+"""NYSE trading calendar used to decide when a new daily bar can exist.
+
+Holidays are generated from the exchange's rules (weekend observance,
+Good Friday, Juneteenth from 2022) plus a short list of one-off closures,
+so no data files or third-party calendars are needed. Early-close days
+are treated as full sessions, which only delays a refetch by a few hours.
+
+    MARKET_CLOSE_BUFFER_MINUTES  minutes after the close before a bar is
+                                 treated as final (default 20)
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import FrozenSet, Optional
+from zoneinfo import ZoneInfo
+
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+SESSION_CLOSE = time(16, 0)
+MARKET_CLOSE_BUFFER_MINUTES = int(os.environ.get("MARKET_CLOSE_BUFFER_MINUTES", "20"))
+
+# Unscheduled full-day closures
+SPECIAL_CLOSURES = frozenset({
+    date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+    date(2018, 12, 5),                       # President George H. W. Bush
+    date(2025, 1, 9),                        # President Jimmy Carter
+})
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_weekday(year: int, month: int, weekday: int) -> date:
+    last = date(year, month + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    # Anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    j = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * j) // 451
+    month, day = divmod(h + j - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def holidays(year: int) -> FrozenSet[date]:
+    """Full-day NYSE closures in ``year``."""
+    days = {
+        _nth_weekday(year, 1, 0, 3),       # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),       # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _last_weekday(year, 5, 0),         # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),       # Labor Day
+        _nth_weekday(year, 11, 3, 4),      # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    # New Year's Day falling on a Saturday is not observed on the prior Friday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))
+    days.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(days)
+
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def previous_trading_day(day: date) -> date:
+    """The last trading day strictly before ``day``."""
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def session_close(day: date) -> datetime:
+    """When ``day``'s bar is final: the close plus the settle buffer, tz-aware."""
+    close = datetime.combine(day, SESSION_CLOSE, tzinfo=EXCHANGE_TZ)
+    return close + timedelta(minutes=MARKET_CLOSE_BUFFER_MINUTES)
+
+
+def last_completed_session(now: Optional[datetime] = None) -> date:
+    """The most recent trading day whose bar is final as of ``now``."""
+    now = (now or datetime.now(timezone.utc)).astimezone(EXCHANGE_TZ)
+    today = now.date()
+    if is_trading_day(today) and now >= session_close(today):
+        return today
+    return previous_trading_day(today)
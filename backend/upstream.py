@@ -0,0 +1,235 @@
+"""Rate-limited, retrying HTTP access to the upstream price provider.
+
+All Yahoo requests go through ``get``, which shares one token-bucket
+limiter (rate plus a cap on in-flight requests) and one circuit breaker
+across threads. Connection errors, timeouts, HTTP 429 and 5xx responses
+are retried with jittered exponential backoff (honouring ``Retry-After``);
+other responses are returned to the caller as-is. When retries are
+exhausted or the breaker is open, ``UpstreamUnavailable`` is raised.
+
+Settings come from the environment:
+
+    UPSTREAM_RATE_PER_SEC      sustained requests per second (0 = unlimited)
+    UPSTREAM_BURST             bucket capacity
+    UPSTREAM_MAX_CONCURRENCY   max requests in flight
+    UPSTREAM_TIMEOUT           per-attempt read timeout in seconds
+    UPSTREAM_MAX_RETRIES       retries after the first attempt
+    UPSTREAM_BREAKER_THRESHOLD consecutive failures that open the breaker
+    UPSTREAM_BREAKER_RESET     seconds before a half-open trial request
+    UPSTREAM_POOL_SIZE         keep-alive connections kept per host
+    UPSTREAM_COMPRESSION       negotiate gzip/deflate responses (1/0)
+
+Requests share one pooled ``requests.Session`` so repeated fetches reuse
+keep-alive connections instead of paying a TCP and TLS handshake each.
+"""
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+
+import metrics
+
+UPSTREAM_RATE_PER_SEC = float(os.environ.get("UPSTREAM_RATE_PER_SEC", "2"))
+UPSTREAM_BURST = int(os.environ.get("UPSTREAM_BURST", "5"))
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "4"))
+UPSTREAM_CONNECT_TIMEOUT = 3.05
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = 0.5
+UPSTREAM_BACKOFF_MAX = 30.0
+UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_RESET = float(os.environ.get("UPSTREAM_BREAKER_RESET", "30"))
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "10"))
+UPSTREAM_COMPRESSION = os.environ.get("UPSTREAM_COMPRESSION", "1") != "0"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream provider is throttling, failing or the breaker is open."""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter with a cap on concurrent holders.
+
+    ``acquire`` reserves a token (sleeping until it is due) and a
+    concurrency slot; ``release`` frees the slot. Reservations are handed
+    out in arrival order, so waiting threads don't stampede on refill.
+    """
+
+    def __init__(self, rate: float, capacity: int, concurrency: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(concurrency, 1))
+
+    def _reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; return the seconds waited."""
+        started = time.monotonic()
+        self._slots.acquire()
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+        return time.monotonic() - started
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> None:
+        """Raise ``UpstreamUnavailable`` unless a request may be attempted."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return
+        metrics.increment('upstream_breaker_rejections')
+        raise UpstreamUnavailable("Upstream data provider is unavailable; try again later")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        metrics.set_gauge('upstream_breaker_state', 'closed')
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+            state = self._state()
+        metrics.set_gauge('upstream_breaker_state', state)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are handled by ``get``; the adapter only pools.
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=UPSTREAM_POOL_SIZE,
+                    pool_maxsize=UPSTREAM_POOL_SIZE,
+                    max_retries=0,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                if not UPSTREAM_COMPRESSION:
+                    session.headers['Accept-Encoding'] = 'identity'
+                _session = session
+    return _session
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+limiter = TokenBucket(UPSTREAM_RATE_PER_SEC, UPSTREAM_BURST, UPSTREAM_MAX_CONCURRENCY)
+breaker = CircuitBreaker(UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than ``Retry-After``."""
+    delay = random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), UPSTREAM_BACKOFF_MAX))
+        except ValueError:
+            pass
+    return delay
+
+
+def get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> requests.Response:
+    """GET ``url`` through the shared limiter, retry policy and breaker."""
+    last_error = None
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        breaker.allow()
+        waited = limiter.acquire()
+        metrics.observe('upstream_limiter_wait', waited)
+        started = time.monotonic()
+        try:
+            metrics.increment('upstream_requests')
+            response = get_session().get(
+                url, params=params, headers=headers,
+                timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_TIMEOUT),
+            )
+        except requests.RequestException as e:
+            # Any transport failure, so a half-open probe always resolves
+            response = None
+            last_error = str(e)
+        finally:
+            limiter.release()
+            metrics.observe('upstream_request', time.monotonic() - started)
+
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            breaker.record_success()
+            return response
+
+        breaker.record_failure()
+        retry_after = None
+        if response is not None:
+            last_error = f"HTTP {response.status_code}"
+            retry_after = response.headers.get('Retry-After')
+            metrics.increment('upstream_throttled' if response.status_code == 429 else 'upstream_server_errors')
+        else:
+            metrics.increment('upstream_connection_errors')
+
+        if attempt < UPSTREAM_MAX_RETRIES:
+            metrics.increment('upstream_retries')
+            delay = backoff_delay(attempt, retry_after)
+            metrics.observe('upstream_backoff', delay)
+            time.sleep(delay)
+
+    raise UpstreamUnavailable(f"Upstream request failed after {UPSTREAM_MAX_RETRIES + 1} attempts: {last_error}")
@@ -1,182 +1,479 @@
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional
-from datetime import datetime
-from cache import fetch_and_cache
-
-TRADING_DAYS_PER_YEAR = 252
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+from datetime import date, datetime, timedelta
+from cache import fetch_and_cache, get_cached_data
+import beta
+import compute
+import metrics
+from compute import ANNUALIZATION, TRADING_DAYS_PER_YEAR
 
 
 def calculate_rsi(df: pd.DataFrame, period: int = 14) -> Optional[float]:
     """Calculate the Relative Strength Index using Wilder smoothing."""
-    if len(df) < period + 1:
-        return None
-
-    close = df['adj_close']
-    delta = close.diff()
-
-    gain = delta.where(delta > 0, 0.0)
-    loss = (-delta).where(delta < 0, 0.0)
-
-    avg_gain = gain.iloc[1:period + 1].mean()
-    avg_loss = loss.iloc[1:period + 1].mean()
-
-    for i in range(period + 1, len(delta)):
-        avg_gain = (avg_gain * (period - 1) + gain.iloc[i]) / period
-        avg_loss = (avg_loss * (period - 1) + loss.iloc[i]) / period
-
-    if avg_loss == 0:
-        return 100.0
-
-    rs = avg_gain / avg_loss
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-
-    return round(rsi, 2)
-
-
-def calculate_returns(df: pd.DataFrame) -> Dict[str, float]:
-    """Calculate returns for various time periods."""
-    if len(df) < 2:
-        return {
-            "daily": None,
-            "week": None,
-            "month": None,
-            "ytd": None
-        }
+    rsi = compute.wilder_rsi(compute.as_float_array(df['adj_close']), period)
+    return round(rsi, 2) if rsi is not None else None
+
+
+def _round_returns(returns: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    return {k: round(v, 6) if v is not None else None for k, v in returns.items()}
+
+
+def _rounded(values: np.ndarray, digits: int = 4) -> List[Optional[float]]:
+    # NaN isn't valid JSON
+    return [None if v != v else round(v, digits) for v in values.tolist()]
+
+
+def calculate_returns(df: pd.DataFrame, as_of: Optional[date] = None) -> Dict[str, float]:
+    """Calculate returns for various time periods.
+
+    YTD is measured within the year of ``as_of`` (default: today).
+    """
+    return _round_returns(compute.period_returns(
+        compute.as_float_array(df['adj_close']),
+        np.asarray(df.index.year),
+        (as_of or datetime.now()).year,
+    ))
+
+
+# Payload keys by group; ``fields`` may name either a group or single keys
+FIELD_GROUPS = {
+    "price": ("current_price", "daily_open", "daily_high", "daily_low"),
+    "ranges": ("monthly_high", "monthly_low", "yearly_high", "yearly_low"),
+    "vol": ("vol_30d", "vol_90d"),
+    "percentiles": ("vol_30d_percentile", "vol_90d_percentile", "vol_30d_bucket", "vol_90d_bucket",
+                    "percentile_thresholds"),
+    "returns": ("returns",),
+    "rsi": ("rsi_14d",),
+    "beta": ("benchmark", "beta_30d", "beta_90d", "correlation_30d", "correlation_90d"),
+    "history": ("history",),
+}
+# Keys that need the benchmark loaded
+BENCHMARK_FIELDS = frozenset(FIELD_GROUPS["beta"] + FIELD_GROUPS["history"])
+# Series name -> the window it's rolled over
+BETA_SERIES = {"beta_30d": 30, "beta_90d": 90, "correlation_30d": 30, "correlation_90d": 90}
+
+
+def resolve_fields(names: Iterable[str]) -> FrozenSet[str]:
+    """Payload keys selected by a list of group names and keys."""
+    keys = set()
+    for name in (n.strip() for n in names):
+        if name in FIELD_GROUPS:
+            keys.update(FIELD_GROUPS[name])
+        elif any(name in group for group in FIELD_GROUPS.values()):
+            keys.add(name)
+        elif name:
+            raise ValueError(f"Unknown field: {name}")
+    if not keys:
+        raise ValueError("At least one field is required")
+    return frozenset(keys)
+
+
+def _wants_benchmark(fields: Optional[FrozenSet[str]]) -> bool:
+    return fields is None or bool(fields & BENCHMARK_FIELDS)
+
+
+def _beta_series(market: beta.Benchmark, dates: np.ndarray, log_return: np.ndarray,
+                 vol_30d: np.ndarray, vol_90d: np.ndarray) -> Dict[str, np.ndarray]:
+    stds = {30: vol_30d / ANNUALIZATION, 90: vol_90d / ANNUALIZATION}
+    series = {}
+    for window, (slope, correlation) in beta.rolling_beta(market, dates, log_return, stds).items():
+        series[f"beta_{window}d"] = slope
+        series[f"correlation_{window}d"] = correlation
+    return series
+
+
+def _volatility_from_arrays(
+    ticker: str,
+    dates: np.ndarray,
+    open_: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    adj_close: np.ndarray,
+    current_year: int,
+    vol_30d: Optional[np.ndarray] = None,
+    vol_90d: Optional[np.ndarray] = None,
+    include_history: bool = True,
+    rank_window: Optional[int] = None,
+    fields: Optional[FrozenSet[str]] = None,
+    market: Optional[beta.Benchmark] = None,
+    betas: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, Any]:
+    """Build the volatility payload from aligned float64 price arrays.
+
+    Rolling vols may be passed in when they were computed over a longer
+    series; positions that should not count must already be NaN. History
+    entries carry each day's vol percentile rank over the trailing
+    ``rank_window`` days (the whole lookback when None).
+
+    Beta and correlation are measured against ``market``; ``betas`` may be
+    passed in on the same terms as the vols. Without a benchmark those
+    keys are None.
+
+    Only the keys in ``fields`` (everything when None) are computed. The
+    rolling vols always are, since they decide which bars the payload
+    covers; thresholds, ranks, returns and RSI only run when selected.
+    """
+    log_return = None
+    if vol_30d is None or vol_90d is None:
+        log_return = compute.log_returns(adj_close)
+        vol_30d = compute.annualized_vol(log_return, 30)
+        vol_90d = compute.annualized_vol(log_return, 90)
+
+    valid = ~(np.isnan(vol_30d) | np.isnan(vol_90d))
+    if not valid.any():
+        raise ValueError(f"Not enough data to calculate volatility for {ticker}")
 
-    current_price = df['adj_close'].iloc[-1]
-
-    # Daily return (1 day)
-    daily_return = None
-    if len(df) >= 2:
-        prev_price = df['adj_close'].iloc[-2]
-        daily_return = (current_price - prev_price) / prev_price
-
-    # Weekly return (5 trading days)
-    week_return = None
-    if len(df) >= 6:
-        week_ago_price = df['adj_close'].iloc[-6]
-        week_return = (current_price - week_ago_price) / week_ago_price
-
-    # Monthly return (~21 trading days)
-    month_return = None
-    if len(df) >= 22:
-        month_ago_price = df['adj_close'].iloc[-22]
-        month_return = (current_price - month_ago_price) / month_ago_price
-
-    # YTD return (from first trading day of current year)
-    ytd_return = None
-    current_year = datetime.now().year
-    ytd_df = df[df.index.year == current_year]
-    if len(ytd_df) >= 1:
-        year_start_price = ytd_df['adj_close'].iloc[0]
-        ytd_return = (current_price - year_start_price) / year_start_price
-
-    return {
-        "daily": round(daily_return, 6) if daily_return is not None else None,
-        "week": round(week_return, 6) if week_return is not None else None,
-        "month": round(month_return, 6) if month_return is not None else None,
-        "ytd": round(ytd_return, 6) if ytd_return is not None else None
+    if market is not None and betas is None:
+        if log_return is None:
+            log_return = compute.log_returns(adj_close)
+        betas = _beta_series(market, dates, log_return, vol_30d, vol_90d)
+    betas = betas or {name: np.full(len(dates), np.nan) for name in BETA_SERIES}
+
+    if not valid.all():
+        dates, open_, high, low, close, adj_close, vol_30d, vol_90d = (
+            a[valid] for a in (dates, open_, high, low, close, adj_close, vol_30d, vol_90d)
+        )
+        betas = {name: series[valid] for name, series in betas.items()}
+
+    vols = {"30d": vol_30d, "90d": vol_90d}
+    cutoffs: Dict[str, np.ndarray] = {}
+
+    def thresholds(window: str) -> np.ndarray:
+        # Shared by the buckets and percentile_thresholds
+        if window not in cutoffs:
+            cutoffs[window] = compute.thresholds(vols[window])
+        return cutoffs[window]
+
+    def returns() -> Dict[str, Optional[float]]:
+        years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        return _round_returns(compute.period_returns(adj_close, years, current_year))
+
+    def rsi() -> Optional[float]:
+        value = compute.wilder_rsi(adj_close)
+        return round(value, 2) if value is not None else None
+
+    # Evaluated in payload order, and only for selected keys
+    sections = {
+        "current_price": lambda: round(close[-1], 2),
+        "daily_open": lambda: round(open_[-1], 2),
+        "daily_high": lambda: round(high[-1], 2),
+        "daily_low": lambda: round(low[-1], 2),
+        "monthly_high": lambda: round(compute.range_high(high, 21), 2),
+        "monthly_low": lambda: round(compute.range_low(low, 21), 2),
+        "yearly_high": lambda: round(compute.range_high(high, 252), 2),
+        "yearly_low": lambda: round(compute.range_low(low, 252), 2),
+        "vol_30d": lambda: round(vol_30d[-1], 4),
+        "vol_90d": lambda: round(vol_90d[-1], 4),
+        "vol_30d_percentile": lambda: round(compute.percentile_of(vol_30d, vol_30d[-1]), 1),
+        "vol_90d_percentile": lambda: round(compute.percentile_of(vol_90d, vol_90d[-1]), 1),
+        "vol_30d_bucket": lambda: compute.bucket(vol_30d[-1], *thresholds("30d")),
+        "vol_90d_bucket": lambda: compute.bucket(vol_90d[-1], *thresholds("90d")),
+        "percentile_thresholds": lambda: {
+            window: {name: round(value, 4) for name, value in zip(("p50", "p90", "p99"), thresholds(window))}
+            for window in vols
+        },
+        "returns": returns,
+        "rsi_14d": rsi,
+        "benchmark": lambda: market.ticker if market is not None else None,
+        **{name: (lambda series=betas[name]: _rounded(series[-1:])[0]) for name in BETA_SERIES},
     }
+    result = {"ticker": ticker.upper()}
+    for key, build in sections.items():
+        if fields is None or key in fields:
+            result[key] = build()
+
+    if include_history and (fields is None or "history" in fields):
+        result["history"] = _history(dates, vol_30d, vol_90d, betas, rank_window)
+
+    return result
+
+
+def _history(dates: np.ndarray, vol_30d: np.ndarray, vol_90d: np.ndarray,
+             betas: Dict[str, np.ndarray], rank_window: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Daily entries for the last year of the already filtered series."""
+    start = max(len(dates) - 252, 0)
+    history_dates = np.datetime_as_string(dates[start:], unit='D').tolist()
+    rank_30d = compute.rolling_percentile_rank(vol_30d, rank_window, start)[start:]
+    rank_90d = compute.rolling_percentile_rank(vol_90d, rank_window, start)[start:]
+    beta_columns = {name: _rounded(betas[name][start:]) for name in BETA_SERIES}
+    return [
+        {
+            "date": d,
+            "vol_30d": round(v30, 4),
+            "vol_90d": round(v90, 4),
+            "vol_30d_percentile": round(r30, 1),
+            "vol_90d_percentile": round(r90, 1),
+            **dict(zip(BETA_SERIES, beta_values)),
+        }
+        for d, v30, v90, r30, r90, *beta_values in zip(
+            history_dates, vol_30d[start:].tolist(), vol_90d[start:].tolist(),
+            rank_30d.tolist(), rank_90d.tolist(), *beta_columns.values(),
+        )
+    ]
+
+
+def calculate_volatility(ticker: str, lookback_years: int = 5,
+                         rank_window_years: Optional[int] = None,
+                         fields: Optional[FrozenSet[str]] = None) -> Dict[str, Any]:
+    """Volatility payload for the latest ``lookback_years`` of daily bars.
+
+    History percentile ranks use a trailing ``rank_window_years`` window,
+    or everything since the start of the lookback when None. ``fields``
+    (from ``resolve_fields``) limits the payload to those keys.
+    """
+    df = fetch_and_cache(ticker, years=lookback_years)
+    market = _live_benchmark(ticker, df, lookback_years) if _wants_benchmark(fields) else None
+
+    result = _volatility_from_arrays(
+        ticker,
+        df.index.values,
+        compute.as_float_array(df['open']),
+        compute.as_float_array(df['high']),
+        compute.as_float_array(df['low']),
+        compute.as_float_array(df['close']),
+        compute.as_float_array(df['adj_close']),
+        datetime.now().year,
+        rank_window=rank_window_years * TRADING_DAYS_PER_YEAR if rank_window_years else None,
+        fields=fields,
+        market=market,
+    )
+    # Set when cached bars were served while a background refresh runs
+    result["stale"] = bool(df.attrs.get('stale', False))
+    result["data_as_of"] = np.datetime_as_string(df.index.values[-1], unit='D')
+    return result
+
+
+def _live_benchmark(ticker: str, df: pd.DataFrame, lookback_years: int) -> Optional[beta.Benchmark]:
+    def load(benchmark_ticker: str, years: int) -> pd.DataFrame:
+        # The benchmark's own request already has its bars
+        if benchmark_ticker == ticker.upper():
+            return df
+        return fetch_and_cache(benchmark_ticker, years=years)
+
+    try:
+        return beta.get_benchmark(lookback_years, load)
+    except Exception:
+        # Betas are left out rather than failing the ticker's payload
+        metrics.increment('benchmark_errors')
+        return None
 
 
-def calculate_volatility(ticker: str, lookback_years: int = 5) -> Dict[str, Any]:
-    df = fetch_and_cache(ticker, years=lookback_years)
+def _cached_benchmark(ticker: str, df: pd.DataFrame, start: date, end: date) -> Optional[beta.Benchmark]:
+    if ticker.upper() != beta.BENCHMARK_TICKER:
+        try:
+            df = _load_cached(beta.BENCHMARK_TICKER, start, end)
+        except ValueError:
+            return None
+    return beta.build(beta.BENCHMARK_TICKER, df.index.values, compute.as_float_array(df['adj_close']))
 
-    df['log_return'] = np.log(df['adj_close'] / df['adj_close'].shift(1))
 
-    df['vol_30d'] = df['log_return'].rolling(window=30).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
-    df['vol_90d'] = df['log_return'].rolling(window=90).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+def _lookback_start(as_of: date, lookback_years: int) -> date:
+    # Same window fetch_and_cache uses for live requests
+    return as_of - timedelta(days=lookback_years * 365)
 
-    df = df.dropna(subset=['vol_30d', 'vol_90d'])
 
+def _load_cached(ticker: str, start: date, end: date) -> pd.DataFrame:
+    df = get_cached_data(ticker, start.isoformat(), end.isoformat())
     if df.empty:
-        raise ValueError(f"Not enough data to calculate volatility for {ticker}")
-
-    current_vol_30d = df['vol_30d'].iloc[-1]
-    current_vol_90d = df['vol_90d'].iloc[-1]
-    current_price = df['close'].iloc[-1]
-
-    # Daily range data from most recent day
-    daily_open = df['open'].iloc[-1]
-    daily_high = df['high'].iloc[-1]
-    daily_low = df['low'].iloc[-1]
-
-    # Monthly range (last 21 trading days)
-    monthly_df = df.tail(21)
-    monthly_high = monthly_df['high'].max()
-    monthly_low = monthly_df['low'].min()
-
-    # Yearly range (last 252 trading days)
-    yearly_df = df.tail(252)
-    yearly_high = yearly_df['high'].max()
-    yearly_low = yearly_df['low'].min()
-
-    vol_30d_p50 = df['vol_30d'].quantile(0.50)
-    vol_30d_p90 = df['vol_30d'].quantile(0.90)
-    vol_30d_p99 = df['vol_30d'].quantile(0.99)
-
-    vol_90d_p50 = df['vol_90d'].quantile(0.50)
-    vol_90d_p90 = df['vol_90d'].quantile(0.90)
-    vol_90d_p99 = df['vol_90d'].quantile(0.99)
-
-    vol_30d_percentile = (df['vol_30d'] <= current_vol_30d).mean() * 100
-    vol_90d_percentile = (df['vol_90d'] <= current_vol_90d).mean() * 100
-
-    def get_bucket(value: float, p50: float, p90: float, p99: float) -> str:
-        if value < p50:
-            return "<p50"
-        elif value < p90:
-            return "p50-p90"
-        elif value < p99:
-            return "p90-p99"
-        else:
-            return ">p99"
-
-    vol_30d_bucket = get_bucket(current_vol_30d, vol_30d_p50, vol_30d_p90, vol_30d_p99)
-    vol_90d_bucket = get_bucket(current_vol_90d, vol_90d_p50, vol_90d_p90, vol_90d_p99)
-
-    history_df = df.tail(252).copy()
-    history = []
-    for idx, row in history_df.iterrows():
-        history.append({
-            "date": idx.strftime('%Y-%m-%d'),
-            "vol_30d": round(row['vol_30d'], 4),
-            "vol_90d": round(row['vol_90d'], 4)
-        })
-
-    returns = calculate_returns(df)
-    rsi_14d = calculate_rsi(df)
-
-    return {
-        "ticker": ticker.upper(),
-        "current_price": round(current_price, 2),
-        "daily_open": round(daily_open, 2),
-        "daily_high": round(daily_high, 2),
-        "daily_low": round(daily_low, 2),
-        "monthly_high": round(monthly_high, 2),
-        "monthly_low": round(monthly_low, 2),
-        "yearly_high": round(yearly_high, 2),
-        "yearly_low": round(yearly_low, 2),
-        "vol_30d": round(current_vol_30d, 4),
-        "vol_90d": round(current_vol_90d, 4),
-        "vol_30d_percentile": round(vol_30d_percentile, 1),
-        "vol_90d_percentile": round(vol_90d_percentile, 1),
-        "vol_30d_bucket": vol_30d_bucket,
-        "vol_90d_bucket": vol_90d_bucket,
-        "percentile_thresholds": {
-            "30d": {
-                "p50": round(vol_30d_p50, 4),
-                "p90": round(vol_30d_p90, 4),
-                "p99": round(vol_30d_p99, 4)
-            },
-            "90d": {
-                "p50": round(vol_90d_p50, 4),
-                "p90": round(vol_90d_p90, 4),
-                "p99": round(vol_90d_p99, 4)
-            }
-        },
+        raise ValueError(f"No cached data for {ticker.upper()} between {start} and {end}")
+    return df
+
+
+def calculate_volatility_as_of(ticker: str, as_of: date, lookback_years: int = 5,
+                               rank_window_years: Optional[int] = None,
+                               fields: Optional[FrozenSet[str]] = None) -> Dict[str, Any]:
+    """Volatility payload as it would have been computed at the close of ``as_of``.
+
+    Served entirely from the cache via an indexed (ticker, date) range scan;
+    no upstream fetch is made. ``rank_window_years`` and ``fields`` are as
+    for ``calculate_volatility``.
+    """
+    start = _lookback_start(as_of, lookback_years)
+    df = _load_cached(ticker, start, as_of)
+    market = _cached_benchmark(ticker, df, start, as_of) if _wants_benchmark(fields) else None
+
+    result = _volatility_from_arrays(
+        ticker,
+        df.index.values,
+        compute.as_float_array(df['open']),
+        compute.as_float_array(df['high']),
+        compute.as_float_array(df['low']),
+        compute.as_float_array(df['close']),
+        compute.as_float_array(df['adj_close']),
+        as_of.year,
+        rank_window=rank_window_years * TRADING_DAYS_PER_YEAR if rank_window_years else None,
+        fields=fields,
+        market=market,
+    )
+    result["as_of"] = as_of.isoformat()
+    return result
+
+
+def calculate_volatility_as_of_many(
+    ticker: str,
+    as_of_dates: List[date],
+    lookback_years: int = 5,
+    include_history: bool = False,
+    fields: Optional[FrozenSet[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Evaluate ``calculate_volatility_as_of`` for many dates in one pass.
+
+    The cached series covering every window is read once, and log returns,
+    rolling vols and betas are computed once over it. A single-date payload
+    covers the bars of its window whose 90d vol needs no return from before
+    the window, so after dropping bars without vols each date's bars are
+    one contiguous range of the shared series, found by binary search. The
+    per-date values are then read from all ranges at once: the latest
+    values by indexing at the range ends, highs and lows by one reduceat,
+    percentiles and thresholds by sorting the ranges as rows, and RSI from
+    one shared smoothing pass. Results match the single-date function
+    (RSI to within float rounding before it is rounded). Only ``history``
+    is built per date. Dates without enough data get an ``error`` entry
+    instead of failing the whole batch.
+    """
+    if not as_of_dates:
+        return []
+
+    first, last = _lookback_start(min(as_of_dates), lookback_years), max(as_of_dates)
+    df = _load_cached(ticker, first, last)
+    dates = df.index.values.astype('datetime64[D]')
+    columns = {name: compute.as_float_array(df[name])
+               for name in ('open', 'high', 'low', 'close', 'adj_close')}
+
+    log_return = compute.log_returns(columns['adj_close'])
+    vol_30d = compute.annualized_vol(log_return, 30)
+    vol_90d = compute.annualized_vol(log_return, 90)
+    market = _cached_benchmark(ticker, df, first, last) if _wants_benchmark(fields) else None
+    betas = _beta_series(market, dates, log_return, vol_30d, vol_90d) if market is not None else None
+
+    starts = np.searchsorted(
+        dates, np.array([_lookback_start(d, lookback_years) for d in as_of_dates], dtype='datetime64[D]'),
+        side='left',
+    )
+    ends = np.searchsorted(dates, np.array(as_of_dates, dtype='datetime64[D]'), side='right')
+
+    # Within a window the first return has no predecessor, so the 90d vol
+    # (and with it the payload) starts 90 rows after the window start.
+    kept = np.flatnonzero(~(np.isnan(vol_30d) | np.isnan(vol_90d)))
+    lo = np.searchsorted(kept, starts + 90)
+    hi = np.searchsorted(kept, ends)
+    dates, vol_30d, vol_90d = dates[kept], vol_30d[kept], vol_90d[kept]
+    columns = {name: values[kept] for name, values in columns.items()}
+    if betas is not None:
+        betas = {name: series[kept] for name, series in betas.items()}
+
+    ok = hi > lo
+    lo, hi = lo[ok], hi[ok]
+    values = _as_of_values(dates, columns, vol_30d, vol_90d, betas, market, lo, hi,
+                           [d for d, has in zip(as_of_dates, ok.tolist()) if has], fields)
+
+    results = []
+    rows = iter(range(len(lo)))
+    for as_of, has_data in zip(as_of_dates, ok.tolist()):
+        if not has_data:
+            results.append({"ticker": ticker.upper(),
+                            "error": f"Not enough data to calculate volatility for {ticker}",
+                            "as_of": as_of.isoformat()})
+            continue
+        row = next(rows)
+        result = {"ticker": ticker.upper()}
+        for key, column in values.items():
+            result[key] = column[row]
+        if include_history and (fields is None or "history" in fields):
+            window = slice(lo[row], hi[row])
+            result["history"] = _history(
+                dates[window], vol_30d[window], vol_90d[window],
+                {name: series[window] for name, series in betas.items()} if betas is not None
+                else {name: np.full(hi[row] - lo[row], np.nan) for name in BETA_SERIES},
+            )
+        result["as_of"] = as_of.isoformat()
+        results.append(result)
+    return results
+
+
+def _as_of_values(
+    dates: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    vol_30d: np.ndarray,
+    vol_90d: np.ndarray,
+    betas: Optional[Dict[str, np.ndarray]],
+    market: Optional[beta.Benchmark],
+    lo: np.ndarray,
+    hi: np.ndarray,
+    as_of_dates: List[date],
+    fields: Optional[FrozenSet[str]],
+) -> Dict[str, list]:
+    """Selected payload values, in payload order, for each range ``[lo, hi)`` of the filtered series."""
+    wanted = [key for group, keys in FIELD_GROUPS.items() if group != "history"
+              for key in keys if fields is None or key in fields]
+    end = hi - 1
+    counts = hi - lo
+    vols = {"30d": vol_30d, "90d": vol_90d}
+    stats = {}
+
+    def percentiles(window: str):
+        # Thresholds and the latest percentile come from the same sort
+        if window not in stats:
+            stats[window] = compute.range_percentiles(vols[window], lo, hi)
+        return stats[window]
+
+    def latest(values: np.ndarray, digits: int) -> list:
+        return [round(v, digits) for v in values[end]]
+
+    def extreme(ufunc: np.ufunc, name: str, days: int) -> list:
+        return [round(v, 2) for v in compute.range_reduce(ufunc, columns[name], np.maximum(lo, hi - days), hi)]
+
+    def returns() -> list:
+        adj_close = columns['adj_close']
+        current = adj_close[end]
+        by_period = {}
+        for period, offset in (("daily", 1), ("week", 5), ("month", 21)):
+            base = adj_close[np.maximum(end - offset, 0)]
+            by_period[period] = [v if has else None
+                                 for v, has in zip((current - base) / base, counts >= offset + 1)]
+        year_starts = np.array([f"{d.year}-01-01" for d in as_of_dates], dtype='datetime64[D]')
+        first = np.maximum(lo, np.searchsorted(dates, year_starts))
+        base = adj_close[np.minimum(first, end)]
+        by_period["ytd"] = [v if has else None for v, has in zip((current - base) / base, first < hi)]
+        enough = (counts >= 2).tolist()
+        return [_round_returns({period: by_period[period][i] if enough[i] else None for period in by_period})
+                for i in range(len(lo))]
+
+    def thresholds() -> list:
+        cutoffs = {window: percentiles(window)[0] for window in vols}
+        return [
+            {window: {name: round(value, 4) for name, value in zip(("p50", "p90", "p99"), cutoffs[window][i])}
+             for window in vols}
+            for i in range(len(lo))
+        ]
+
+    def buckets(window: str) -> list:
+        return [compute.bucket(v, *cutoffs)
+                for v, cutoffs in zip(vols[window][end], percentiles(window)[0])]
+
+    builders = {
+        "current_price": lambda: latest(columns['close'], 2),
+        "daily_open": lambda: latest(columns['open'], 2),
+        "daily_high": lambda: latest(columns['high'], 2),
+        "daily_low": lambda: latest(columns['low'], 2),
+        "monthly_high": lambda: extreme(np.fmax, 'high', 21),
+        "monthly_low": lambda: extreme(np.fmin, 'low', 21),
+        "yearly_high": lambda: extreme(np.fmax, 'high', 252),
+        "yearly_low": lambda: extreme(np.fmin, 'low', 252),
+        "vol_30d": lambda: latest(vol_30d, 4),
+        "vol_90d": lambda: latest(vol_90d, 4),
+        "vol_30d_percentile": lambda: [round(v, 1) for v in percentiles("30d")[1]],
+        "vol_90d_percentile": lambda: [round(v, 1) for v in percentiles("90d")[1]],
+        "vol_30d_bucket": lambda: buckets("30d"),
+        "vol_90d_bucket": lambda: buckets("90d"),
+        "percentile_thresholds": thresholds,
         "returns": returns,
-        "rsi_14d": rsi_14d,
-        "history": history
+        "rsi_14d": lambda: [None if v != v else round(v, 2)
+                            for v in compute.wilder_rsi_ranges(columns['adj_close'], lo, hi).tolist()],
+        "benchmark": lambda: [market.ticker if market is not None else None] * len(lo),
+        **{name: (lambda name=name: _rounded(betas[name][end]) if betas is not None else [None] * len(lo))
+           for name in BETA_SERIES},
     }
+    return {key: builders[key]() for key in wanted}
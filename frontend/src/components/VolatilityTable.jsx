@@ -29,6 +29,11 @@ export default function VolatilityTable({ data }) {
               <span className="text-2xl font-semibold text-white tracking-tight">{data.ticker}</span>
               <span className="text-[28px] font-light text-white tabular-nums">{formatPrice(data.current_price)}</span>
             </div>
+            {data.stale && (
+              <div className="text-[10px] text-[#fbbf24] tracking-wider mt-1">
+                DELAYED · DATA AS OF {data.data_as_of}
+              </div>
+            )}
           </div>
 
           {/* Range Data */}
@@ -273,4 +273,15 @@ describe('VolatilityTable', () => {
     expect(screen.queryByText('OVERBOUGHT')).not.toBeInTheDocument()
     expect(screen.queryByText('OVERSOLD')).not.toBeInTheDocument()
   })
+
+  it('shows delayed notice for stale data', () => {
+    const data = { ...mockVolatilityData, stale: true, data_as_of: '2024-01-12' }
+    render(<VolatilityTable data={data} />)
+    expect(screen.getByText(/DATA AS OF 2024-01-12/)).toBeInTheDocument()
+  })
+
+  it('hides delayed notice for fresh data', () => {
+    render(<VolatilityTable data={mockVolatilityData} />)
+    expect(screen.queryByText(/DATA AS OF/)).not.toBeInTheDocument()
+  })
 })